@@ -4,10 +4,16 @@ import os
 import shelve
 import pandas as pd
 import base64
+import uuid
 from io import BytesIO
 
-from core.db import get_connection
 from core.gpt_sql import get_sql_from_gpt
+from core.sql_guard import split_statements
+from core.sql_executor import execute_batch, BatchError
+from core.result_pager import ResultPager, RESULT_MAX_ROWS
+from core.sql_cache import get_cache_stats
+from core.query_cache import get_query_cache_stats
+from core.stats import get_totals, get_counts_by
 from core.email_campaign import send_email_campaign, preview_personalization
 
 load_dotenv()
@@ -47,6 +53,44 @@ def prepare_download_links(df: pd.DataFrame):
 
     return href_csv, href_excel
 
+MAX_LIVE_RESULTS = 10  # résultats paginés gardés en session (lignes chargées en mémoire)
+
+def register_result_pager(pager):
+    """Garde le pager en session ; les plus anciens sont oubliés au-delà de MAX_LIVE_RESULTS"""
+    pagers = st.session_state.setdefault("result_pagers", {})
+    key = f"result_{uuid.uuid4().hex[:8]}"
+    pagers[key] = pager
+    while len(pagers) > MAX_LIVE_RESULTS:
+        oldest = next(iter(pagers))
+        pagers.pop(oldest)
+    return key
+
+def render_result_pager(key, label):
+    """Affiche les lignes déjà chargées d'un résultat et le bouton pour la page suivante"""
+    pager = st.session_state.get("result_pagers", {}).get(key)
+    if pager is None:
+        st.caption(f"📊 {label} : résultat expiré, repose la question pour l'afficher")
+        return
+
+    st.markdown(f"📊 **{label}:**")
+    df = pager.to_dataframe()
+    st.dataframe(df, use_container_width=True)
+
+    status = f"{len(pager.rows)} ligne(s) chargée(s)"
+    if pager.truncated:
+        status += " — plafond de lignes ou de mémoire atteint, affine ta requête pour voir la suite"
+    elif pager.has_more:
+        status += " — d'autres lignes sont disponibles"
+    st.caption(status)
+    if pager.has_more and st.button("⬇️ Charger plus", key=f"more_{key}"):
+        pager.fetch_next_page()
+        st.rerun()
+
+    if not df.empty:
+        href_csv, href_excel = prepare_download_links(df)
+        with st.expander(f"📥 Télécharger {label.lower()} (lignes chargées)"):
+            st.markdown(href_csv, unsafe_allow_html=True)
+            st.markdown(href_excel, unsafe_allow_html=True)
 
 
 if "messages" not in st.session_state:
@@ -68,6 +112,13 @@ with st.sidebar:
     # Informations de la page actuelle
     if page == "💬 Chat SQL":
         st.info("💡 Pose tes questions en langage naturel")
+        with st.expander("⚡ Caches"):
+            sql_stats, result_stats = get_cache_stats(), get_query_cache_stats()
+            st.caption(f"SQL générée : {sql_stats['hits']} hits / {sql_stats['misses']} misses "
+                       f"({sql_stats['hit_rate']:.0%}), {sql_stats['errors']} erreur(s)")
+            st.caption(f"Résultats : {result_stats['hits'] + result_stats['disk_hits']} hits / "
+                       f"{result_stats['misses']} misses ({result_stats['hit_rate']:.0%}), "
+                       f"{result_stats['entries']} entrées, {result_stats['bytes'] / 1e6:.1f} Mo")
     elif page == "🤖 AI Visualization":
         st.info("📊 Génération automatique de graphiques avec IA (SQL + Documents)")
     elif page == "📧 Email Campaign":
@@ -132,63 +183,63 @@ if page == "💬 Chat SQL":
         avatar = USER_AVATAR if message["role"] == "user" else BOT_AVATAR
         with st.chat_message(message["role"], avatar=avatar):
             st.markdown(message["content"])
+            for key, label in message.get("results", []):
+                render_result_pager(key, label)
 
     # === Interaction utilisateur ===
     if prompt := st.chat_input("Pose une question sur la base..."):
         st.chat_message("user", avatar=USER_AVATAR).markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
 
-        conn = get_connection()
-        cursor = conn.cursor()
-
         try:
             sql = get_sql_from_gpt(prompt, st.session_state.messages)
             
-            # Séparer les requêtes multiples
-            sql_statements = []
-            if ';' in sql:
-                # Plusieurs requêtes
-                statements = [s.strip() for s in sql.split(';') if s.strip()]
-                sql_statements = statements[:3]  # Maximum 3 requêtes
-            else:
-                # Une seule requête
-                sql_statements = [sql.strip()]
+            # Séparer les requêtes multiples (sans couper les ';' contenus dans les valeurs)
+            sql_statements = split_statements(sql)[:3]  # Maximum 3 requêtes
             
-            # Exécuter chaque requête séquentiellement
+            # Écritures du lot dans une seule transaction, lectures après le commit
             results = []
+            result_keys = []
             modification_made = False
             
             with st.chat_message("assistant", avatar=BOT_AVATAR):
-                for i, statement in enumerate(sql_statements):
-                    if not statement:
-                        continue
-                        
-                    if len(sql_statements) > 1:
-                        st.markdown(f"**🔄 Étape {i+1}/{len(sql_statements)}**")
-                    
-                    try:
-                        if statement.lower().startswith(("insert", "update", "delete")):
-                            cursor.execute(statement)
-                            conn.commit()
-                            modification_made = True
-                            st.success(f"✅ Requête {i+1} exécutée avec succès")
-                            results.append(f"Requête {i+1}: Modification effectuée")
-                        else:
-                            df = pd.read_sql_query(statement, conn)
-                            st.markdown(f"📊 **Résultat requête {i+1}:**")
-                            st.dataframe(df, use_container_width=True)
-                            
-                            if not df.empty:
-                                href_csv, href_excel = prepare_download_links(df)
-                                with st.expander(f"📥 Télécharger résultat requête {i+1}"):
-                                    st.markdown(href_csv, unsafe_allow_html=True)
-                                    st.markdown(href_excel, unsafe_allow_html=True)
-                            
-                            results.append(f"Requête {i+1}: {len(df)} résultats")
-                    
-                    except Exception as e:
-                        st.error(f"❌ Erreur requête {i+1}: {e}")
-                        results.append(f"Requête {i+1}: Erreur - {e}")
+                try:
+                    # Les lectures sont paginées : plafond du pager plutôt que le LIMIT par défaut du garde-fou
+                    outcomes = execute_batch(sql_statements, max_rows=RESULT_MAX_ROWS)
+                except BatchError as e:
+                    outcomes = e.outcomes
+                    st.error(f"❌ {e} (aucune modification enregistrée)")
+                sql_statements = [outcome["statement"] for outcome in outcomes]
+
+                for outcome in outcomes:
+                    i = outcome["index"]
+                    if len(outcomes) > 1:
+                        st.markdown(f"**🔄 Étape {i+1}/{len(outcomes)}**")
+
+                    if outcome["status"] == "error":
+                        st.error(f"❌ Erreur requête {i+1}: {outcome['error']}")
+                        results.append(f"Requête {i+1}: Erreur - {outcome['error']}")
+                    elif outcome["status"] == "cancelled":
+                        st.warning(f"↩️ Requête {i+1} annulée")
+                        results.append(f"Requête {i+1}: Annulée")
+                    elif outcome["kind"] == "write":
+                        modification_made = True
+                        st.success(f"✅ Requête {i+1} exécutée avec succès ({outcome['rowcount']} ligne(s))")
+                        results.append(f"Requête {i+1}: Modification effectuée")
+                    else:
+                        try:
+                            # Lecture par pages : premières lignes affichées tout de suite
+                            pager = ResultPager(outcome["statement"])
+                            key = register_result_pager(pager)
+                            label = f"Résultat requête {i+1}"
+                            result_keys.append((key, label))
+                            render_result_pager(key, label)
+
+                            more = "+" if pager.has_more else ""
+                            results.append(f"Requête {i+1}: {len(pager.rows)}{more} résultats")
+                        except Exception as e:
+                            st.error(f"❌ Erreur requête {i+1}: {e}")
+                            results.append(f"Requête {i+1}: Erreur - {e}")
                 
                 # Résumé final et SQL optionnel
                 if len(sql_statements) > 1:
@@ -204,12 +255,14 @@ if page == "💬 Chat SQL":
                         st.code(statement, language="sql")
                 
                 # Message pour l'historique
-                if modification_made:
+                if any(outcome["status"] != "ok" and outcome["kind"] == "write" for outcome in outcomes):
+                    response = "❌ Lot de requêtes annulé, aucune modification enregistrée"
+                elif modification_made:
                     response = f"✅ {len(sql_statements)} requête(s) exécutée(s) avec succès"
                 else:
                     response = f"📊 {len(sql_statements)} requête(s) de consultation exécutée(s)"
                 
-                st.session_state.messages.append({"role": "assistant", "content": response})
+                st.session_state.messages.append({"role": "assistant", "content": response, "results": result_keys})
 
         except Exception as e:
             response = f"❌ Erreur : {e}"
@@ -220,7 +273,11 @@ if page == "💬 Chat SQL":
 
 elif page == "🤖 AI Visualization":
     # Import de la logique AI Viz
-    from core.ai_viz_logic import run_ai_viz_pipeline, init_chroma_client, init_sql_connection, process_uploaded_file, add_document_to_chroma
+    from core.ai_viz_logic import run_ai_viz_pipeline, init_chroma_client
+    from core.chroma_client import get_collection_count
+    from core.extraction import ExtractionError
+    from core.ingestion_jobs import submit_upload
+    from core.ui_components import render_ingestion_section, render_doc_filters
     import pandas as pd
     import base64
     
@@ -235,25 +292,20 @@ elif page == "🤖 AI Visualization":
         
         # Statut des connexions
         chroma_client, collection = init_chroma_client()
-        sql_conn = init_sql_connection()
         
         if collection:
-            doc_count = collection.count()
+            doc_count = get_collection_count(collection)
             st.success(f"✅ ChromaDB ({doc_count} documents)")
         else:
             st.error("❌ ChromaDB non disponible")
             
-        if sql_conn:
-            try:
-                test_contacts = pd.read_sql_query("SELECT COUNT(*) as count FROM contacts", sql_conn)
-                test_companies = pd.read_sql_query("SELECT COUNT(*) as count FROM companies", sql_conn)
-                contacts_count = test_contacts['count'].iloc[0]
-                companies_count = test_companies['count'].iloc[0]
-                st.success(f"✅ Base SQL ({contacts_count} contacts, {companies_count} entreprises)")
-            except:
-                st.warning("⚠️ Base SQL (erreur)")
-        else:
-            st.error("❌ Base SQL non disponible")
+        try:
+            contacts_count, companies_count = get_totals()
+            st.success(f"✅ Base SQL ({contacts_count} contacts, {companies_count} entreprises)")
+            with st.expander("📊 Contacts par secteur"):
+                st.dataframe(get_counts_by("Secteur d'activité", limit=10), use_container_width=True)
+        except:
+            st.warning("⚠️ Base SQL (erreur)")
         
         # Upload de documents
         st.markdown("---")
@@ -270,21 +322,19 @@ elif page == "🤖 AI Visualization":
                 file_key = f"ai_viz_processed_{uploaded_file.name}_{uploaded_file.size}"
                 
                 if file_key not in st.session_state:
-                    with st.spinner(f"Traitement de {uploaded_file.name}..."):
-                        content = process_uploaded_file(uploaded_file)
-                        
-                        if content.startswith("❌"):
-                            st.error(content)
-                        else:
-                            chunks_added = add_document_to_chroma(collection, uploaded_file.name, content)
-                            if chunks_added > 0:
-                                st.success(f"✅ {uploaded_file.name} ajouté ({chunks_added} chunks)")
-                                st.session_state[file_key] = True
-                                st.rerun()
-                            else:
-                                st.error("❌ Échec de l'ajout")
-                else:
-                    st.info(f"📄 {uploaded_file.name} déjà traité")
+                    try:
+                        # Indexation en arrière-plan : le chat reste utilisable pendant ce temps
+                        submit_upload(uploaded_file)
+                        st.session_state[file_key] = True
+                        st.info(f"📥 {uploaded_file.name} ajouté à la file d'indexation")
+                    except ExtractionError as e:
+                        st.error(str(e))
+        
+        # Suivi des indexations en cours (rafraîchi toutes les 2 s tant qu'un job est actif)
+        render_ingestion_section()
+        
+        # Filtres de la recherche documentaire
+        doc_filters = render_doc_filters()
     
     # === Affichage du chat AI Visualization ===
     for message in st.session_state.ai_viz_messages:
@@ -323,7 +373,7 @@ elif page == "🤖 AI Visualization":
         with st.chat_message("assistant", avatar=BOT_AVATAR):
             with st.spinner("🤖 Analyse et génération en cours..."):
                 try:
-                    result = run_ai_viz_pipeline(prompt, st.session_state.ai_viz_messages)
+                    result = run_ai_viz_pipeline(prompt, st.session_state.ai_viz_messages, doc_filters or None)
                     
                     if result['image_bytes']:
                         # Cas avec visualisation
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark : agrégats servis par SQLite (chemin actuel) vs miroir colonne Parquet + DuckDB
+Usage : python bench_analytics.py [nombre_de_contacts]   (2 500 000 par défaut)
+Le miroir est mesuré par le chemin de l'application (garde-fou SQL + routage, core.analytics.read_guarded).
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 2_500_000
+WORKDIR = tempfile.mkdtemp(prefix="bench_analytics_")
+
+# Les modules core lisent leur configuration à l'import : base synthétique et miroir dans un dossier temporaire
+os.environ["DB_PATH"] = os.path.join(WORKDIR, "bench.db")
+os.environ["ANALYTICS_DIR"] = os.path.join(WORKDIR, "analytics")
+os.environ["ANALYTICS_MIN_ROWS"] = "0"
+os.environ["DB_AUTO_MIGRATE"] = "0"
+
+import pandas as pd
+
+COLUMNS = ["Nom", "Prénom", "Email", "Société", "Domaine", "Secteur d'activité",
+           "Poste", "Linkedin", "Téléphone", "Commentaire"]
+SECTORS = ["Finance", "Musique", "Mode", "Luxe", "Tech", "Santé", "Sport", "Cinéma", None]
+POSTES = ["CEO", "CTO", "Directeur", "Chargé de mission", "Consultant", "Chanteuse", None]
+
+QUERIES = {
+    "Contacts par secteur": """SELECT COALESCE("Secteur d'activité", 'Non spécifié') AS "Secteur d'activité", COUNT(*) AS Nombre_de_contacts FROM contacts GROUP BY 1 ORDER BY Nombre_de_contacts DESC""",
+    "Contacts par poste": """SELECT "Poste", COUNT(*) FROM contacts GROUP BY "Poste\"""",
+    "Top 20 sociétés": """SELECT "Société", COUNT(*) AS Nombre_de_contacts FROM contacts GROUP BY "Société" ORDER BY Nombre_de_contacts DESC, "Société" LIMIT 20""",
+    "Postes en finance": """SELECT "Poste", COUNT(*) AS Nombre_de_contacts FROM contacts WHERE "Secteur d'activité" = 'Finance' GROUP BY "Poste" ORDER BY Nombre_de_contacts DESC, "Poste\"""",
+    "Sociétés distinctes par secteur": """SELECT "Secteur d'activité", COUNT(DISTINCT "Société") AS Nombre_de_societes FROM contacts GROUP BY 1 ORDER BY 2 DESC, 1""",
+}
+
+def generate_database():
+    """Remplit une base SQLite de contacts synthétiques (même schéma que bdd_clients.db)"""
+    random.seed(42)
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    conn.execute(f"CREATE TABLE contacts ({', '.join(chr(34) + c + chr(34) + ' TEXT' for c in COLUMNS)})")
+    conn.execute('CREATE TABLE companies ("Société" TEXT)')
+    companies = [f"Société {i}" for i in range(5000)]
+    conn.executemany("INSERT INTO companies VALUES (?)", [(c,) for c in companies])
+    batch = []
+    for i in range(ROWS):
+        company = random.choice(companies)
+        batch.append((f"Nom{i}", f"Prénom{i}", f"contact{i}@exemple.fr", company, f"domaine{i % 300}.fr",
+                      random.choice(SECTORS), random.choice(POSTES), None, None, None))
+        if len(batch) == 100_000:
+            conn.executemany(f"INSERT INTO contacts VALUES ({', '.join('?' * len(COLUMNS))})", batch)
+            batch = []
+    if batch:
+        conn.executemany(f"INSERT INTO contacts VALUES ({', '.join('?' * len(COLUMNS))})", batch)
+    conn.commit()
+    conn.close()
+
+def timed(function, repeat=3):
+    """Meilleur temps sur `repeat` exécutions (secondes) et dernier résultat"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def same_result(a, b, ordered=True):
+    """Résultats identiques (l'ordre des lignes n'est comparé que si la requête a un ORDER BY)"""
+    a = a.astype(str)
+    b = b.astype(str)
+    b.columns = a.columns
+    if not ordered:
+        a = a.sort_values(list(a.columns))
+        b = b.sort_values(list(b.columns))
+    return a.reset_index(drop=True).equals(b.reset_index(drop=True))
+
+def main():
+    print(f"🔧 Génération de {ROWS:,} contacts synthétiques dans {WORKDIR}...")
+    start = time.perf_counter()
+    generate_database()
+    print(f"✅ Base générée en {time.perf_counter() - start:.1f}s")
+
+    from core.db import read_connection
+    from core.query_cache import clear_query_cache
+    from core.sql_guard import SQLGuardError, guard_statement
+    from core import analytics
+
+    def sqlite_query(sql):
+        with read_connection() as conn:
+            return pd.read_sql_query(sql, conn)
+
+    # Chemin historique de la visualisation : toutes les lignes chargées puis agrégées par pandas
+    def pandas_reaggregation():
+        with read_connection() as conn:
+            df = pd.read_sql_query("SELECT * FROM contacts", conn)
+        counts = df["Secteur d'activité"].fillna("Non spécifié").value_counts()
+        return counts.rename_axis("Secteur d'activité").reset_index(name="Nombre_de_contacts")
+
+    print("\n📊 Chemin actuel (SQLite, stockage par lignes)")
+    sqlite_results = {}
+    for name, sql in QUERIES.items():
+        elapsed, sqlite_results[name] = timed(lambda: sqlite_query(sql))
+        print(f"  - {name:<35} {elapsed * 1000:>9.1f} ms")
+    elapsed, _ = timed(pandas_reaggregation, repeat=1)
+    print(f"  - {'Secteurs via pandas (SELECT *)':<35} {elapsed * 1000:>9.1f} ms")
+
+    if not analytics.ANALYTICS_AVAILABLE:
+        print("\n⚠️ duckdb n'est pas installé (pip install duckdb) : miroir colonne non mesuré")
+        return
+
+    print("\n🛡️ Garde-fou SQL sur SQLite (repli quand le miroir n'est pas à jour)")
+    with read_connection() as conn:
+        for name, sql in QUERIES.items():
+            try:
+                guard_statement(conn, sql)
+                print(f"  - {name:<35} acceptée")
+            except SQLGuardError as e:
+                print(f"  - {name:<35} refusée : {e}")
+
+    print("\n📦 Miroir colonne (Parquet + DuckDB), via garde-fou + routage")
+    start = time.perf_counter()
+    analytics.refresh_mirror(force=True)
+    print(f"  - {'Export initial du miroir':<35} {(time.perf_counter() - start) * 1000:>9.1f} ms")
+
+    def routed_query(sql):
+        clear_query_cache()  # le cache de résultats fausserait la mesure
+        with read_connection() as conn:
+            return analytics.read_guarded(sql, conn)[1]
+
+    failures = 0
+    for name, sql in QUERIES.items():
+        with read_connection() as conn:
+            routed = analytics.should_use_analytics(sql, conn)
+        try:
+            elapsed, df = timed(lambda: routed_query(sql))
+        except SQLGuardError as e:
+            failures += 1
+            print(f"  - {name:<35} ❌ refusée par le garde-fou : {e}")
+            continue
+        ok = same_result(sqlite_results[name], df, ordered="order by" in sql.lower())
+        failures += not ok
+        status = "✅" if ok else "❌ résultats différents"
+        note = "" if routed else " (non routée : servie par SQLite)"
+        print(f"  - {name:<35} {elapsed * 1000:>9.1f} ms {status}{note}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
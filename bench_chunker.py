@@ -0,0 +1,121 @@
+"""
+Micro-benchmark et vérification du découpage en chunks (core.chunking)
+
+Compare l'ancien découpage par caractères (rfind sur chaque fenêtre) au découpage par tokens,
+sur du texte courant et sur des entrées pathologiques, et vérifie les invariants du découpage :
+couverture de tous les tokens, taille maximale, avancée à chaque chunk, flux identique au texte complet.
+
+    python bench_chunker.py [--size 2000000] [--max-tokens 192] [--overlap 32]
+"""
+import argparse
+import random
+import time
+
+from core.chunking import chunk_token_ranges, chunk_text, iter_chunks
+
+# ==== ANCIEN DÉCOUPAGE (référence) ====
+def legacy_chunk_text(text, chunk_size=1000, overlap=200, max_chunks=None):
+    """Ancien chunk_text ; None si le nombre de chunks dépasse max_chunks (le recul de `start` peut boucler)"""
+    chunks = []
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text]
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            cut_point = max(text.rfind('.', start, end), text.rfind('\n', start, end))
+            if cut_point > start:
+                end = cut_point + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if max_chunks is not None and len(chunks) > max_chunks:
+            return None
+        start = end - overlap
+    return chunks
+
+# ==== JEUX DE TEST ====
+WORDS = ["le", "client", "société", "contrat", "données", "analyse", "secteur", "marché", "équipe", "projet",
+         "rapport", "chiffre", "d'affaires", "développement", "stratégie", "Paris", "2024", "à", "de", "pour"]
+
+def prose(size, seed=0):
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        if rng.random() < 0.02:
+            part = f"\n\n## {rng.choice(WORDS).capitalize()} {rng.randint(1, 99)}\n\n"
+        else:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+            part = sentence.capitalize() + rng.choice([". ", ". ", "! ", "? ", ".\n", ".\n\n"])
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+def datasets(size):
+    return {
+        "prose": prose(size),
+        "sans ponctuation": " ".join(["mot"] * (size // 4)),
+        "un seul mot": "x" * size,
+        "uniquement des retours": "\n" * size,
+        "points serrés": ". " * (size // 2),
+        "ponctuation collée": ".a" * (size // 2),
+        "titres en rafale": "# Titre\n" * (size // 8),
+        "point en début de fenêtre": ("a" * 50 + ".") * (size // 51),
+        "vide": "",
+    }
+
+# ==== INVARIANTS ====
+def check_invariants(text, max_tokens, overlap):
+    starts, ranges = chunk_token_ranges(text, max_tokens, overlap)
+    n = len(starts)
+    if n == 0:
+        assert ranges == [] and chunk_text(text, max_tokens, overlap) == [], "texte sans token : aucun chunk"
+        return 0
+    assert ranges[0][0] == 0 and ranges[-1][1] == n, "tous les tokens sont couverts"
+    min_step = max(1, max(1, max_tokens // 2) - min(overlap, max(1, max_tokens // 2) - 1))
+    for (first, last), (next_first, _) in zip(ranges, ranges[1:]):
+        assert next_first <= last, "pas de trou entre deux chunks"
+        assert next_first - first >= min_step, "chaque chunk avance d'au moins min_tokens - overlap"
+    for first, last in ranges:
+        assert 0 < last - first <= max_tokens, "taille d'un chunk entre 1 et max_tokens"
+    assert len(ranges) <= n // min_step + 1, "nombre de chunks linéaire"
+    # Le flux doit donner exactement les mêmes chunks, quel que soit le découpage des morceaux
+    expected = chunk_text(text, max_tokens, overlap)
+    for piece in (1, 997, 65536):
+        segments = (text[i:i + piece] for i in range(0, len(text), piece))
+        assert list(iter_chunks(segments, max_tokens, overlap, window_tokens=4 * max_tokens)) == expected, \
+            f"flux différent du texte complet (morceaux de {piece})"
+    return len(ranges)
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du découpage en chunks")
+    parser.add_argument("--size", type=int, default=2_000_000, help="taille des textes en caractères")
+    parser.add_argument("--max-tokens", type=int, default=192)
+    parser.add_argument("--overlap", type=int, default=32)
+    args = parser.parse_args()
+
+    print("⏳ Vérification des invariants...")
+    for name, text in datasets(20_000).items():
+        for max_tokens, overlap in ((1, 0), (2, 5), (8, 3), (args.max_tokens, args.overlap), (50, 100)):
+            check_invariants(text, max_tokens, overlap)
+        print(f"  ✅ {name}")
+
+    print(f"\n⏳ Benchmark sur {args.size:,} caractères".replace(",", " "))
+    print(f"{'jeu de données':<28}{'ancien (s)':>12}{'chunks':>10}{'nouveau (s)':>14}{'chunks':>10}{'Mo/s':>8}")
+    for name, text in datasets(args.size).items():
+        limit = 4 * len(text) // 100 + 10  # au-delà, l'ancien découpage recule au lieu d'avancer
+        old, old_seconds = timed(lambda: legacy_chunk_text(text, max_chunks=limit))
+        new, new_seconds = timed(lambda: chunk_text(text, args.max_tokens, args.overlap))
+        old_label = f"{old_seconds:.3f}" if old is not None else "bloqué"
+        old_count = len(old) if old is not None else f">{limit}"
+        speed = len(text) / new_seconds / 1e6 if new_seconds else 0.0
+        print(f"{name:<28}{old_label:>12}{old_count!s:>10}{new_seconds:>14.3f}{len(new):>10}{speed:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,7 @@
-from core.db import get_connection
+from core.query_cache import cached_read_sql
 from core.gpt_sql import get_sql_from_gpt
-import pandas as pd
-
-conn = get_connection()
-cursor = conn.cursor()
+from core.sql_guard import split_statements
+from core.sql_executor import execute_batch
 
 print("💬 Chatbot SQL - tape 'exit' pour quitter")
 
@@ -16,12 +14,11 @@ while True:
     print(f"🧾 SQL générée : {sql}")
 
     try:
-        if sql.lower().startswith(("insert", "update", "delete")):
-            cursor.execute(sql)
-            conn.commit()
-            print("✅ Opération effectuée.")
-        else:
-            df = pd.read_sql_query(sql, conn)
-            print(df.head(10).to_markdown())
+        for outcome in execute_batch(split_statements(sql)):
+            if outcome["kind"] == "write":
+                print(f"✅ Opération effectuée ({outcome['rowcount']} ligne(s)).")
+            else:
+                df = cached_read_sql(outcome["statement"])
+                print(df.head(10).to_markdown())
     except Exception as e:
         print("❌ Erreur :", e)
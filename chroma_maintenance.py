@@ -0,0 +1,308 @@
+"""
+Inspection et maintenance de la collection ChromaDB, en mémoire bornée
+
+La collection est parcourue par pages (limit/offset) ; les ensembles d'ids qui pourraient
+dépasser la mémoire (ids du manifeste, empreintes des textes) sont rangés dans une base
+SQLite temporaire sur disque.
+
+    python chroma_maintenance.py stats [--samples 5]
+    python chroma_maintenance.py orphans [--delete]
+    python chroma_maintenance.py duplicates [--delete]
+    python chroma_maintenance.py delete FICHIER
+    python chroma_maintenance.py rebuild [--lexical-only]
+
+Options communes : --page-size N (chunks lus par page, 1000 par défaut).
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+from core.chroma_client import get_chroma, reconnect, CHROMA_COLLECTION
+from core.doc_manifest import content_hash, chunk_id, iter_chunk_ids, list_document_summaries, remove_document
+from core import lexical_index
+
+DELETE_BATCH_SIZE = 500
+
+# ==== OUTILS ====
+def iter_pages(collection, include, page_size, where=None):
+    """Pages de la collection : dicts {ids, documents?, metadatas?, embeddings?} de page_size chunks au plus"""
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset, where=where)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+@contextmanager
+def temp_store():
+    """Base SQLite temporaire sur disque (table keys : ensemble de clés, table pairs : clé → valeur, par rang)"""
+    with tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(os.path.join(directory, "store.db"))
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE keys (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("CREATE TABLE pairs (key TEXT NOT NULL, value TEXT NOT NULL, rank INTEGER NOT NULL DEFAULT 1)")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+def delete_chunks(collection, ids):
+    """Supprime des chunks de la collection et de l'index BM25, par lots ; retourne le nombre supprimé"""
+    batch, deleted = [], 0
+    for chunk in ids:
+        batch.append(chunk)
+        if len(batch) >= DELETE_BATCH_SIZE:
+            collection.delete(ids=batch)
+            lexical_index.remove_chunks(batch)
+            deleted += len(batch)
+            batch = []
+    if batch:
+        collection.delete(ids=batch)
+        lexical_index.remove_chunks(batch)
+        deleted += len(batch)
+    return deleted
+
+def _load_manifest_ids(store, exclude=None):
+    """Range dans la table keys les ids référencés par le manifeste (sauf `exclude`) ; retourne leur nombre"""
+    with store:
+        for _, chunk_ids in iter_chunk_ids(exclude):
+            store.executemany("INSERT OR IGNORE INTO keys VALUES (?)", ((i,) for i in chunk_ids))
+    return store.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+def _stream_ids(conn, sql, params=()):
+    """Ids lus depuis la base temporaire par blocs (jamais tous en mémoire)"""
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(DELETE_BATCH_SIZE)
+        if not rows:
+            return
+        for row in rows:
+            yield row[0]
+
+# ==== COMMANDES ====
+def command_stats(collection, args):
+    """Chunks par fichier (un passage sur les métadonnées), comparés au manifeste"""
+    print("🔍 Analyse de ChromaDB")
+    print("=" * 50)
+    per_file, total = {}, 0
+    for page in iter_pages(collection, ["metadatas"], args.page_size):
+        for metadata in page["metadatas"]:
+            filename = (metadata or {}).get("filename", "Unknown")
+            per_file[filename] = per_file.get(filename, 0) + 1
+        total += len(page["ids"])
+        print(f"⏳ {total} chunks lus...", end="\r")
+    print(f"📄 Total chunks : {total}            ")
+
+    manifest = list_document_summaries()
+    print(f"\n📂 Répartition par fichier ({len(per_file)} fichiers) :")
+    for filename, count in sorted(per_file.items(), key=lambda item: -item[1]):
+        entry = manifest.get(filename)
+        note = f" (manifeste : {entry['chunk_count']})" if entry and entry["chunk_count"] != count else ""
+        note = note if entry or filename == "Unknown" else " (absent du manifeste)"
+        print(f"  - {filename}: {count} chunks{note}")
+    for filename in sorted(set(manifest) - set(per_file)):
+        print(f"  - {filename}: 0 chunk stocké sous ce nom (manifeste : {manifest[filename]['chunk_count']})")
+
+    print(f"\n🔤 Index BM25 : {lexical_index.indexed_count()} chunks")
+    if args.samples:
+        print(f"\n📝 Exemples de chunks :")
+        page = collection.get(include=["documents", "metadatas"], limit=args.samples)
+        for document, metadata in zip(page["documents"], page["metadatas"]):
+            metadata = metadata or {}
+            print(f"\n  📄 {metadata.get('filename', 'Unknown')} - Chunk {metadata.get('chunk_index', '?')}:")
+            print(f"     {document[:150]}...")
+    print(f"\n✅ Analyse terminée !")
+
+def command_orphans(collection, args):
+    """Chunks qu'aucun fichier du manifeste ne référence, et ids du manifeste absents de la collection"""
+    with temp_store() as store:
+        referenced = _load_manifest_ids(store)
+
+        orphans, seen = 0, 0
+        store.execute("CREATE TABLE orphans (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        store.execute("CREATE TABLE present (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        for page in iter_pages(collection, [], args.page_size):
+            with store:
+                store.executemany("INSERT OR IGNORE INTO present VALUES (?)", ((i,) for i in page["ids"]))
+                for chunk in page["ids"]:
+                    if store.execute("SELECT 1 FROM keys WHERE key = ?", (chunk,)).fetchone() is None:
+                        store.execute("INSERT OR IGNORE INTO orphans VALUES (?)", (chunk,))
+                        orphans += 1
+            seen += len(page["ids"])
+        missing = store.execute("SELECT COUNT(*) FROM keys WHERE key NOT IN (SELECT key FROM present)").fetchone()[0]
+
+        print(f"📄 {seen} chunks dans la collection, {referenced} référencés par le manifeste")
+        print(f"🧹 {orphans} chunks orphelins (aucun fichier du manifeste)")
+        print(f"⚠️ {missing} ids du manifeste absents de la collection" if missing else "✅ Aucun id du manifeste manquant")
+        if missing:
+            print("   → réuploader les fichiers concernés (ou `delete` puis upload)")
+        for chunk in _stream_ids(store, "SELECT key FROM orphans LIMIT 10"):
+            print(f"  - {chunk}")
+        if args.delete and orphans:
+            deleted = delete_chunks(collection, _stream_ids(store, "SELECT key FROM orphans"))
+            print(f"✅ {deleted} chunks orphelins supprimés")
+
+def command_duplicates(collection, args):
+    """Chunks de même texte stockés plusieurs fois pour un même fichier (ids aléatoires d'avant le
+    manifeste, ids partagés entre fichiers d'avant CHUNK_ID_VERSION 2)"""
+    with temp_store() as store:
+        seen = 0
+        for page in iter_pages(collection, ["documents", "metadatas"], args.page_size):
+            rows = []
+            for chunk, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                filename, document = (metadata or {}).get("filename", ""), document or ""
+                # rang 0 : l'id que l'indexation actuelle donnerait à ce chunk
+                rows.append((content_hash(filename + chr(0) + document), chunk,
+                             0 if chunk == chunk_id(document, filename) else 1))
+            with store:
+                store.executemany("INSERT INTO pairs VALUES (?, ?, ?)", rows)
+            seen += len(page["ids"])
+        store.execute("CREATE INDEX pairs_key ON pairs(key)")
+        groups, extra = store.execute(
+            "SELECT COUNT(*), COALESCE(SUM(n - 1), 0) FROM (SELECT COUNT(*) AS n FROM pairs GROUP BY key HAVING n > 1)"
+        ).fetchone()
+        print(f"📄 {seen} chunks analysés : {groups} textes en plusieurs exemplaires dans un même fichier, {extra} chunks en trop")
+
+        if args.delete and extra:
+            # On garde l'id dérivé du fichier et du contenu (voir chunk_id), sinon un id du manifeste, sinon le premier
+            _load_manifest_ids(store)
+            store.execute("CREATE TABLE doomed (key TEXT PRIMARY KEY) WITHOUT ROWID")
+            with store:
+                for _, ids in _duplicate_groups(store):
+                    keep = next((i for i, rank in ids if rank == 0), None) or next(
+                        (i for i, _ in ids if store.execute("SELECT 1 FROM keys WHERE key = ?", (i,)).fetchone()),
+                        ids[0][0],
+                    )
+                    ids = [i for i, _ in ids]
+                    store.executemany("INSERT OR IGNORE INTO doomed VALUES (?)", ((i,) for i in ids if i != keep))
+            deleted = delete_chunks(collection, _stream_ids(store, "SELECT key FROM doomed"))
+            print(f"✅ {deleted} doublons supprimés")
+
+def _duplicate_groups(store):
+    """(empreinte, [(id, rang)]) pour chaque texte en plusieurs exemplaires, lu groupe par groupe"""
+    cursor = store.execute(
+        "SELECT key, value, rank FROM pairs WHERE key IN (SELECT key FROM pairs GROUP BY key HAVING COUNT(*) > 1) "
+        "ORDER BY key, rank, rowid"
+    )
+    current, ids = None, []
+    for text_hash, chunk, rank in cursor:
+        if text_hash != current and ids:
+            yield current, ids
+            ids = []
+        current = text_hash
+        ids.append((chunk, rank))
+    if ids:
+        yield current, ids
+
+def command_delete(collection, args):
+    """Retire un fichier : ses chunks (sauf ceux partagés avec un autre fichier), l'index BM25 et le manifeste"""
+    with temp_store() as store:
+        _load_manifest_ids(store, exclude=args.filename)  # chunks partagés avec d'autres fichiers : conservés
+        store.execute("CREATE TABLE doomed (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        entry = remove_document(args.filename)
+        with store:
+            store.executemany("INSERT OR IGNORE INTO doomed VALUES (?)", ((i,) for i in (entry or {}).get("chunk_ids", [])))
+            for page in iter_pages(collection, [], args.page_size, where={"filename": args.filename}):
+                store.executemany("INSERT OR IGNORE INTO doomed VALUES (?)", ((i,) for i in page["ids"]))  # chunks d'avant le manifeste
+        if entry is None and store.execute("SELECT COUNT(*) FROM doomed").fetchone()[0] == 0:
+            print(f"⚠️ {args.filename} : aucun chunk ni entrée de manifeste")
+            return
+        deleted = delete_chunks(collection, _stream_ids(store, "SELECT key FROM doomed WHERE key NOT IN (SELECT key FROM keys)"))
+    print(f"✅ {args.filename} : {deleted} chunks supprimés" + (", entrée du manifeste retirée" if entry else ""))
+
+REBUILD_COLLECTION = f"{CHROMA_COLLECTION}_rebuild"
+
+def _get_collection(client, name):
+    try:
+        return client.get_collection(name=name)
+    except Exception:
+        return None
+
+def recover_interrupted_rebuild(collection):
+    """Termine une compaction interrompue entre la suppression de l'original et le renommage de la copie.
+
+    Si la copie existe et que la collection courante est vide (recréée vide par get_chroma),
+    la copie est la seule version des données : elle reprend le nom de la collection.
+    Retourne la collection à utiliser, ou None si la situation demande une intervention manuelle.
+    """
+    client, _ = get_chroma()
+    copy = _get_collection(client, REBUILD_COLLECTION)
+    if copy is None:
+        return collection
+    if collection.count() == 0 and copy.count() > 0:
+        print(f"⚠️ Compaction interrompue : '{REBUILD_COLLECTION}' ({copy.count()} chunks) remplace la collection vide")
+        client.delete_collection(name=CHROMA_COLLECTION)
+        copy.modify(name=CHROMA_COLLECTION)
+        _, collection = reconnect()
+        return collection
+    if copy.count() == 0:
+        client.delete_collection(name=REBUILD_COLLECTION)  # copie vide : rien à récupérer
+        return collection
+    print(f"❌ '{CHROMA_COLLECTION}' ({collection.count()} chunks) et '{REBUILD_COLLECTION}' ({copy.count()} chunks) "
+          f"existent tous les deux : vérifier lequel garder avant toute maintenance")
+    return None
+
+def command_rebuild(collection, args):
+    """Reconstruit l'index BM25 et, sauf --lexical-only, compacte la collection (copie page par page
+    avec les embeddings dans une nouvelle collection, qui remplace l'ancienne : l'index HNSW est
+    reconstruit sans les éléments supprimés)"""
+    if not args.lexical_only:
+        client, _ = get_chroma()  # copie restante déjà traitée par recover_interrupted_rebuild
+        target = client.create_collection(name=REBUILD_COLLECTION, metadata=collection.metadata or None)
+        copied = 0
+        for page in iter_pages(collection, ["documents", "metadatas", "embeddings"], args.page_size):
+            target.add(ids=page["ids"], documents=page["documents"], metadatas=page["metadatas"],
+                       embeddings=page["embeddings"])
+            copied += len(page["ids"])
+            print(f"⏳ {copied} chunks copiés...", end="\r")
+        # L'original n'est supprimé que si la copie est complète (pas d'écriture pendant la copie)
+        if not (target.count() == copied == collection.count()):
+            client.delete_collection(name=REBUILD_COLLECTION)
+            print(f"❌ Copie incomplète ({target.count()} / {collection.count()} chunks), collection d'origine conservée")
+            return
+        client.delete_collection(name=CHROMA_COLLECTION)
+        target.modify(name=CHROMA_COLLECTION)
+        print(f"✅ Collection compactée : {copied} chunks            ")
+        _, collection = reconnect()
+
+    count = lexical_index.rebuild_from_collection(collection, page_size=args.page_size)
+    print(f"✅ Index BM25 reconstruit : {count} chunks")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspection et maintenance de ChromaDB")
+    parser.add_argument("--page-size", type=int, default=1000, help="chunks lus par page")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats = commands.add_parser("stats", help="chunks par fichier, comparés au manifeste")
+    stats.add_argument("--samples", type=int, default=5, help="exemples de chunks affichés")
+    orphans = commands.add_parser("orphans", help="chunks sans fichier dans le manifeste")
+    orphans.add_argument("--delete", action="store_true", help="supprimer les orphelins")
+    duplicates = commands.add_parser("duplicates", help="chunks de même texte sous plusieurs ids")
+    duplicates.add_argument("--delete", action="store_true", help="supprimer les exemplaires en trop")
+    delete = commands.add_parser("delete", help="retirer un fichier de la collection")
+    delete.add_argument("filename")
+    rebuild = commands.add_parser("rebuild", help="compacter la collection et reconstruire l'index BM25")
+    rebuild.add_argument("--lexical-only", action="store_true", help="reconstruire seulement l'index BM25")
+    args = parser.parse_args()
+
+    try:
+        _, collection = get_chroma()
+    except Exception as e:
+        print(f"❌ Erreur ChromaDB : {e}")
+        return
+    collection = recover_interrupted_rebuild(collection)
+    if collection is None:
+        return
+    {
+        "stats": command_stats,
+        "orphans": command_orphans,
+        "duplicates": command_duplicates,
+        "delete": command_delete,
+        "rebuild": command_rebuild,
+    }[args.command](collection, args)
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,21 @@ import matplotlib.pyplot as plt
 import io
 import os
 from dotenv import load_dotenv
-import chromadb
-import uuid
-from datetime import datetime
+from contextlib import nullcontext
+
+from core.db import read_connection
+from core.chroma_client import get_chroma, get_collection_count
+from core.analytics import read_guarded
+from core.retrieval import hybrid_search
+from core.doc_filters import resolve_scope
+from core.context_packer import pack_context
+from core.lexical_index import index_chunks
+from core.stats import get_totals
+# Vidage de la collection et file d'indexation partagés avec la page AI Viz de app_chat.py
+from core.ai_viz_logic import reset_collection
+from core.extraction import ExtractionError
+from core.ingestion_jobs import submit_upload
+from core.ui_components import render_ingestion_section, render_doc_filters
 
 # Charger les variables d'environnement
 load_dotenv('.env')
@@ -17,23 +29,9 @@ client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
 # ==== CONFIGURATION CHROMADB ====
 def init_chroma_client():
-    """Initialise le client ChromaDB"""
+    """Initialise le client ChromaDB (partagé par le processus, voir core.chroma_client)"""
     try:
-        # Client ChromaDB (persistant local par défaut)
-        chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        
-        # Créer ou récupérer une collection
-        collection_name = "documents"
-        try:
-            collection = chroma_client.get_collection(name=collection_name)
-            print(f"✅ Collection '{collection_name}' récupérée")
-        except:
-            # Créer la collection si elle n'existe pas
-            collection = chroma_client.create_collection(name=collection_name)
-            print(f"✅ Collection '{collection_name}' créée")
-            
-        return chroma_client, collection
-        
+        return get_chroma()
     except Exception as e:
         print(f"❌ Erreur ChromaDB : {e}")
         return None, None
@@ -49,6 +47,7 @@ def add_documents_to_chroma(collection, documents, metadatas=None, ids=None):
             metadatas=metadatas,
             ids=ids
         )
+        index_chunks(ids, documents, metadatas)
         print(f"✅ {len(documents)} documents ajoutés à ChromaDB")
         
     except Exception as e:
@@ -74,7 +73,7 @@ def populate_sample_documents(collection):
     
     # Vérifier si la collection est vide
     try:
-        count = collection.count()
+        count = get_collection_count(collection)
         if count == 0:
             add_documents_to_chroma(collection, sample_docs, metadatas)
             print(f"📄 {len(sample_docs)} documents d'exemple ajoutés")
@@ -84,61 +83,44 @@ def populate_sample_documents(collection):
         print(f"❌ Erreur lors du peuplement : {e}")
 
 # ==== VECTOR SEARCH AVEC CHROMADB ====
-def search_vector_db(query, collection):
-    """Recherche sémantique dans ChromaDB selon votre logique"""
-    # Recherche sémantique dans la collection ChromaDB
+def search_vector_db(query, collection, filters=None):
+    """Recherche hybride (sémantique + BM25) dans ChromaDB selon votre logique, limitée aux
+    fichiers visés par `filters` ou par la question"""
     try:
-        # Recherche avec plus de résultats et affichage debug
-        results = collection.query(
-            query_texts=[query], 
-            n_results=10,  # Plus de résultats
-            include=['documents', 'metadatas', 'distances']
-        )
-        
-        if results['documents'] and results['documents'][0]:
-            # Filtrer les résultats par pertinence (distance < 1.0 par exemple)
-            documents = results['documents'][0]
-            distances = results['distances'][0] if 'distances' in results else []
-            metadatas = results['metadatas'][0] if 'metadatas' in results else []
-            
-            # Debug info
-            print(f"🔍 Recherche pour: '{query}'")
-            print(f"📄 {len(documents)} résultats trouvés")
-            
-            relevant_docs = []
-            for i, (doc, distance, metadata) in enumerate(zip(documents, distances, metadatas)):
-                print(f"  - Document {i+1} (distance: {distance:.3f}): {doc[:100]}...")
-                # Seuil plus permissif - ChromaDB utilise la distance cosinus
-                if distance < 2.0:  # Seuil plus permissif
-                    relevant_docs.append(doc)
-            
-            if relevant_docs:
-                combined_context = "\n\n".join(relevant_docs)
-                print(f"✅ {len(relevant_docs)} documents pertinents retenus")
-                return combined_context
-            else:
-                # Si aucun document vraiment pertinent, prendre le meilleur quand même
-                if documents:
-                    best_doc = documents[0]  # Le premier est le plus pertinent
-                    print(f"⚠️ Aucun document très pertinent, utilisation du meilleur (distance: {distances[0]:.3f})")
-                    return f"Document le plus proche trouvé :\n{best_doc}"
-                else:
-                    return f"Aucun document trouvé pour '{query}'"
-        else:
-            return "Aucun document trouvé dans ChromaDB"
-            
+        filenames = resolve_scope(query, filters)
+        if filenames is not None:
+            print(f"📁 Recherche limitée à {len(filenames)} fichier(s) : {', '.join(filenames[:5])}")
+        hits = hybrid_search(query, collection, filenames=filenames)
+        
+        # Debug info
+        print(f"🔍 Recherche pour: '{query}'")
+        print(f"📄 {len(hits)} résultats retenus")
+        for i, hit in enumerate(hits):
+            distance = f"{hit['distance']:.3f}" if hit["distance"] is not None else "-"
+            bm25 = f"{hit['bm25']:.2f}" if hit["bm25"] is not None else "-"
+            print(f"  - Document {i+1} (RRF: {hit['score']:.4f}, distance: {distance}, bm25: {bm25}): {hit['document'][:100]}...")
+        
+        if hits:
+            # Chunks consécutifs fusionnés sans recouvrement, dans la limite du budget de tokens
+            context, info = pack_context(hits)
+            print(f"📦 Contexte : {info['passages']} passage(s), {info['tokens']} tokens (chunks bruts : {info['raw_tokens']})")
+            return context
+        return f"Aucun document trouvé pour '{query}'"
+
     except Exception as e:
         print(f"❌ Erreur ChromaDB : {e}")
         return f"Erreur ChromaDB: {e}"
 
 # ==== SQL SEARCH ====
-def search_sql_db(query, conn):
+def search_sql_db(query, conn=None):
     """Recherche dans la base SQL avec génération automatique de requêtes"""
     try:
         from core.gpt_sql import get_sql_from_gpt
         sql = get_sql_from_gpt(query)
-        print(f"🗃️ SQL générée : {sql}")
-        df = pd.read_sql_query(sql, conn)
+        # Sans connexion fournie, on n'emprunte une connexion du pool qu'après l'appel au LLM
+        with nullcontext(conn) if conn is not None else read_connection() as sql_conn:
+            print(f"🗃️ SQL générée : {sql}")
+            sql, df = read_guarded(sql, sql_conn)  # garde-fou, agrégats servis par le miroir colonne si à jour
         print(f"✅ {len(df)} résultats trouvés")
         return df, sql
     except ImportError:
@@ -154,15 +136,15 @@ def search_sql_db(query, conn):
         return df, sql
 
 def init_sql_connection():
-    """Initialise la connexion à la base de données SQLite"""
-    import sqlite3
+    """Vérifie que la base SQLite répond (les connexions sont ensuite empruntées au pool)"""
     try:
-        conn = sqlite3.connect("bdd_clients.db")
+        with read_connection() as conn:
+            conn.execute("SELECT 1")
         print("✅ Connexion SQL établie")
-        return conn
+        return True
     except Exception as e:
         print(f"❌ Erreur connexion SQL : {e}")
-        return None
+        return False
 
 # ==== DONNÉES D'EXEMPLE (fallback) ====
 def get_sample_data():
@@ -258,7 +240,7 @@ def exec_and_display_plot(code, df):
         return False
 
 # ==== PIPELINE PRINCIPAL - VOTRE LOGIQUE ====
-def run_viz_pipeline(user_request, collection=None, sql_conn=None):
+def run_viz_pipeline(user_request, collection=None, sql_conn=None, filters=None):
     """Votre pipeline principal avec routage IA intelligent"""
     
     # 1. On demande à l'IA si la question vise plutôt la base SQL ou les docs PDF
@@ -284,25 +266,25 @@ def run_viz_pipeline(user_request, collection=None, sql_conn=None):
     
     if routing == "SQL":
         if sql_conn:
-            df, sql = search_sql_db(user_request, sql_conn)
+            df, sql = search_sql_db(user_request)
         else:
             df, sql = get_sample_data(), "-- Données d'exemple (pas de connexion SQL)"
             
     elif routing == "VECTOR":
         if collection:
-            vector_context = search_vector_db(user_request, collection)
+            vector_context = search_vector_db(user_request, collection, filters)
         else:
             vector_context = "Pas de connexion ChromaDB configurée. Données d'exemple utilisées."
             df = get_sample_data()
             
     elif routing == "BOTH":
         if sql_conn:
-            df, sql = search_sql_db(user_request, sql_conn)
+            df, sql = search_sql_db(user_request)
         else:
             df, sql = get_sample_data(), "-- Données d'exemple (pas de connexion SQL)"
             
         if collection:
-            vector_context = search_vector_db(user_request, collection)
+            vector_context = search_vector_db(user_request, collection, filters)
         else:
             vector_context = "Pas de connexion ChromaDB configurée."
     else:
@@ -377,6 +359,7 @@ def main():
     
     # Initialiser ChromaDB
     chroma_client, collection = init_chroma_client()
+    doc_filters = {}
     
     # Initialiser la connexion SQL
     sql_conn = init_sql_connection()
@@ -386,7 +369,7 @@ def main():
         
         # Afficher le nombre de documents
         try:
-            doc_count = collection.count()
+            doc_count = get_collection_count(collection)
             st.sidebar.info(f"📄 {doc_count} documents dans la base")
         except:
             st.sidebar.warning("⚠️ Impossible de compter les documents")
@@ -401,30 +384,27 @@ def main():
             accept_multiple_files=True
         )
         
-        # Traitement automatique des fichiers uploadés
+        # Fichiers uploadés : indexés en arrière-plan, la page reste utilisable
         if uploaded_files:
             for uploaded_file in uploaded_files:
-                # Vérifier si le fichier n'est pas déjà traité
+                # Vérifier si le fichier n'est pas déjà soumis
                 file_key = f"processed_{uploaded_file.name}_{uploaded_file.size}"
                 
                 if file_key not in st.session_state:
-                    with st.spinner(f"Traitement de {uploaded_file.name}..."):
-                        # Traiter le fichier
-                        content = process_uploaded_file(uploaded_file)
-                        
-                        if content.startswith("❌"):
-                            st.sidebar.error(content)
-                        else:
-                            # Ajouter automatiquement à ChromaDB
-                            chunks_added = add_document_to_chroma(collection, uploaded_file.name, content)
-                            if chunks_added > 0:
-                                st.sidebar.success(f"✅ {uploaded_file.name} ajouté ({chunks_added} chunks)")
-                                st.session_state[file_key] = True
-                                st.rerun()
-                            else:
-                                st.sidebar.error("❌ Échec de l'ajout")
-                else:
-                    st.sidebar.info(f"📄 {uploaded_file.name} déjà traité")
+                    try:
+                        submit_upload(uploaded_file)
+                        st.session_state[file_key] = True
+                        st.sidebar.info(f"📥 {uploaded_file.name} ajouté à la file d'indexation")
+                    except ExtractionError as e:
+                        st.sidebar.error(str(e))
+        
+        # Suivi des indexations (rafraîchi toutes les 2 s tant qu'un job est actif)
+        with st.sidebar:
+            render_ingestion_section()
+        
+        # Filtres de la recherche documentaire
+        with st.sidebar:
+            doc_filters = render_doc_filters()
         
         # Bouton pour ajouter des exemples
         st.sidebar.markdown("---")
@@ -436,8 +416,7 @@ def main():
         # Bouton pour vider la base
         if st.sidebar.button("🗑️ Vider ChromaDB", type="secondary"):
             try:
-                chroma_client.delete_collection(name="documents")
-                chroma_client.create_collection(name="documents")
+                reset_collection(chroma_client)
                 st.sidebar.success("✅ ChromaDB vidée")
                 st.rerun()
             except Exception as e:
@@ -454,7 +433,7 @@ def main():
     st.sidebar.markdown("- ✅ OpenAI GPT-4")
     
     if collection:
-        doc_count = collection.count() if collection else 0
+        doc_count = get_collection_count(collection) if collection else 0
         st.sidebar.markdown(f"- ✅ ChromaDB ({doc_count} docs)")
     else:
         st.sidebar.markdown("- ❌ ChromaDB")
@@ -462,10 +441,7 @@ def main():
     if sql_conn:
         # Tester la connexion SQL avec un count
         try:
-            test_contacts = pd.read_sql_query("SELECT COUNT(*) as count FROM contacts", sql_conn)
-            test_companies = pd.read_sql_query("SELECT COUNT(*) as count FROM companies", sql_conn)
-            contacts_count = test_contacts['count'].iloc[0]
-            companies_count = test_companies['count'].iloc[0]
+            contacts_count, companies_count = get_totals()
             st.sidebar.markdown(f"- ✅ Base SQL ({contacts_count} contacts, {companies_count} entreprises)")
         except Exception as e:
             st.sidebar.markdown("- ⚠️ Base SQL (erreur)")
@@ -496,7 +472,7 @@ def main():
     if generate_btn and user_request:
         with st.spinner("🤖 Analyse et génération en cours..."):
             # Lancer votre pipeline principal avec la vraie connexion SQL
-            run_viz_pipeline(user_request, collection, sql_conn)
+            run_viz_pipeline(user_request, collection, sql_conn, doc_filters or None)
             
     elif generate_btn:
         st.warning("⚠️ Veuillez saisir une demande !")
@@ -601,109 +577,6 @@ def test_mode():
     
     print("✅ Pipeline complet testé avec succès !")
 
-# ==== FONCTIONS DE TRAITEMENT DE DOCUMENTS ====
-def process_uploaded_file(uploaded_file):
-    """Traite un fichier uploadé et retourne le texte"""
-    try:
-        if uploaded_file.type == "text/plain":
-            # Fichier texte
-            content = str(uploaded_file.read(), "utf-8")
-            return content
-        
-        elif uploaded_file.type == "application/pdf":
-            # Fichier PDF - nécessite PyPDF2 ou pymupdf
-            try:
-                import PyPDF2
-                pdf_reader = PyPDF2.PdfReader(uploaded_file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
-            except ImportError:
-                return "❌ Installez PyPDF2 pour lire les PDFs : pip install PyPDF2"
-        
-        elif uploaded_file.type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
-            # Fichier Word - nécessite python-docx
-            try:
-                import docx
-                doc = docx.Document(uploaded_file)
-                text = ""
-                for paragraph in doc.paragraphs:
-                    text += paragraph.text + "\n"
-                return text
-            except ImportError:
-                return "❌ Installez python-docx pour lire les fichiers Word : pip install python-docx"
-        
-        else:
-            return f"❌ Type de fichier non supporté : {uploaded_file.type}"
-            
-    except Exception as e:
-        return f"❌ Erreur lors du traitement : {e}"
-
-def chunk_text(text, chunk_size=1000, overlap=200):
-    """Découpe le texte en chunks pour ChromaDB"""
-    chunks = []
-    text = text.strip()
-    
-    if len(text) <= chunk_size:
-        return [text]
-    
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        
-        # Essayer de couper à la fin d'une phrase
-        if end < len(text):
-            # Chercher le dernier point ou saut de ligne
-            last_period = text.rfind('.', start, end)
-            last_newline = text.rfind('\n', start, end)
-            cut_point = max(last_period, last_newline)
-            
-            if cut_point > start:
-                end = cut_point + 1
-        
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        
-        start = end - overlap
-        
-    return chunks
-
-def add_document_to_chroma(collection, filename, content):
-    """Ajoute un document découpé en chunks à ChromaDB"""
-    try:
-        chunks = chunk_text(content)
-        
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for i, chunk in enumerate(chunks):
-            doc_id = f"{filename}_{uuid.uuid4().hex[:8]}_{i}"
-            
-            documents.append(chunk)
-            metadatas.append({
-                "filename": filename,
-                "chunk_index": i,
-                "total_chunks": len(chunks),
-                "upload_date": datetime.now().isoformat(),
-                "file_type": filename.split('.')[-1] if '.' in filename else "unknown"
-            })
-            ids.append(doc_id)
-        
-        collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
-        
-        return len(chunks)
-        
-    except Exception as e:
-        st.error(f"Erreur lors de l'ajout à ChromaDB : {e}")
-        return 0
-
 # ==== POINT D'ENTRÉE ====
 if __name__ == "__main__":
     import sys
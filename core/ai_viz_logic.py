@@ -4,10 +4,20 @@ import matplotlib.pyplot as plt
 import io
 import os
 from dotenv import load_dotenv
-import chromadb
-import uuid
+import time
+from contextlib import nullcontext
 from datetime import datetime
-import sqlite3
+
+from core.db import read_connection
+from core.chroma_client import get_chroma, recreate_collection
+from core.analytics import read_guarded
+from core.retrieval import hybrid_search, clear_retrieval_cache
+from core.doc_filters import resolve_scope
+from core.context_packer import pack_context
+from core.lexical_index import remove_chunks, clear_index, update_metadata
+from core.ingestion import ingest_chunks, INGEST_BATCH_SIZE, INGEST_WORKERS
+from core.doc_manifest import CHUNK_ID_VERSION, content_hash, chunk_id, get_document, referenced_ids, record_document, clear_manifest
+from core.chunking import iter_chunks, CHUNKER_VERSION
 
 # Charger les variables d'environnement
 load_dotenv('.env')
@@ -15,68 +25,54 @@ load_dotenv('.env')
 # Configuration OpenAI (nouvelle API v1.0+)
 client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
+# Découpage en flux (core.chunking) : taille des lots écrits
+STREAM_FLUSH_CHUNKS = INGEST_BATCH_SIZE * INGEST_WORKERS
+
 # ==== CONFIGURATION CHROMADB ====
 def init_chroma_client():
-    """Initialise le client ChromaDB"""
+    """Client ChromaDB et collection partagés par le processus (voir core.chroma_client)"""
     try:
-        chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        try:
-            collection = chroma_client.get_collection(name="documents")
-        except:
-            collection = chroma_client.create_collection(name="documents")
-        return chroma_client, collection
+        return get_chroma()
     except Exception as e:
         print(f"❌ Erreur ChromaDB : {e}")
         return None, None
 
-def init_sql_connection():
-    """Initialise la connexion à la base de données SQLite"""
-    try:
-        conn = sqlite3.connect("bdd_clients.db")
-        return conn
-    except Exception as e:
-        print(f"❌ Erreur connexion SQL : {e}")
-        return None
+def reset_collection(chroma_client=None):
+    """Vide ChromaDB : collection partagée recréée, manifeste, index BM25 et caches de recherche remis à zéro"""
+    collection = recreate_collection()
+    clear_manifest()
+    clear_index()
+    clear_retrieval_cache()
+    return collection
 
 # ==== VECTOR SEARCH AVEC CHROMADB ====
-def search_vector_db(query, collection):
-    """Recherche sémantique dans ChromaDB"""
+def search_vector_db(query, collection, filters=None):
+    """Recherche hybride (sémantique + BM25) dans ChromaDB, limitée aux fichiers visés par `filters`
+    (interface) ou par la question (« dans le rapport HYBE », « PDF de 2024 »)"""
     try:
-        results = collection.query(
-            query_texts=[query], 
-            n_results=10,
-            include=['documents', 'metadatas', 'distances']
-        )
-        
-        if results['documents'] and results['documents'][0]:
-            documents = results['documents'][0]
-            distances = results['distances'][0] if 'distances' in results else []
-            
-            relevant_docs = []
-            for i, (doc, distance) in enumerate(zip(documents, distances)):
-                if distance < 2.0:  # Seuil de pertinence
-                    relevant_docs.append(doc)
-            
-            if relevant_docs:
-                combined_context = "\n\n".join(relevant_docs)
-                return combined_context
-            elif documents:
-                return f"Document le plus proche trouvé :\n{documents[0]}"
-            else:
-                return f"Aucun document trouvé pour '{query}'"
-        else:
-            return "Aucun document trouvé dans ChromaDB"
+        filenames = resolve_scope(query, filters)
+        if filenames is not None:
+            print(f"📁 Recherche limitée à {len(filenames)} fichier(s) : {', '.join(filenames[:5])}")
+        hits = hybrid_search(query, collection, filenames=filenames)
+        if hits:
+            # Chunks consécutifs fusionnés sans recouvrement, dans la limite du budget de tokens
+            context, info = pack_context(hits)
+            print(f"📦 Contexte : {info['passages']} passage(s), {info['tokens']} tokens (chunks bruts : {info['raw_tokens']})")
+            return context
+        return f"Aucun document trouvé pour '{query}'"
             
     except Exception as e:
         return f"Erreur ChromaDB: {e}"
 
 # ==== SQL SEARCH ====
-def search_sql_db(query, conn, conversation_history=None):
+def search_sql_db(query, conn=None, conversation_history=None):
     """Recherche dans la base SQL avec génération automatique de requêtes"""
     try:
         from core.gpt_sql import get_sql_from_gpt
         sql = get_sql_from_gpt(query, conversation_history)
-        df = pd.read_sql_query(sql, conn)
+        # Sans connexion fournie, on n'emprunte une connexion du pool qu'après l'appel au LLM
+        with nullcontext(conn) if conn is not None else read_connection() as sql_conn:
+            sql, df = read_guarded(sql, sql_conn)  # garde-fou, agrégats servis par le miroir colonne si à jour
         return df, sql
     except ImportError:
         # Fallback avec données d'exemple
@@ -206,12 +202,11 @@ def execute_viz_code(code, df):
         return None, str(e)
 
 # ==== PIPELINE PRINCIPAL ====
-def run_ai_viz_pipeline(user_request, conversation_history=None):
-    """Pipeline principal avec routage IA intelligent"""
+def run_ai_viz_pipeline(user_request, conversation_history=None, filters=None):
+    """Pipeline principal avec routage IA intelligent (`filters` : filtres documentaires, voir core.doc_filters)"""
     
     # Initialiser les connexions
     chroma_client, collection = init_chroma_client()
-    sql_conn = init_sql_connection()
     
     # 1. Routage IA amélioré avec détection contextuelle
     context_info = ""
@@ -264,26 +259,20 @@ def run_ai_viz_pipeline(user_request, conversation_history=None):
     df, sql, vector_context = None, None, None
     
     if routing == "SQL":
-        if sql_conn:
-            df, sql = search_sql_db(user_request, sql_conn, conversation_history)
-        else:
-            df, sql = get_sample_data(), "-- Pas de connexion SQL"
+        df, sql = search_sql_db(user_request, conversation_history=conversation_history)
             
     elif routing == "VECTOR":
         if collection:
-            vector_context = search_vector_db(user_request, collection)
+            vector_context = search_vector_db(user_request, collection, filters)
         else:
             vector_context = "Pas de connexion ChromaDB configurée."
             df = get_sample_data()
             
     elif routing == "BOTH":
-        if sql_conn:
-            df, sql = search_sql_db(user_request, sql_conn, conversation_history)
-        else:
-            df, sql = get_sample_data(), "-- Pas de connexion SQL"
+        df, sql = search_sql_db(user_request, conversation_history=conversation_history)
             
         if collection:
-            vector_context = search_vector_db(user_request, collection)
+            vector_context = search_vector_db(user_request, collection, filters)
         else:
             vector_context = "Pas de connexion ChromaDB configurée."
 
@@ -310,95 +299,100 @@ def run_ai_viz_pipeline(user_request, conversation_history=None):
     return result
 
 # ==== FONCTIONS UTILITAIRES POUR L'UPLOAD ====
-def process_uploaded_file(uploaded_file):
-    """Traite un fichier uploadé et retourne le texte"""
-    try:
-        if uploaded_file.type == "text/plain":
-            content = str(uploaded_file.read(), "utf-8")
-            return content
-        elif uploaded_file.type == "application/pdf":
-            try:
-                import PyPDF2
-                pdf_reader = PyPDF2.PdfReader(uploaded_file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
-            except ImportError:
-                return "❌ Installez PyPDF2 pour lire les PDFs : pip install PyPDF2"
-        elif uploaded_file.type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
-            try:
-                import docx
-                doc = docx.Document(uploaded_file)
-                text = ""
-                for paragraph in doc.paragraphs:
-                    text += paragraph.text + "\n"
-                return text
-            except ImportError:
-                return "❌ Installez python-docx pour lire les fichiers Word : pip install python-docx"
-        else:
-            return f"❌ Type de fichier non supporté : {uploaded_file.type}"
-    except Exception as e:
-        return f"❌ Erreur lors du traitement : {e}"
-
-def chunk_text(text, chunk_size=1000, overlap=200):
-    """Découpe le texte en chunks pour ChromaDB"""
-    chunks = []
-    text = text.strip()
-    
-    if len(text) <= chunk_size:
-        return [text]
-    
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        
-        if end < len(text):
-            last_period = text.rfind('.', start, end)
-            last_newline = text.rfind('\n', start, end)
-            cut_point = max(last_period, last_newline)
-            
-            if cut_point > start:
-                end = cut_point + 1
-        
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        
-        start = end - overlap
-        
-    return chunks
+def add_document_to_chroma(collection, filename, content, progress_callback=None, file_hash=None, raise_errors=False):
+    """Indexe un document dans ChromaDB de façon idempotente.
 
-def add_document_to_chroma(collection, filename, content):
-    """Ajoute un document découpé en chunks à ChromaDB"""
+    `content` est le texte complet ou un itérable de morceaux (iter_document_text) : dans ce cas
+    les chunks sont embeddés et écrits au fil de l'extraction, donc cherchables avant la fin du
+    fichier, et `file_hash` (empreinte du fichier) est obligatoire.
+    Les ids des chunks dérivent du fichier et du contenu : seuls les chunks absents de la collection
+    sont embeddés (par lots parallèles, voir core.ingestion), ceux qui restent gardent leur embedding
+    mais leurs métadonnées (position, date, empreinte) sont mises à jour, ceux qui ont disparu du
+    fichier sont supprimés et un fichier inchangé ne coûte rien.
+    progress_callback(chunks_traités, None, chunks_par_seconde) est appelé après chaque lot.
+    En cas d'erreur, retourne 0 (ou relance l'exception si raise_errors, pour la file d'ingestion).
+    """
     try:
-        chunks = chunk_text(content)
-        
-        documents = []
-        metadatas = []
+        if isinstance(content, str):
+            file_hash = file_hash or content_hash(content)
+            content = [content]
+        elif file_hash is None:
+            raise ValueError("file_hash est requis pour un document lu en flux")
+        previous = get_document(filename)
+        if (previous and previous["file_hash"] == file_hash and previous.get("chunker") == CHUNKER_VERSION
+                and previous.get("chunk_id_version") == CHUNK_ID_VERSION):
+            print(f"⏭️ {filename} inchangé, aucun chunk réindexé")
+            return previous["chunk_count"]
+
+        file_type = filename.split('.')[-1] if '.' in filename else "unknown"
+        upload_date = datetime.now().isoformat()
+        start = time.perf_counter()
         ids = []
-        
-        for i, chunk in enumerate(chunks):
-            doc_id = f"{filename}_{uuid.uuid4().hex[:8]}_{i}"
-            
-            documents.append(chunk)
-            metadatas.append({
+        pending = {}  # id → (index, chunk) en attente d'écriture
+        counts = {"chunks": 0, "embedded": 0}
+
+        def metadata(doc_id):
+            return {
                 "filename": filename,
-                "chunk_index": i,
-                "total_chunks": len(chunks),
-                "upload_date": datetime.now().isoformat(),
-                "file_type": filename.split('.')[-1] if '.' in filename else "unknown"
-            })
+                "chunk_index": pending[doc_id][0],
+                "upload_date": upload_date,
+                "file_type": file_type,
+                "file_hash": file_hash,
+            }
+
+        def flush():
+            # Upsert : on n'embedde que les chunks que la collection ne contient pas encore
+            existing = collection.get(ids=list(pending), include=["metadatas"])
+            stored = dict(zip(existing["ids"], existing["metadatas"]))
+            new_ids = [doc_id for doc_id in pending if doc_id not in stored]
+            if new_ids:
+                ingest_chunks(collection, new_ids, [pending[doc_id][1] for doc_id in new_ids],
+                              [metadata(doc_id) for doc_id in new_ids])
+            # Chunks déjà présents : métadonnées de cette version du fichier, sans réembedding
+            reused = [doc_id for doc_id in stored if stored[doc_id] != metadata(doc_id)]
+            if reused:
+                collection.update(ids=reused, metadatas=[metadata(doc_id) for doc_id in reused])
+                update_metadata(reused, [metadata(doc_id) for doc_id in reused])
+            counts["embedded"] += len(new_ids)
+            pending.clear()
+            if progress_callback:
+                elapsed = time.perf_counter() - start
+                progress_callback(counts["chunks"], None, counts["chunks"] / elapsed if elapsed else 0.0)
+
+        seen = set()
+        for index, chunk in enumerate(iter_chunks(content)):
+            counts["chunks"] += 1
+            doc_id = chunk_id(chunk, filename)
+            if doc_id in seen:
+                continue  # Un passage répété dans le fichier n'a qu'un id
+            seen.add(doc_id)
             ids.append(doc_id)
-        
-        collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
-        
-        return len(chunks)
+            pending[doc_id] = (index, chunk)
+            if len(pending) >= STREAM_FLUSH_CHUNKS:
+                flush()
+        if pending:
+            flush()
+
+        # Chunks disparus du fichier (ou anciens ids aléatoires) : supprimés s'ils ne servent à aucun autre fichier
+        if previous:
+            stale = set(previous["chunk_ids"])
+        else:
+            stale = set(collection.get(where={"filename": filename}, include=[])["ids"])
+        stale -= seen
+        stale -= referenced_ids(exclude=filename)
+        if stale:
+            collection.delete(ids=list(stale))
+            remove_chunks(stale)
+
+        record_document(filename, file_hash, ids, file_type=file_type, total_chunks=counts["chunks"],
+                        chunker=CHUNKER_VERSION, chunk_id_version=CHUNK_ID_VERSION)
+        elapsed = time.perf_counter() - start
+        print(f"✅ {filename} : {counts['embedded']} chunks embeddés, {len(ids) - counts['embedded']} déjà présents, "
+              f"{len(stale)} supprimés ({counts['chunks'] / elapsed if elapsed else 0:.1f} chunks/s)")
+        return counts["chunks"]
         
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Erreur lors de l'ajout à ChromaDB : {e}")
-        return 0 
\ No newline at end of file
+        return 0
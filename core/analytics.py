@@ -0,0 +1,191 @@
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+from core.db import read_connection, get_schema, get_data_version, get_file_stamp, quote_identifier
+from core.query_cache import get_cached, set_cached, dataframe_size, cached_read_sql
+from core.sql_guard import statement_words, is_read_statement, guard_statement, TABLE_REF
+
+# Miroir colonne (Parquet) de contacts/companies interrogé par DuckDB pour les agrégats.
+# Optionnel : sans duckdb installé (pip install duckdb), tout reste servi par SQLite.
+try:
+    import duckdb
+    ANALYTICS_AVAILABLE = True
+except ImportError:
+    duckdb = None
+    ANALYTICS_AVAILABLE = False
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "1") == "1"
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")
+ANALYTICS_TABLES = ["contacts", "companies"]
+ANALYTICS_MIN_ROWS = int(os.getenv("ANALYTICS_MIN_ROWS", "100000"))  # en dessous, SQLite est plus rapide
+ANALYTICS_EXPORT_CHUNK = int(os.getenv("ANALYTICS_EXPORT_CHUNK", "200000"))
+
+AGGREGATE_FUNCTIONS = {"count", "sum", "avg", "min", "max", "total"}
+# Fonctions ou opérateurs dont le résultat diffère entre SQLite et DuckDB (LIKE sensible à la casse,
+# division entière, dates...) : ces requêtes restent sur SQLite
+SQLITE_ONLY_WORDS = {"like", "glob", "match", "regexp", "strftime", "julianday", "date", "datetime",
+                     "printf", "instr", "substr", "typeof", "rowid", "ifnull", "iif", "group_concat"}
+DUCKDB_TYPES = {"INTEGER": "BIGINT", "REAL": "DOUBLE", "FLOAT": "DOUBLE", "NUMERIC": "DOUBLE"}
+
+_lock = threading.Lock()          # connexion DuckDB du miroir (requêtes et remplacement)
+_refresh_lock = threading.Lock()  # un seul export à la fois, sans bloquer les requêtes
+_mirror = {"token": None, "stamp": None, "conn": None, "thread": None}
+
+def _manifest_path():
+    return os.path.join(ANALYTICS_DIR, "manifest.json")
+
+def _parquet_path(table):
+    return os.path.join(ANALYTICS_DIR, f"{table}.parquet")
+
+# ==== ROUTAGE ====
+def is_aggregate_only(sql):
+    """SELECT d'agrégation (GROUP BY ou fonction d'agrégat) ne lisant que les tables du miroir"""
+    if not is_read_statement(sql):
+        return False
+    words = statement_words(sql)
+    if words & SQLITE_ONLY_WORDS:
+        return False
+    if "group" not in words and not words & AGGREGATE_FUNCTIONS:
+        return False
+    without_literals = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    if "/" in without_literals:
+        return False  # division entière en SQLite, décimale en DuckDB
+    # LOWER() ne plie que l'ASCII dans SQLite : résultats différents sur des littéraux accentués
+    literals = "".join(re.findall(r"'(?:[^']|'')*'", sql))
+    if words & {"lower", "upper"} and any(ord(c) > 127 for c in literals):
+        return False
+    tables = {t.strip('"').replace('""', '"').lower() for t, _ in TABLE_REF.findall(sql)}
+    return bool(tables) and tables <= set(ANALYTICS_TABLES)
+
+def should_use_analytics(sql, conn):
+    """Vrai si la requête gagne à être servie par le miroir colonne (agrégat sur une base assez grosse)"""
+    if not (ANALYTICS_AVAILABLE and ANALYTICS_ENABLED) or not is_aggregate_only(sql):
+        return False
+    try:
+        rows = conn.execute("SELECT MAX(rowid) FROM contacts").fetchone()[0] or 0
+    except Exception:
+        return False
+    return rows >= ANALYTICS_MIN_ROWS
+
+def read_guarded(sql, conn):
+    """Valide puis exécute une requête de lecture générée ; retourne (sql validée, DataFrame).
+
+    Un agrégat servi par le miroir colonne (à jour) n'est pas soumis au budget de scan SQLite :
+    c'est sur les grosses tables que le miroir sert. Sinon la requête est lue par SQLite (avec
+    cache de résultats), sous le garde-fou complet, pendant que le miroir est réexporté en
+    arrière-plan.
+    """
+    if should_use_analytics(sql, conn):
+        if mirror_is_current():
+            guarded = guard_statement(conn, sql, exempt_scan_budget=True)
+            try:
+                return guarded, query_analytics(guarded)
+            except Exception as e:
+                print(f"⚠️ Miroir analytique indisponible, repli sur SQLite : {e}")
+        else:
+            schedule_refresh()
+    guarded = guard_statement(conn, sql)
+    return guarded, cached_read_sql(guarded, conn)
+
+# ==== MIROIR PARQUET ====
+def _export_table(con, table, columns):
+    """Copie une table SQLite dans DuckDB par paquets, puis l'écrit en Parquet (fichier remplacé atomiquement)"""
+    definition = ", ".join(f"{quote_identifier(c['name'])} {DUCKDB_TYPES.get((c['type'] or '').upper(), 'VARCHAR')}" for c in columns)
+    con.execute(f"CREATE OR REPLACE TABLE {quote_identifier(table)} ({definition})")
+    names = ", ".join(quote_identifier(c["name"]) for c in columns)
+    with read_connection() as conn:
+        for chunk in pd.read_sql_query(f"SELECT {names} FROM {quote_identifier(table)}", conn, chunksize=ANALYTICS_EXPORT_CHUNK):
+            con.register("chunk", chunk)
+            con.execute(f"INSERT INTO {quote_identifier(table)} SELECT * FROM chunk")
+            con.unregister("chunk")
+    tmp_path = _parquet_path(table) + ".tmp"
+    con.execute(f"COPY {quote_identifier(table)} TO '{tmp_path}' (FORMAT PARQUET)")
+    con.execute(f"DROP TABLE {quote_identifier(table)}")
+    os.replace(tmp_path, _parquet_path(table))
+
+def _read_manifest():
+    try:
+        with open(_manifest_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def refresh_mirror(force=False, verbose=False):
+    """Réexporte le miroir si la base a changé depuis le dernier export (ou si force=True).
+
+    Les requêtes continuent d'utiliser l'ancien miroir pendant l'export ; il est remplacé à la fin.
+    """
+    if not ANALYTICS_AVAILABLE:
+        raise RuntimeError("duckdb n'est pas installé : pip install duckdb")
+    with _refresh_lock:
+        token = get_data_version()
+        if not force and _mirror["token"] == token and _mirror["conn"] is not None:
+            return False
+        stamp = list(get_file_stamp())
+        schema = get_schema()
+        tables = [t for t in ANALYTICS_TABLES if t in schema]
+        exported = False
+        if force or _read_manifest().get("stamp") != stamp or not all(os.path.exists(_parquet_path(t)) for t in tables):
+            os.makedirs(ANALYTICS_DIR, exist_ok=True)
+            start = time.perf_counter()
+            con = duckdb.connect()
+            try:
+                for table in tables:
+                    _export_table(con, table, schema[table])
+            finally:
+                con.close()
+            with open(_manifest_path(), "w", encoding="utf-8") as f:
+                json.dump({"stamp": stamp, "tables": tables, "exported_at": time.time()}, f)
+            exported = True
+            if verbose:
+                print(f"✅ Miroir analytique exporté en {time.perf_counter() - start:.2f}s")
+
+        con = duckdb.connect()
+        con.execute("SET default_null_order = 'nulls_first_on_asc_last_on_desc'")  # ordre des NULL de SQLite
+        for table in tables:
+            con.execute(f"CREATE VIEW {quote_identifier(table)} AS SELECT * FROM read_parquet('{_parquet_path(table)}')")
+        with _lock:
+            previous = _mirror["conn"]
+            _mirror.update(token=token, stamp=stamp, conn=con)
+        if previous is not None:
+            previous.close()
+        return exported
+
+def mirror_is_current():
+    """Le miroir ouvert reflète le dernier commit sur la base"""
+    with _lock:
+        return _mirror["conn"] is not None and _mirror["token"] == get_data_version()
+
+def _refresh_in_background():
+    try:
+        refresh_mirror()
+    except Exception as e:
+        print(f"⚠️ Rafraîchissement du miroir analytique impossible : {e}")
+
+def schedule_refresh():
+    """Lance le réexport du miroir dans un thread de fond s'il n'est pas déjà en cours"""
+    with _lock:
+        thread = _mirror["thread"]
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=_refresh_in_background, name="analytics-refresh", daemon=True)
+        _mirror["thread"] = thread
+        thread.start()
+
+def query_analytics(sql):
+    """Exécute une requête d'agrégation sur le miroir colonne tel qu'il est (voir mirror_is_current)"""
+    with _lock:
+        if _mirror["conn"] is None:
+            raise RuntimeError("miroir analytique pas encore exporté")
+        token = _mirror["token"]
+    df = get_cached("df", sql, token)
+    if df is None:
+        with _lock:
+            df = _mirror["conn"].execute(sql).df()
+        set_cached("df", sql, token, df, dataframe_size(df))
+    return df.copy()
@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+
+from core import lexical_index
+
+# Client ChromaDB et collection partagés par tout le processus : ouverts une fois (au lieu d'un
+# PersistentClient par rerun Streamlit et par requête), vérifiés périodiquement et rouverts
+# en cas de problème.
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "documents")
+CHROMA_HEALTH_INTERVAL = float(os.getenv("CHROMA_HEALTH_INTERVAL", "30"))  # secondes entre deux vérifications
+
+_lock = threading.RLock()
+_state = {"client": None, "collection": None, "checked_at": 0.0, "epoch": 0, "count": None, "count_key": None}
+
+def _open():
+    import chromadb
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collection = client.get_or_create_collection(name=CHROMA_COLLECTION)
+    _state.update(client=client, collection=collection, checked_at=time.time(), epoch=_state["epoch"] + 1)
+    print(f"✅ ChromaDB ouverte ({CHROMA_PATH}, collection '{CHROMA_COLLECTION}')")
+
+def _healthy():
+    """Le client répond et la collection en cache est toujours celle de la base (pas supprimée ailleurs)"""
+    try:
+        _state["client"].heartbeat()
+        current = _state["client"].get_collection(name=CHROMA_COLLECTION)
+        return current.id == _state["collection"].id
+    except Exception as e:
+        print(f"⚠️ ChromaDB à reconnecter : {e}")
+        return False
+
+def _clear_client_cache():
+    # Chroma garde un système par chemin : sans ce nettoyage, un nouveau client réutiliserait l'ancien
+    try:
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+    except Exception:
+        pass
+
+def get_chroma():
+    """(client, collection) du processus ; ouverts au premier appel, vérifiés toutes les CHROMA_HEALTH_INTERVAL s"""
+    with _lock:
+        if _state["client"] is None:
+            _open()
+        elif time.time() - _state["checked_at"] > CHROMA_HEALTH_INTERVAL:
+            if _healthy():
+                _state["checked_at"] = time.time()
+                _state["epoch"] += 1  # recompte à la prochaine demande : changements faits par d'autres processus
+            else:
+                reconnect()
+        return _state["client"], _state["collection"]
+
+def reconnect():
+    """Rouvre le client et la collection (après une erreur ChromaDB)"""
+    with _lock:
+        _state.update(client=None, collection=None, count=None, count_key=None)
+        _clear_client_cache()
+        _open()
+        return _state["client"], _state["collection"]
+
+def recreate_collection():
+    """Supprime et recrée la collection partagée ; retourne la nouvelle"""
+    with _lock:
+        client, _ = get_chroma()
+        client.delete_collection(name=CHROMA_COLLECTION)
+        _state["collection"] = client.create_collection(name=CHROMA_COLLECTION)
+        _state.update(count=None, count_key=None, epoch=_state["epoch"] + 1)
+        return _state["collection"]
+
+def get_collection_count(collection=None):
+    """collection.count() mis en cache : recalculé seulement quand l'index BM25 (tenu à jour à chaque
+    ingestion et suppression) a changé ou après une vérification périodique"""
+    with _lock:
+        shared = _state["collection"]
+        if collection is not None and collection is not shared:
+            return collection.count()
+        if shared is None:
+            _, shared = get_chroma()
+        key = (lexical_index.generation(), _state["epoch"])
+        if _state["count_key"] != key:
+            _state.update(count=shared.count(), count_key=key)
+        return _state["count"]
@@ -0,0 +1,131 @@
+import os
+import re
+from array import array
+from bisect import bisect_left
+
+# Découpage des documents en chunks mesurés en tokens, coupés de préférence sur un titre, puis
+# une fin de paragraphe, puis une fin de phrase. Travail total linéaire : chaque chunk avance d'au
+# moins (max_tokens // 2 - overlap) tokens et les curseurs de recherche des coupures ne reculent jamais.
+# Tokens approchés (mots et ponctuation) : ~1,3 token du modèle d'embedding par token compté,
+# 192 tokens restent sous la limite de 256 du modèle par défaut de Chroma.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "192"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+STREAM_WINDOW_TOKENS = 64 * CHUNK_MAX_TOKENS  # texte gardé en mémoire par iter_chunks
+# Noté dans le manifeste : un fichier découpé avec d'autres règles est réindexé même s'il n'a pas changé
+CHUNKER_VERSION = f"tokens-1:{CHUNK_MAX_TOKENS}:{CHUNK_OVERLAP_TOKENS}"
+
+# Un mot très long compte pour plusieurs tokens, comme avec un tokenizer BPE
+TOKEN_RE = re.compile(r"\w{1,24}|[^\w\s]")
+SENTENCE_END = re.compile(r"[.!?…;:](?=[\"'»)\]]*\s)")
+PARAGRAPH_END = re.compile(r"\n[ \t]*\n")
+HEADING_START = re.compile(r"^[ \t]*(?:#{1,6}[ \t]|\d+(?:\.\d+)*[.)]?[ \t]+[A-ZÀ-Ý]|[A-ZÀ-Ý][A-ZÀ-Ý0-9 '’-]{3,80}$)", re.M)
+
+# Force des coupures, de la plus faible à la plus forte
+SENTENCE, PARAGRAPH, HEADING = 1, 2, 3
+
+def count_tokens(text):
+    """Nombre de tokens (approché) du texte"""
+    return sum(1 for _ in TOKEN_RE.finditer(text))
+
+def _token_starts(text):
+    return array("l", [match.start() for match in TOKEN_RE.finditer(text)])
+
+def _token_end(text, starts, index):
+    return TOKEN_RE.match(text, starts[index]).end()
+
+def _boundaries(text, starts):
+    """Pour chaque force k, indices triés des tokens précédés d'une coupure de force >= k"""
+    n = len(starts)
+    found = {}
+    for pattern, level, use_end in ((SENTENCE_END, SENTENCE, True), (PARAGRAPH_END, PARAGRAPH, True),
+                                    (HEADING_START, HEADING, False)):
+        indices, i = [], 0
+        for match in pattern.finditer(text):
+            # Les positions arrivent dans l'ordre : la recherche reprend là où la précédente s'est arrêtée
+            i = bisect_left(starts, match.end() if use_end else match.start(), i)
+            if 0 < i < n and (not indices or indices[-1] != i):
+                indices.append(i)
+        found[level] = indices
+    # Listes déjà triées : sorted() ne fait que fusionner les séquences (doublons sans effet sur la recherche)
+    return {
+        HEADING: found[HEADING],
+        PARAGRAPH: sorted(found[HEADING] + found[PARAGRAPH]),
+        SENTENCE: sorted(found[HEADING] + found[PARAGRAPH] + found[SENTENCE]),
+    }
+
+def chunk_token_ranges(text, max_tokens=CHUNK_MAX_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    """Découpe `text` ; retourne (débuts des tokens, [(premier_token, fin_exclue), ...])"""
+    max_tokens = max(1, max_tokens)
+    min_tokens = max(1, max_tokens // 2)
+    overlap = max(0, min(overlap, min_tokens - 1))  # garantit l'avancée de chaque chunk
+    starts = _token_starts(text)
+    n = len(starts)
+    if n == 0:
+        return starts, []
+    boundaries = _boundaries(text, starts)
+    # Un curseur par force de coupure : la fin de fenêtre ne fait qu'avancer, les curseurs aussi
+    cursors = {level: -1 for level in boundaries}
+
+    ranges, start = [], 0
+    while True:
+        end = min(start + max_tokens, n)
+        if end < n:
+            for level in (HEADING, PARAGRAPH, SENTENCE):
+                indices = boundaries[level]
+                cursor = cursors[level]
+                while cursor + 1 < len(indices) and indices[cursor + 1] <= end:
+                    cursor += 1
+                cursors[level] = cursor
+                if cursor >= 0 and indices[cursor] >= start + min_tokens:
+                    end = indices[cursor]
+                    break
+        ranges.append((start, end))
+        if end >= n:
+            return starts, ranges
+        start = max(end - overlap, start + 1)
+
+def chunk_spans(text, max_tokens=CHUNK_MAX_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    """Positions (début, fin) des chunks dans le texte"""
+    starts, ranges = chunk_token_ranges(text, max_tokens, overlap)
+    return [(starts[first], _token_end(text, starts, last - 1)) for first, last in ranges]
+
+def chunk_text(text, max_tokens=CHUNK_MAX_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    """Découpe le texte en chunks pour ChromaDB"""
+    return [text[start:end] for start, end in chunk_spans(text, max_tokens, overlap)]
+
+def iter_chunks(segments, max_tokens=CHUNK_MAX_TOKENS, overlap=CHUNK_OVERLAP_TOKENS, window_tokens=STREAM_WINDOW_TOKENS):
+    """Découpe en flux une suite de morceaux de texte (pages...), avec le même résultat que chunk_text
+    sur le texte complet : seuls les chunks entièrement décidés sont émis, le reste du tampon est
+    redécoupé avec la suite. Mémoire bornée à une fenêtre d'environ `window_tokens` tokens."""
+    window_chars = window_tokens * 6
+    margin = max_tokens + 64  # un chunk dépend de ses tokens et de la ligne suivante (titre en majuscules ≤ 80 caractères)
+    buffer, threshold = "", window_chars
+    for segment in segments:
+        buffer += segment
+        if len(buffer) < threshold:
+            continue
+        starts, ranges = chunk_token_ranges(buffer, max_tokens, overlap)
+        safe_until = len(starts) - margin
+        emitted = 0
+        for first, last in ranges:
+            if first + max_tokens > safe_until:
+                break
+            yield buffer[starts[first]:_token_end(buffer, starts, last - 1)]
+            emitted += 1
+        if emitted < len(ranges):
+            buffer = buffer[starts[ranges[emitted][0]]:]
+        else:
+            buffer = ""
+        # Le reste du tampon n'est redécoupé qu'après une nouvelle fenêtre de texte : travail linéaire
+        threshold = len(buffer) + window_chars
+    if buffer:
+        yield from chunk_text(buffer, max_tokens, overlap)
+
+def truncate_tokens(text, max_tokens):
+    """Début du texte limité à `max_tokens` tokens (coupé entre deux tokens)"""
+    if max_tokens <= 0:
+        return ""
+    for count, match in enumerate(TOKEN_RE.finditer(text), start=1):
+        if count == max_tokens:
+            return text[:match.end()]
+    return text
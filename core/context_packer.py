@@ -0,0 +1,79 @@
+import os
+
+from core.chunking import count_tokens, truncate_tokens
+
+# Assemblage du contexte documentaire envoyé à GPT-4 : les chunks consécutifs d'un même fichier
+# sont fusionnés sans leur recouvrement, puis les passages sont ajoutés par pertinence
+# jusqu'au budget de tokens.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_MIN_PASSAGE_TOKENS = 40     # en dessous, un passage tronqué n'apporte plus rien
+MAX_OVERLAP_CHARS = 4000            # recouvrement cherché dans la fin du chunk précédent
+TRUNCATION_MARK = " [...]"          # ajouté à un passage tronqué, compté dans le budget
+
+def merge_overlap(left, right):
+    """Concatène deux chunks consécutifs en retirant le plus long suffixe de `left` qui commence `right` ;
+    None s'ils ne se recouvrent pas (pas réellement voisins)"""
+    probe = right[:16]
+    if not probe:
+        return left
+    position = left.find(probe, max(0, len(left) - MAX_OVERLAP_CHARS))
+    while position != -1:
+        if right.startswith(left[position:]):
+            return left[:position] + right
+        position = left.find(probe, position + 1)
+    return None
+
+def _passages(hits):
+    """Regroupe les résultats par fichier et suites de chunk_index consécutifs qui se recouvrent :
+    [(rang, fichier, texte)]"""
+    by_file, passages, seen = {}, [], set()
+    for rank, hit in enumerate(hits):
+        if hit.get("id") is not None:
+            if hit["id"] in seen:
+                continue  # même chunk remonté deux fois
+            seen.add(hit["id"])
+        metadata = hit.get("metadata") or {}
+        if metadata.get("filename") is None or metadata.get("chunk_index") is None:
+            passages.append((rank, metadata.get("filename"), hit["document"]))
+        else:
+            by_file.setdefault(metadata["filename"], []).append((metadata["chunk_index"], rank, hit["document"]))
+    for filename, chunks in by_file.items():
+        chunks.sort()
+        run_rank, text, previous_index = None, None, None
+        for chunk_index, rank, document in chunks:
+            merged = merge_overlap(text, document) if text is not None and chunk_index == previous_index + 1 else None
+            if merged is not None:
+                text, run_rank = merged, min(run_rank, rank)
+            else:
+                if text is not None:
+                    passages.append((run_rank, filename, text))
+                run_rank, text = rank, document
+            previous_index = chunk_index
+        passages.append((run_rank, filename, text))
+    # Un passage est aussi pertinent que son meilleur chunk
+    return sorted(passages, key=lambda passage: passage[0])
+
+def pack_context(hits, budget=CONTEXT_TOKEN_BUDGET):
+    """Contexte à envoyer au LLM depuis des résultats classés par pertinence (voir core.retrieval).
+
+    Retourne (texte, infos) avec infos = {passages, tokens, raw_tokens, truncated, dropped} ;
+    raw_tokens compte les chunks bruts tels qu'ils étaient joints auparavant.
+    """
+    raw_tokens = sum(count_tokens(hit["document"]) for hit in hits)
+    parts, used, truncated, dropped = [], 0, 0, 0
+    for _, filename, text in _passages(hits):
+        header = f"[{filename}]\n" if filename else ""
+        available = budget - used - count_tokens(header)
+        tokens = count_tokens(text)
+        if tokens > available:
+            room = available - count_tokens(TRUNCATION_MARK)
+            if room < CONTEXT_MIN_PASSAGE_TOKENS:
+                dropped += 1
+                continue
+            text = truncate_tokens(text, room) + TRUNCATION_MARK
+            tokens = count_tokens(text)
+            truncated += 1
+        parts.append(header + text)
+        used += tokens + count_tokens(header)
+    info = {"passages": len(parts), "tokens": used, "raw_tokens": raw_tokens, "truncated": truncated, "dropped": dropped}
+    return "\n\n".join(parts), info
@@ -1,7 +1,226 @@
+import atexit
 import sqlite3
+import hashlib
 import os
+import queue
+import threading
+from contextlib import contextmanager
 
 DB_PATH = os.getenv("DB_PATH", "bdd_clients.db")
 
+# ==== POOL DE CONNEXIONS ====
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))            # connexions en lecture
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_POOL_WAIT = 30  # secondes d'attente max d'une connexion libre
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",          # lectures concurrentes pendant un commit
+    "PRAGMA synchronous = NORMAL",        # sûr en WAL, un fsync par checkpoint
+    "PRAGMA cache_size = -16000",         # 16 Mo de cache de pages
+    "PRAGMA mmap_size = 268435456",       # 256 Mo mappés en mémoire
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+]
+
+_readers = queue.LifoQueue()
+_readers_created = 0
+_writer = None
+_pool_lock = threading.Lock()
+_writer_lock = threading.RLock()
+_open_connections = set()
+_closed = False
+_migrated = False
+
+# Surveillance des écritures (caches de résultats) : connexion dédiée hors pool
+_monitor = {"conn": None, "inode": None}
+_monitor_lock = threading.Lock()
+_write_generation = 0
+
+# Schéma introspecté, invalidé quand PRAGMA schema_version (ou le fichier) change
+_schema_cache = {"key": None, "tables": {}, "fingerprint": None}
+
+def quote_identifier(name):
+    """Nom de table ou de colonne entre guillemets doubles, échappés"""
+    return '"' + name.replace('"', '""') + '"'
+
+def open_connection(readonly=False):
+    """Ouvre une connexion réglée (WAL, cache, mmap, busy_timeout) ; à fermer par l'appelant"""
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    """Connexion indépendante du pool (scripts) ; préférer read_connection / write_connection"""
+    return open_connection()
+
+def _ensure_migrated():
+    """Applique une fois par processus les migrations manquantes (index...) aux bases existantes"""
+    global _migrated
+    if _migrated or not DB_AUTO_MIGRATE:
+        return
+    with _writer_lock:
+        if _migrated:
+            return
+        _migrated = True
+        from core.migrations import apply_migrations  # import local : core.migrations utilise quote_identifier
+        conn = open_connection()
+        try:
+            apply_migrations(conn)
+        except sqlite3.Error as e:
+            print(f"⚠️ Migrations non appliquées : {e}")
+        finally:
+            conn.close()
+
+def _acquire_reader():
+    global _readers_created
+    try:
+        return _readers.get_nowait()
+    except queue.Empty:
+        pass
+    with _pool_lock:
+        if _closed:
+            raise sqlite3.ProgrammingError("Pool de connexions fermé")
+        if _readers_created < DB_POOL_SIZE:
+            _readers_created += 1
+            conn = open_connection(readonly=True)
+            _open_connections.add(conn)
+            return conn
+    return _readers.get(timeout=DB_POOL_WAIT)
+
+def _release_reader(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        if _closed:
+            conn.close()
+            return
+    _readers.put(conn)
+
+@contextmanager
+def read_connection():
+    """Emprunte une connexion en lecture seule au pool (plusieurs lecteurs en parallèle)"""
+    _ensure_migrated()
+    conn = _acquire_reader()
+    try:
+        yield conn
+    finally:
+        _release_reader(conn)
+
+@contextmanager
+def write_connection():
+    """Connexion d'écriture unique, sérialisée par un verrou ; commit à la sortie, rollback sur erreur"""
+    global _writer
+    _ensure_migrated()
+    with _writer_lock:
+        with _pool_lock:
+            if _closed:
+                raise sqlite3.ProgrammingError("Pool de connexions fermé")
+            if _writer is None:
+                _writer = open_connection()
+                _open_connections.add(_writer)
+        try:
+            yield _writer
+            if _writer.in_transaction:
+                _writer.commit()
+            _bump_write_generation()
+        except Exception:
+            if _writer.in_transaction:
+                _writer.rollback()
+            raise
+
+def _bump_write_generation():
+    global _write_generation
+    _write_generation += 1
+
+def get_data_version():
+    """Jeton qui change à chaque commit sur la base, quel que soit le processus ou la connexion.
+
+    PRAGMA data_version est lu sur une connexion qui n'écrit jamais : il bouge dès qu'une autre
+    connexion commit. Le numéro d'inode couvre une base recréée, le compteur local les écritures
+    faites via write_connection().
+    """
+    with _monitor_lock:
+        inode = os.stat(DB_PATH).st_ino
+        if _monitor["conn"] is None or _monitor["inode"] != inode:
+            if _monitor["conn"] is not None:
+                _monitor["conn"].close()
+            _monitor["conn"] = sqlite3.connect(DB_PATH, check_same_thread=False)
+            _monitor["inode"] = inode
+        version = _monitor["conn"].execute("PRAGMA data_version").fetchone()[0]
+    return (inode, version, _write_generation)
+
+def get_file_stamp():
+    """Empreinte des fichiers de la base (compteur de changements de l'en-tête, taille et date
+    de la base et du WAL), comparable d'un processus à l'autre"""
+    with open(DB_PATH, "rb") as f:
+        header = f.read(28)
+    change_counter = int.from_bytes(header[24:28], "big") if len(header) == 28 else 0
+    stamp = [change_counter]
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            stamp += [0, 0]
+            continue
+        # Un WAL vide (recréé à chaque ouverture) ne signale aucune écriture
+        stamp += [st.st_size, st.st_mtime_ns if st.st_size else 0]
+    return tuple(stamp)
+
+def close_all():
+    """Ferme toutes les connexions du pool (appelé automatiquement à la sortie du processus)"""
+    global _closed, _writer
+    with _writer_lock, _pool_lock:
+        _closed = True
+        for conn in list(_open_connections):
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _open_connections.clear()
+        _writer = None
+    with _monitor_lock:
+        if _monitor["conn"] is not None:
+            _monitor["conn"].close()
+            _monitor["conn"] = None
+
+atexit.register(close_all)
+
+def _load_schema():
+    """Relit le schéma via PRAGMA table_info si la base a changé depuis le dernier appel"""
+    with read_connection() as conn:
+        key = (os.stat(DB_PATH).st_ino, conn.execute("PRAGMA schema_version").fetchone()[0])
+        if key == _schema_cache["key"]:
+            return _schema_cache
+
+        rows = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master ORDER BY type, name"
+        ).fetchall()
+        tables = {}
+        for obj_type, name, _ in rows:
+            if obj_type == "table" and not name.startswith("sqlite_"):
+                info = conn.execute(f'PRAGMA table_info("{name}")').fetchall()
+                tables[name] = [{"name": col[1], "type": col[2]} for col in info]
+
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(repr(row).encode("utf-8"))
+    _schema_cache.update(key=key, tables=tables, fingerprint=digest.hexdigest()[:16])
+    return _schema_cache
+
+def get_schema():
+    """Tables de la base et leurs colonnes : {table: [{name, type}, ...]}"""
+    try:
+        return _load_schema()["tables"]
+    except (sqlite3.Error, OSError):
+        return {}
+
+def get_schema_fingerprint():
+    """Empreinte du schéma SQLite (tables, colonnes, index) pour invalider les caches"""
+    try:
+        return _load_schema()["fingerprint"]
+    except (sqlite3.Error, OSError):
+        return None
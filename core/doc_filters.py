@@ -0,0 +1,95 @@
+import os
+import re
+import unicodedata
+
+from core.doc_manifest import list_document_summaries
+
+# Filtres de métadonnées de la recherche documentaire, résolus en liste de fichiers via le manifeste
+# puis poussés dans le `where` de Chroma et dans l'index BM25.
+# Forme d'un filtre : {"filenames": [...], "file_types": ["pdf"], "year": 2024, "since": "2024-01-01", "until": "2024-12-31"}
+# (dates d'upload, toutes les clés sont optionnelles).
+FILE_TYPE_WORDS = {"pdf": "pdf", "pdfs": "pdf", "word": "docx", "docx": "docx", "txt": "txt"}
+DOCUMENT_WORDS = r"(?:fichier|document|rapport|pdf|docx|word|txt|note|etude|presentation)s?"
+# « dans le rapport HYBE », « selon le document newjeans_q3 »
+NAMED_DOCUMENT_RE = re.compile(rf"\b(?:dans|du|de|selon|d'apres)\s+(?:le |la |l'|les )?{DOCUMENT_WORDS}\s+([\w.-]{{2,}})")
+# « PDF de 2024 », « documents uploadés en 2023 »
+YEAR_RE = re.compile(rf"\b{DOCUMENT_WORDS}\s+(?:\w+\s+){{0,2}}?(?:de|en|du)\s+(20\d{{2}})\b")
+
+def _fold(text):
+    return unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+
+def _words(filename):
+    return re.sub(r"[\W_]+", " ", _fold(os.path.splitext(filename)[0])).split()
+
+def parse_filters(question, documents=None):
+    """Filtres déduits de la question (type de fichier, année d'upload, fichier nommé) ; {} si aucun"""
+    folded = _fold(question)
+    documents = list_document_summaries() if documents is None else documents
+    filters = {}
+
+    file_types = sorted({FILE_TYPE_WORDS[word] for word in re.findall(r"\w+", folded) if word in FILE_TYPE_WORDS})
+    if file_types:
+        filters["file_types"] = file_types
+    year = YEAR_RE.search(folded)
+    if year:
+        filters["year"] = int(year.group(1))
+
+    # Nom de fichier cité en entier (« rapport hybe 2024 » pour rapport_HYBE_2024.pdf)...
+    filenames = [
+        filename for filename in documents
+        if len(" ".join(_words(filename))) >= 3
+        and re.search(rf"\b{re.escape(' '.join(_words(filename)))}\b", folded)
+    ]
+    # ... ou désigné par un de ses mots après « dans le rapport », « selon le document »...
+    if not filenames:
+        for match in NAMED_DOCUMENT_RE.finditer(folded):
+            word = match.group(1).strip(".-")
+            filenames += [filename for filename in documents if word in _words(filename)]
+    if filenames:
+        filters["filenames"] = sorted(set(filenames))
+    return filters
+
+def resolve_filters(filters, documents=None):
+    """Fichiers du manifeste qui respectent tous les filtres"""
+    documents = list_document_summaries() if documents is None else documents
+    selected = []
+    for filename, entry in documents.items():
+        upload_date = entry.get("upload_date", "")
+        if filters.get("filenames") and filename not in filters["filenames"]:
+            continue
+        if filters.get("file_types") and entry.get("file_type") not in filters["file_types"]:
+            continue
+        if filters.get("year") and not upload_date.startswith(str(filters["year"])):
+            continue
+        if filters.get("since") and upload_date[:10] < filters["since"]:
+            continue
+        if filters.get("until") and upload_date[:10] > filters["until"]:
+            continue
+        selected.append(filename)
+    return sorted(selected)
+
+def resolve_scope(question, filters=None):
+    """Fichiers auxquels limiter la recherche, ou None pour toute la collection.
+
+    Les filtres explicites (interface) sont stricts : aucun fichier retenu → aucun résultat.
+    Ceux déduits de la question sont ignorés s'ils n'excluent rien ou s'ils excluent tout.
+    """
+    documents = list_document_summaries()
+    if filters:
+        return resolve_filters(filters, documents)
+    parsed = parse_filters(question, documents)
+    if not parsed:
+        return None
+    filenames = resolve_filters(parsed, documents)
+    if not filenames:
+        print(f"⚠️ Filtres {parsed} : aucun document correspondant, recherche sur toute la collection")
+        return None
+    if len(filenames) == len(documents):
+        return None
+    return filenames
+
+def build_where(filenames):
+    """Clause `where` Chroma limitant la recherche à ces fichiers"""
+    if len(filenames) == 1:
+        return {"filename": filenames[0]}
+    return {"filename": {"$in": list(filenames)}}
@@ -0,0 +1,90 @@
+import glob
+import hashlib
+import os
+import shelve
+import threading
+from datetime import datetime
+
+# Manifeste des documents indexés dans ChromaDB : fichier → empreinte, ids des chunks, date d'upload.
+# Rangé à côté de la base Chroma qu'il décrit.
+DOC_MANIFEST_PATH = os.getenv("DOC_MANIFEST_PATH", "chroma_db/manifest")
+
+CHUNK_ID_VERSION = 2  # 2 : ids propres à chaque fichier (avant : partagés entre fichiers de même texte)
+
+_lock = threading.Lock()
+_summaries = {"stamp": None, "value": {}}
+
+def content_hash(text):
+    """Empreinte SHA-256 d'un texte"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_id(chunk, filename):
+    """Id Chroma d'un chunk dérivé de son fichier et de son contenu : stable d'une version du fichier
+    à l'autre, et chaque fichier garde ses propres métadonnées (le cache d'embeddings évite de
+    recalculer un même texte présent dans deux fichiers)"""
+    return f"chunk_{content_hash(filename + chr(0) + chunk)[:32]}"
+
+def get_document(filename):
+    """Entrée du manifeste pour ce fichier, ou None"""
+    with _lock, shelve.open(DOC_MANIFEST_PATH) as db:
+        return db.get(filename)
+
+def iter_chunk_ids(exclude=None):
+    """(fichier, ids de ses chunks) pour chaque fichier du manifeste (sauf `exclude`), lus un à un"""
+    with _lock, shelve.open(DOC_MANIFEST_PATH) as db:
+        for filename in db.keys():
+            if filename != exclude:
+                yield filename, db[filename]["chunk_ids"]
+
+def referenced_ids(exclude=None):
+    """Ids de chunks utilisés par les fichiers du manifeste (sauf `exclude`)"""
+    ids = set()
+    for _, chunk_ids in iter_chunk_ids(exclude):
+        ids.update(chunk_ids)
+    return ids
+
+def record_document(filename, file_hash, chunk_ids, **extra):
+    """Enregistre (ou remplace) l'entrée d'un fichier après son indexation"""
+    entry = {
+        "file_hash": file_hash,
+        "chunk_ids": list(chunk_ids),
+        "chunk_count": len(chunk_ids),
+        "upload_date": datetime.now().isoformat(),
+        **extra,
+    }
+    with _lock, shelve.open(DOC_MANIFEST_PATH) as db:
+        db[filename] = entry
+    return entry
+
+def remove_document(filename):
+    """Retire un fichier du manifeste ; retourne son entrée (ou None)"""
+    with _lock, shelve.open(DOC_MANIFEST_PATH) as db:
+        return db.pop(filename, None)
+
+def list_documents():
+    """{fichier: entrée} pour tous les documents indexés"""
+    with _lock, shelve.open(DOC_MANIFEST_PATH) as db:
+        return dict(db)
+
+def clear_manifest():
+    """Vide le manifeste (collection Chroma supprimée ou recréée)"""
+    with _lock, shelve.open(DOC_MANIFEST_PATH) as db:
+        db.clear()
+
+def _stamp():
+    # Fichiers du shelve (suffixes selon le backend dbm) : taille et date de modification
+    return tuple(sorted((path, os.path.getsize(path), os.path.getmtime(path))
+                        for path in glob.glob(DOC_MANIFEST_PATH + "*")))
+
+def list_document_summaries():
+    """{fichier: entrée sans la liste des ids} ; relu seulement quand le manifeste a changé"""
+    with _lock:
+        stamp = _stamp()
+        if stamp != _summaries["stamp"]:
+            with shelve.open(DOC_MANIFEST_PATH) as db:
+                value = {
+                    filename: {key: item for key, item in entry.items() if key != "chunk_ids"}
+                    for filename, entry in db.items()
+                }
+            _summaries.update(stamp=_stamp(), value=value)
+        return dict(_summaries["value"])
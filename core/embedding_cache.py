@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+from array import array
+
+from core.doc_manifest import content_hash
+
+# Cache disque des embeddings : (empreinte du texte, modèle) → vecteur float32.
+# Survit à la reconstruction de chroma_db : réindexer ne recalcule rien.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID")  # sinon déduit de la fonction d'embedding
+
+_lock = threading.Lock()
+_conn = {"conn": None}
+_stats = {"hits": 0, "misses": 0}
+
+def _connection():
+    if _conn["conn"] is None:
+        conn = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "text_hash TEXT NOT NULL, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (text_hash, model)) WITHOUT ROWID"
+        )
+        _conn["conn"] = conn
+    return _conn["conn"]
+
+def model_id(embedding_function):
+    """Identifiant du modèle d'embedding (un changement de modèle invalide naturellement le cache)"""
+    if EMBEDDING_MODEL_ID:
+        return EMBEDDING_MODEL_ID
+    name = getattr(embedding_function, "model_name", None) or getattr(embedding_function, "MODEL_NAME", None)
+    return f"{type(embedding_function).__name__}:{name or 'default'}"
+
+def get_embeddings(text_hashes, model):
+    """{empreinte: vecteur} pour les empreintes déjà en cache"""
+    found = {}
+    unique = list(dict.fromkeys(text_hashes))
+    with _lock:
+        conn = _connection()
+        for i in range(0, len(unique), 500):  # limite de paramètres SQLite
+            part = unique[i:i + 500]
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({', '.join('?' * len(part))})",
+                [model, *part],
+            )
+            for text_hash, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[text_hash] = vector.tolist()
+    return found
+
+def put_embeddings(items, model):
+    """Enregistre des couples (empreinte, vecteur) en float32"""
+    rows = []
+    for text_hash, vector in items:
+        packed = array("f", [float(x) for x in vector])
+        rows.append((text_hash, model, len(packed), packed.tobytes()))
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+
+class CachedEmbeddingFunction:
+    """Enveloppe une fonction d'embedding Chroma : les textes déjà vus ne sont jamais recalculés"""
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.model = model_id(embedding_function)
+
+    def __call__(self, input):
+        texts = list(input)
+        hashes = [content_hash(text) for text in texts]
+        cached = get_embeddings(hashes, self.model)
+        missing = [i for i, text_hash in enumerate(hashes) if text_hash not in cached]
+        with _lock:
+            _stats["hits"] += len(texts) - len(missing)
+            _stats["misses"] += len(missing)
+        if missing:
+            computed = self.embedding_function([texts[i] for i in missing])
+            new_items = [(hashes[i], vector) for i, vector in zip(missing, computed)]
+            put_embeddings(new_items, self.model)
+            for text_hash, vector in new_items:
+                cached[text_hash] = [float(x) for x in vector]
+        return [cached[text_hash] for text_hash in hashes]
+
+def with_embedding_cache(embedding_function):
+    """Fonction d'embedding avec cache disque (ou telle quelle si le cache est désactivé)"""
+    if embedding_function is None or not EMBEDDING_CACHE_ENABLED:
+        return embedding_function
+    return CachedEmbeddingFunction(embedding_function)
+
+def get_embedding_function(collection):
+    """Fonction d'embedding de la collection (celle que Chroma utiliserait dans add() et query()),
+    avec cache disque ; None si elle n'est pas accessible"""
+    embedding_function = getattr(collection, "_embedding_function", None)
+    if embedding_function is None:
+        try:
+            from chromadb.utils import embedding_functions
+            embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        except Exception:
+            return None
+    return with_embedding_cache(embedding_function)
+
+def get_embedding_cache_stats():
+    """Compteurs du processus courant et nombre de vecteurs stockés"""
+    with _lock:
+        count = _connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return dict(_stats, vectors=count)
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Extraction en flux des documents uploadés : le texte est produit page par page (PDF),
+# par blocs de paragraphes (DOCX) ou de lignes (TXT), sans jamais construire le document entier
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))  # en dessous, extraction dans le processus
+TEXT_BLOCK_CHARS = 64 * 1024
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_TYPE = "text/plain"
+
+class ExtractionError(Exception):
+    """Document illisible : type non supporté, bibliothèque manquante..."""
+
+def file_sha256(uploaded_file):
+    """Empreinte SHA-256 du fichier uploadé, lue par blocs"""
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for block in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+# ==== PDF ====
+_worker_reader = {"reader": None}
+
+def _init_pdf_worker(path):
+    import PyPDF2
+    _worker_reader["reader"] = PyPDF2.PdfReader(path)
+
+def _extract_pdf_pages(page_range):
+    """Texte des pages [début, fin) ; exécuté dans un processus du pool"""
+    reader = _worker_reader["reader"]
+    return [(reader.pages[i].extract_text() or "") + "\n" for i in range(*page_range)]
+
+def _iter_pdf(uploaded_file):
+    import PyPDF2
+    uploaded_file.seek(0)
+    reader = PyPDF2.PdfReader(uploaded_file)
+    page_count = len(reader.pages)
+    if page_count < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1:
+        for page in reader.pages:
+            yield (page.extract_text() or "") + "\n"
+        return
+
+    # Gros PDF : pages extraites en parallèle, restituées dans l'ordre, au plus 2 lots d'avance par processus
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        for block in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+            tmp.write(block)
+    try:
+        ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count))
+                  for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+        # "spawn" : forker un processus multithreadé (Streamlit, worker d'ingestion) peut bloquer l'enfant
+        with ProcessPoolExecutor(max_workers=PDF_WORKERS, initializer=_init_pdf_worker, initargs=(tmp.name,),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = deque()
+            try:
+                for page_range in ranges:
+                    if len(pending) >= 2 * PDF_WORKERS:
+                        yield from pending.popleft().result()
+                    pending.append(pool.submit(_extract_pdf_pages, page_range))
+                while pending:
+                    yield from pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+    finally:
+        os.unlink(tmp.name)
+
+# ==== DOCX / TXT ====
+def _iter_docx(uploaded_file):
+    import docx
+    uploaded_file.seek(0)
+    document = docx.Document(uploaded_file)
+    block, size = [], 0
+    for paragraph in document.paragraphs:
+        block.append(paragraph.text + "\n")
+        size += len(paragraph.text) + 1
+        if size >= TEXT_BLOCK_CHARS:
+            yield "".join(block)
+            block, size = [], 0
+    if block:
+        yield "".join(block)
+
+def _iter_text(uploaded_file):
+    uploaded_file.seek(0)
+    reader = io.TextIOWrapper(uploaded_file, encoding="utf-8")
+    try:
+        for block in iter(lambda: reader.read(TEXT_BLOCK_CHARS), ""):
+            yield block
+    finally:
+        reader.detach()  # ne ferme pas le fichier uploadé
+
+def iter_document_text(uploaded_file):
+    """Générateur de morceaux de texte du document (pages, blocs de paragraphes ou de lignes).
+
+    Le type et les bibliothèques nécessaires sont vérifiés immédiatement : ExtractionError est
+    levée avant toute lecture si le document ne peut pas être traité.
+    """
+    if uploaded_file.type == TEXT_TYPE:
+        return _iter_text(uploaded_file)
+    if uploaded_file.type == PDF_TYPE:
+        try:
+            import PyPDF2
+        except ImportError:
+            raise ExtractionError("❌ Installez PyPDF2 pour lire les PDFs : pip install PyPDF2")
+        return _iter_pdf(uploaded_file)
+    if uploaded_file.type == DOCX_TYPE:
+        try:
+            import docx
+        except ImportError:
+            raise ExtractionError("❌ Installez python-docx pour lire les fichiers Word : pip install python-docx")
+        return _iter_docx(uploaded_file)
+    raise ExtractionError(f"❌ Type de fichier non supporté : {uploaded_file.type}")
+
+def estimate_segments(uploaded_file):
+    """Nombre approché de morceaux produits par iter_document_text (pages du PDF, blocs du texte) ;
+    None si inconnu (DOCX). Sert à estimer la progression d'une indexation."""
+    try:
+        if uploaded_file.type == PDF_TYPE:
+            import PyPDF2
+            uploaded_file.seek(0)
+            return len(PyPDF2.PdfReader(uploaded_file).pages)
+        if uploaded_file.type == TEXT_TYPE:
+            uploaded_file.seek(0, io.SEEK_END)
+            return max(1, -(-uploaded_file.tell() // TEXT_BLOCK_CHARS))
+    except Exception:
+        return None
+    finally:
+        uploaded_file.seek(0)
+    return None
@@ -1,12 +1,22 @@
 import openai
 import os
+import re
+import sqlite3
+import time
+import unicodedata
 from dotenv import load_dotenv
 
+from core.db import read_connection, get_schema, get_schema_fingerprint, quote_identifier
+from core.migrations import STATS_GROUP_TABLES, STATS_UNSPECIFIED
+from core.sql_cache import make_cache_key, get_cached_sql, set_cached_sql
+
 load_dotenv()
 client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def get_sql_from_gpt(user_query, conversation_history=None):
-    # Préparer l'historique de conversation
+GPT_SQL_MODEL = "gpt-4"
+
+def build_history_context(conversation_history):
+    """Formate la fenêtre d'historique envoyée au modèle (et utilisée dans la clé de cache)"""
     history_context = ""
     if conversation_history and len(conversation_history) > 1:
         recent_history = conversation_history[-6:]  # 3 derniers échanges
@@ -16,25 +26,321 @@ def get_sql_from_gpt(user_query, conversation_history=None):
             content = msg["content"][:150] + "..." if len(msg["content"]) > 150 else msg["content"]
             history_context += f"{role}: {content}\n"
         history_context += "=== FIN HISTORIQUE ===\n\n"
+    return history_context
 
-    prompt = f"""
-Tu es un assistant SQL pour une base SQLite contenant deux tables :
+def is_read_only_sql(sql):
+    """Vrai si toutes les requêtes sont des lectures (SELECT / WITH)"""
+    statements = [s.strip() for s in sql.split(';') if s.strip()]
+    return bool(statements) and all(s.lower().startswith(("select", "with")) for s in statements)
 
-1. `contacts` (10 colonnes) :
-   - Nom, Prénom, Email, Société, Domaine, Secteur d'activité, Poste, Linkedin, Téléphone, Commentaire
+# ==== FAST PATH : INTENTIONS FRÉQUENTES RECONNUES LOCALEMENT ====
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+KNOWN_VALUES_TTL = 60  # secondes
 
-2. `companies` (1 colonne) :
-   - Société
+CONTACT_COLUMNS = ["Nom", "Prénom", "Email", "Société", "Domaine", "Secteur d'activité",
+                   "Poste", "Linkedin", "Téléphone", "Commentaire"]
 
-{history_context}COMPORTEMENTS ATTENDUS :
+# Libellés utilisés dans les questions → colonne de `contacts`
+GROUP_BY_ALIASES = {
+    "secteur d'activite": "Secteur d'activité",
+    "secteurs d'activite": "Secteur d'activité",
+    "secteur": "Secteur d'activité",
+    "secteurs": "Secteur d'activité",
+    "societe": "Société",
+    "societes": "Société",
+    "entreprise": "Société",
+    "entreprises": "Société",
+    "domaine": "Domaine",
+    "domaines": "Domaine",
+    "poste": "Poste",
+    "postes": "Poste",
+    "fonction": "Poste",
+}
 
-1. Tu as accès à l'historique de conversation ci-dessus, utilise-le pour comprendre le contexte
-2. Si l'utilisateur fait référence à quelque chose de précédent, adapte ta requête
-3. Si l'utilisateur veut ajouter un contact, utilise `INSERT INTO`
-4. Si l'utilisateur donne une nouvelle info sur un contact existant, utilise `UPDATE contacts SET ... WHERE ...`
-5. Si c'est une recherche ou un affichage, utilise `SELECT`
+LISTING_CUES = re.compile(r"\b(contacts?|qui|liste[rz]?|montre[rz]?|affiche[rz]?|donne[rz]?|trouve[rz]?|personnes?|gens)\b")
+COUNT_CUES = re.compile(r"\b(combien|nombre|compte[rz]?|total)\b")
+TOTAL_RE = re.compile(
+    r"^(?:combien|nombre|total)(?:\s*(?:de|d'|des|y|a|a-t-il|ai-je|j'ai|avons-nous|au|en|total))*"
+    r"\s*(?P<table>contacts|entreprises|societes)(?:\s+(?:en base|dans la base|au total|enregistre\w*))?$"
+)
+# Questions qui dépendent de l'historique ou qui modifient des données : on laisse faire le LLM
+CONTEXT_CUES = re.compile(r"\b(ceux|celles|celui|celle|ces|eux|elles?|ils?|meme|precedent|precedente|aussi|plutot)\b")
+WRITE_CUES = re.compile(r"\b(modifie[rz]?|mets?|mettre|change[rz]?|remplace[rz]?|supprime[rz]?|efface[rz]?|retire[rz]?|update)\b")
+TOP_N = re.compile(r"\b(?:top|les|des)\s+(\d{1,3})\b")
+COMPANY_CUE = re.compile(r"\b(?:travaill\w*|bosse\w*|employ\w*|salari\w*|chez|contacts?\s+de|contacts?\s+d')\s*(?:chez|a|pour|de|d')?\s*(?P<value>[^?!.,;]+)")
+
+ADD_CONTACT = re.compile(
+    r"^\s*(?:ajoute[rz]?|cr[ée]{1,2}[rz]?|enregistre[rz]?|ins[eè]re[rz]?)\s+"
+    r"(?:(?:un|le|la|nouveau|nouvelle)\s+)*contact\s*:?\s*(?P<rest>.+?)\s*[.!]?\s*$",
+    re.IGNORECASE,
+)
+EMAIL_RE = re.compile(r"[\w.+-]+@(?P<domain>[\w-]+(?:\.[\w-]+)+)")
+LINKEDIN_RE = re.compile(r"https?://[^\s,;]*linkedin\.com[^\s,;]*", re.IGNORECASE)
+PHONE_RE = re.compile(r"(?:\+33\s?|0)\d(?:[\s.-]?\d{2}){4}")
+FIELD_RES = {
+    "Société": re.compile(r"\b(?:chez|soci[ée]t[ée]\s*:?)\s+(?P<value>[^,;]+)", re.IGNORECASE),
+    "Poste": re.compile(r"\b(?:poste\s*:?|en tant que|comme)\s+(?P<value>[^,;]+)", re.IGNORECASE),
+    "Secteur d'activité": re.compile(r"\bsecteur(?:\s+d'activit[ée])?\s*:?\s+(?P<value>[^,;]+)", re.IGNORECASE),
+}
+NAME_RE = re.compile(r"^(?P<first>[A-ZÀ-Ý][\w'-]*)\s+(?P<last>[A-ZÀ-Ý][\w'-]*)\b")
+
+# Mots sans contenu dans une question de liste ou de comptage : s'il reste autre chose une fois
+# ceux-ci, les indices et la valeur reconnue retirés, la question porte d'autres critères (poste,
+# champ vide...) et le fast path la laisse au LLM
+FILLER_WORDS = {
+    "le", "la", "les", "l", "de", "d", "des", "du", "un", "une", "au", "aux", "a", "en", "dans", "pour",
+    "est", "sont", "y", "il", "t", "ai", "je", "j", "avons", "nous", "moi", "me", "tous", "toutes", "tout",
+    "quels", "quelles", "quel", "quelle", "base", "enregistre", "enregistres", "total", "ce", "sur",
+    "secteur", "secteurs", "activite", "societe", "societes", "entreprise", "entreprises", "repartition",
+    "distribution", "top", "par",
+}
+FILLER_RE = re.compile(r"\b(?:travaill\w*|bosse\w*|employ\w*|salari\w*|chez|\d{1,3})\b")
+
+_known_values = {"loaded_at": 0.0, "sectors": {}, "companies": {}}
+
+def _fold(text):
+    """Minuscules sans accents, pour comparer les questions aux valeurs de la base"""
+    text = unicodedata.normalize("NFKD", text.replace("’", "'"))
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+def _sqlite_lower(value):
+    """Reproduit LOWER() de SQLite, qui ne convertit que les caractères ASCII"""
+    return "".join(c.lower() if c.isascii() else c for c in value)
+
+def quote_literal(value):
+    if value is None:
+        return "NULL"
+    return "'" + str(value).replace("'", "''") + "'"
+
+def render_sql(sql, params):
+    """Remplace les paramètres ? par des littéraux SQL correctement échappés"""
+    parts = sql.split("?")
+    if len(parts) - 1 != len(params):
+        raise ValueError("Nombre de paramètres incohérent")
+    rendered = parts[0]
+    for value, part in zip(params, parts[1:]):
+        rendered += quote_literal(value) + part
+    return rendered
+
+def _load_known_values():
+    """Valeurs distinctes des secteurs et sociétés, rafraîchies toutes les KNOWN_VALUES_TTL secondes"""
+    if time.time() - _known_values["loaded_at"] < KNOWN_VALUES_TTL:
+        return _known_values
+    sectors, companies = {}, {}
+    sector_source = 'SELECT DISTINCT "Secteur d\'activité" FROM contacts'
+    sector_table = STATS_GROUP_TABLES["Secteur d'activité"]
+    if sector_table in get_schema():
+        # Une ligne par secteur déjà calculée par les triggers (hors libellé des valeurs NULL)
+        sector_source = f"""SELECT "Secteur d'activité" FROM {sector_table} WHERE "Secteur d'activité" <> '{STATS_UNSPECIFIED}'"""
+    try:
+        with read_connection() as conn:
+            for (value,) in conn.execute(sector_source):
+                if value:
+                    sectors[_fold(value)] = value
+            for (value,) in conn.execute('SELECT DISTINCT "Société" FROM contacts UNION SELECT "Société" FROM companies'):
+                if value:
+                    companies[_fold(value)] = value
+    except sqlite3.Error:
+        pass
+    _known_values.update(loaded_at=time.time(), sectors=sectors, companies=companies)
+    return _known_values
+
+def _find_known_value(folded_text, values):
+    """Cherche une valeur connue (mot entier) dans la question, la plus longue d'abord"""
+    for folded_value in sorted(values, key=len, reverse=True):
+        if re.search(r"(?<!\w)" + re.escape(folded_value) + r"(?!\w)", folded_text):
+            return values[folded_value]
+    return None
+
+def _has_other_criteria(folded, *values):
+    """La question contient-elle autre chose que les indices, les mots vides et les valeurs reconnues ?"""
+    for value in values:
+        folded = re.sub(r"(?<!\w)" + re.escape(value) + r"(?!\w)", " ", folded)
+    for regex in (LISTING_CUES, COUNT_CUES, FILLER_RE):
+        folded = regex.sub(" ", folded)
+    return any(word not in FILLER_WORDS for word in re.findall(r"\w+", folded))
+
+def _match_group_by(folded):
+    match = re.search(r"\bpar\s+(?:(?:le|la|les|l')\s*)?(?P<label>[\w' ]+?)\s*$", folded)
+    if not match or not (COUNT_CUES.search(folded) or re.search(r"\b(repartition|distribution|top)\b", folded)):
+        return None
+    column = GROUP_BY_ALIASES.get(match.group("label"))
+    if not column or _has_other_criteria(folded[:match.start()]):
+        return None
+    col = quote_identifier(column)
+    if STATS_GROUP_TABLES.get(column) in get_schema():
+        # Répartition déjà agrégée par les triggers : O(groupes)
+        sql = f"SELECT {col}, Nombre_de_contacts FROM {STATS_GROUP_TABLES[column]} ORDER BY Nombre_de_contacts DESC"
+    else:
+        sql = (f"SELECT COALESCE({col}, '{STATS_UNSPECIFIED}') AS {col}, COUNT(*) AS Nombre_de_contacts "
+               f"FROM contacts GROUP BY 1 ORDER BY Nombre_de_contacts DESC")
+    top = TOP_N.search(folded)
+    if top:
+        sql += f" LIMIT {int(top.group(1))}"
+    return {"intent": "count_by", "sql": sql, "params": [], "confidence": 0.95}
+
+def _match_total(folded):
+    """Nombre total de contacts ou d'entreprises, lu dans stats_totaux"""
+    match = TOTAL_RE.match(folded)
+    if not match or "stats_totaux" not in get_schema():
+        return None
+    table = "contacts" if match.group("table").startswith("contact") else "companies"
+    label = "Nombre_de_contacts" if table == "contacts" else "Nombre_d_entreprises"
+    return {"intent": "total", "sql": f"SELECT total AS {label} FROM stats_totaux WHERE nom = ?",
+            "params": [table], "confidence": 0.95}
+
+def _match_filter(folded, known):
+    """Contacts d'un secteur ou d'une société (liste ou comptage)"""
+    sector = _find_known_value(folded, known["sectors"])
+    company = _find_known_value(folded, known["companies"])
+    company_cue = COMPANY_CUE.search(folded)
+
+    if sector and company:
+        return None  # Plusieurs critères : le LLM s'en charge
+    if sector:
+        column, value, confidence = "Secteur d'activité", sector, 0.9
+        if "secteur" in folded:
+            confidence = 0.95
+    elif company:
+        column, value, confidence = "Société", company, 0.9 if company_cue else 0.85
+    elif company_cue and "secteur" not in folded:
+        # Société inconnue de la base : recherche partielle, confiance faible
+        column, value, confidence = "Société", company_cue.group("value").strip(), 0.6
+    else:
+        return None
+    if _has_other_criteria(folded, _fold(value)):
+        return None  # poste, champ vide, autre condition... : le LLM garde tous les critères
+
+    col = quote_identifier(column)
+    if confidence >= 0.8:
+        where, params = f"LOWER({col}) = ?", [_sqlite_lower(value)]
+    else:
+        where, params = f"LOWER({col}) LIKE ?", ["%" + _sqlite_lower(value) + "%"]
+    if COUNT_CUES.search(folded):
+        return {"intent": "count_filter", "sql": f"SELECT COUNT(*) AS Nombre_de_contacts FROM contacts WHERE {where}",
+                "params": params, "confidence": confidence}
+    if not LISTING_CUES.search(folded):
+        return None
+    return {"intent": "list_filter", "sql": f"SELECT * FROM contacts WHERE {where}",
+            "params": params, "confidence": confidence}
+
+def _match_add_contact(user_query, known):
+    match = ADD_CONTACT.match(user_query)
+    if not match:
+        return None
+    rest = match.group("rest")
+    values = dict.fromkeys(CONTACT_COLUMNS)
+
+    name = NAME_RE.match(rest)
+    if not name:
+        return None
+    values["Prénom"], values["Nom"] = name.group("first"), name.group("last")
+    rest = rest[name.end():]
+
+    email = EMAIL_RE.search(rest)
+    if email:
+        values["Email"], values["Domaine"] = email.group(0), email.group("domain")
+        rest = rest.replace(email.group(0), " ")
+    linkedin = LINKEDIN_RE.search(rest)
+    if linkedin:
+        values["Linkedin"] = linkedin.group(0)
+        rest = rest.replace(linkedin.group(0), " ")
+    phone = PHONE_RE.search(rest)
+    if phone:
+        values["Téléphone"] = phone.group(0)
+        rest = rest.replace(phone.group(0), " ")
+    for column, regex in FIELD_RES.items():
+        field = regex.search(rest)
+        if field:
+            values[column] = field.group("value").strip()
+            rest = rest.replace(field.group(0), " ")
+
+    # Tout ce qui n'a pas été reconnu (commentaires, marques...) est mieux traité par le LLM
+    leftover = re.sub(r"\b(email|mail|t[ée]l[ée]phone|tel|linkedin|et|avec|,|;|:)\b|[,;:]", " ", rest, flags=re.IGNORECASE)
+    confidence = 0.9 if not leftover.strip() else 0.5
+
+    columns = ", ".join(quote_identifier(c) for c in CONTACT_COLUMNS)
+    statements = [f"INSERT INTO contacts ({columns}) VALUES ({', '.join('?' * len(CONTACT_COLUMNS))})"]
+    params = [values[c] for c in CONTACT_COLUMNS]
+    if values["Société"] and _fold(values["Société"]) not in known["companies"]:
+        statements.insert(0, 'INSERT INTO companies ("Société") VALUES (?)')
+        params.insert(0, values["Société"])
+    return {"intent": "add_contact", "sql": "; ".join(statements), "params": params, "confidence": confidence}
+
+# Recherche par mots-clés : table plein texte contacts_fts (migration 2)
+KEYWORD_CUES = re.compile(r"\b(ambassad\w*|egerie\w*|mots?[- ]cles?|recherche[rz]?|cherche[rz]?)\b")
+FTS_STOPWORDS = {
+    "le", "la", "les", "l", "des", "de", "du", "d", "un", "une", "et", "ou", "en", "a", "au", "aux",
+    "qui", "que", "quels", "quelles", "quel", "quelle", "sont", "est", "pour", "avec", "dans", "sur",
+    "contact", "contacts", "personne", "personnes", "montre", "affiche", "liste", "donne", "trouve",
+    "cherche", "recherche", "mot", "mots", "cle", "cles", "moi", "nous", "tous", "toutes",
+}
+
+def build_fts_query(text):
+    """Transforme une question en requête FTS5 : mots significatifs, au singulier, en préfixe"""
+    terms = []
+    for word in re.findall(r"\w+", _fold(text)):
+        if word in FTS_STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word.endswith(("s", "x")):
+            word = word[:-1]
+        terms.append(f'"{word}"*')
+    return " ".join(terms)
+
+def _match_keyword_search(folded):
+    if "contacts_fts" not in get_schema() or not KEYWORD_CUES.search(folded):
+        return None
+    fts_query = build_fts_query(folded)
+    if not fts_query:
+        return None
+    sql = ("SELECT contacts.* FROM contacts JOIN contacts_fts ON contacts_fts.rowid = contacts.rowid "
+           "WHERE contacts_fts MATCH ? ORDER BY contacts_fts.rank")
+    # Au moins deux termes (ex. "ambassadeur" + marque) : la recherche est assez précise
+    confidence = 0.85 if len(fts_query.split()) >= 2 else 0.7
+    return {"intent": "keyword_search", "sql": sql, "params": [fts_query], "confidence": confidence}
+
+def match_intent(user_query):
+    """Reconnaît localement les demandes fréquentes et retourne une SQL paramétrée.
+
+    Retourne un dict {intent, sql, params, confidence} ou None si aucune intention n'est reconnue.
+    """
+    folded = _fold(user_query).strip().rstrip(" ?!.")
+    folded = re.sub(r"\s+", " ", folded)
+    known = _load_known_values()
+
+    add_contact = _match_add_contact(user_query.strip(), known)
+    if add_contact:
+        return add_contact
+    if CONTEXT_CUES.search(folded) or WRITE_CUES.search(folded):
+        return None
+    return (_match_group_by(folded) or _match_total(folded) or _match_filter(folded, known)
+            or _match_keyword_search(folded))
+
+# ==== CONSTRUCTION DU PROMPT ====
+PROMPT_VERSION = "6"
+
+# Tables exposées au modèle (les tables techniques de la base ne sont pas décrites)
+PROMPT_TABLES = ["contacts", "companies"]
+
+# Colonne → mots de la question qui la désignent (comparés sans accents)
+COLUMN_ALIASES = {
+    "Nom": ["nom", "noms", "appelle"],
+    "Prénom": ["prenom", "prenoms"],
+    "Email": ["email", "emails", "mail", "mails", "adresse"],
+    "Société": ["societe", "societes", "entreprise", "entreprises", "chez", "boite"],
+    "Domaine": ["domaine", "domaines", "site"],
+    "Secteur d'activité": ["secteur", "secteurs", "activite", "industrie"],
+    "Poste": ["poste", "postes", "fonction", "metier", "role"],
+    "Linkedin": ["linkedin", "profil"],
+    "Téléphone": ["telephone", "tel", "numero", "portable"],
+    "Commentaire": ["commentaire", "commentaires", "ambassadeur", "ambassadrice", "egerie", "marque", "marques"],
+}
+# Colonnes toujours utiles pour identifier un contact dans un résultat
+IDENTITY_COLUMNS = ["Nom", "Prénom", "Société"]
 
-⚠️ INSTRUCTIONS CRITIQUES :
+INSERT_CUES = re.compile(r"\b(ajoute[rz]?|cr[e]{1,2}[rz]?|enregistre[rz]?|insere[rz]?|nouveau|nouvelle)\b")
+
+RULES_OUTPUT = """⚠️ INSTRUCTIONS CRITIQUES :
 - Ne retourne QUE les requêtes SQL, rien d'autre
 - PAS de commentaires, PAS d'explications, PAS de texte
 - Maximum 3 requêtes si nécessaire (séparées par des points-virgules)
@@ -44,36 +350,180 @@ Tu es un assistant SQL pour une base SQLite contenant deux tables :
 - Pour les noms de colonnes avec espaces : utilise des guillemets doubles "Secteur d'activité"
 - Pour les valeurs contenant des apostrophes : remplace les apostrophes par deux apostrophes simples
 - Exemple : "s'appelle" devient "s''appelle" dans SQL
+"""
+
+RULES_HISTORY = """1. Tu as accès à l'historique de conversation ci-dessus, utilise-le pour comprendre le contexte
+2. Si l'utilisateur fait référence à quelque chose de précédent, adapte ta requête
+"""
 
-📝 STRUCTURE OBLIGATOIRE POUR INSERT :
-- Pour INSERT INTO contacts : TOUJOURS spécifier les 10 colonnes dans l'ordre
+RULES_BY_OPERATION = {
+    "insert": "- L'utilisateur veut ajouter un contact : utilise `INSERT INTO`\n",
+    "update": "- L'utilisateur donne une nouvelle info sur un contact existant : utilise `UPDATE contacts SET ... WHERE ...`\n",
+    "select": "- C'est une recherche ou un affichage : utilise `SELECT`\n",
+    "aggregate": "- C'est un comptage ou une répartition : utilise `SELECT ... COUNT(*) ... GROUP BY`\n",
+}
+
+RULES_INSERT = """📝 STRUCTURE OBLIGATOIRE POUR INSERT :
+- Pour INSERT INTO contacts : TOUJOURS spécifier les {n} colonnes dans l'ordre
 - Utiliser NULL pour les valeurs manquantes
-- Format : INSERT INTO contacts (Nom, Prénom, Email, Société, Domaine, "Secteur d'activité", Poste, Linkedin, Téléphone, Commentaire) VALUES (...)
+- Format : INSERT INTO contacts ({columns}) VALUES (...)
+"""
 
-🔍 RECHERCHE INSENSIBLE À LA CASSE :
-- Pour les recherches sur des champs textuels (ex : "Secteur d'activité", "Domaine", "Poste"), génère des requêtes insensibles à la casse en utilisant LOWER(colonne) = 'valeur' ou LOWER(colonne) LIKE '%valeur%'.
-- Exemple : SELECT * FROM contacts WHERE LOWER("Secteur d'activité") = 'finance'
-- Pour une recherche partielle : SELECT * FROM contacts WHERE LOWER("Secteur d'activité") LIKE '%finance%'
+RULES_AGGREGATES = """📊 TABLES DE SYNTHÈSE (déjà agrégées, à jour en permanence) :
+- stats_totaux (nom, total) : nom = 'contacts' ou 'companies'
+{tables}
+- Pour un total ou une répartition SANS autre filtre, lis ces tables au lieu de COUNT(*) sur contacts (les NULL y sont comptés sous '{unspecified}')
+- Avec un filtre (autre secteur, société, poste...), utilise COUNT(*) ... GROUP BY sur contacts
+"""
 
-🎯 FORMAT DES COMMENTAIRES :
+RULES_CASE_INSENSITIVE = """🔍 RECHERCHE INSENSIBLE À LA CASSE :
+- Pour les recherches sur des champs textuels, génère des requêtes insensibles à la casse en utilisant LOWER(colonne) = 'valeur' ou LOWER(colonne) LIKE '%valeur%'.
+- Privilégie LOWER(colonne) = 'valeur' quand la valeur exacte est connue, puis LOWER(colonne) LIKE 'valeur%' (début de valeur) ; réserve LIKE '%valeur%' aux recherches partielles.
+"""
+
+RULES_FULLTEXT = """🔎 RECHERCHE PAR MOTS-CLÉS :
+- Pour chercher des mots dans Nom, Prénom, Société, Poste, Commentaire ou "Secteur d'activité" (marques, ambassadeurs, événements...), utilise l'index plein texte `contacts_fts` avec MATCH plutôt que LIKE '%...%'
+- Exemple : SELECT contacts.* FROM contacts JOIN contacts_fts ON contacts_fts.rowid = contacts.rowid WHERE contacts_fts MATCH '"ambassadeur"* "dior"*' ORDER BY contacts_fts.rank
+"""
+
+RULES_COMMENTS = """🎯 FORMAT DES COMMENTAIRES :
 - Pour les ambassadeurs/égéries : utilise "Ambassadeur [Marque]" ou "Égérie [Marque]"
 - Pour plusieurs marques : sépare par des virgules "Ambassadeur [Marque1], [Marque2]"
-- Exemples :
-  * "Égérie Dior" (pour une égérie)
-  * "Ambassadeur Louis Vuitton" (pour un ambassadeur)
-  * "Ambassadeur Yves Saint Laurent, Burberry" (pour plusieurs marques)
+- Exemples : "Égérie Dior", "Ambassadeur Louis Vuitton", "Ambassadeur Yves Saint Laurent, Burberry"
+"""
+
+EXAMPLES_BY_OPERATION = {
+    "insert": [
+        "INSERT INTO companies (Société) VALUES ('NewJeans');",
+        "INSERT INTO contacts (Nom, Prénom, Email, Société, Domaine, \"Secteur d'activité\", Poste, Linkedin, Téléphone, Commentaire) VALUES ('Pham', 'Hanni', 'hanni.pham@hybe.com', 'NewJeans', NULL, 'Musique', 'Chanteuse', 'https://in.linkedin.com/in/hanni-pham', '07 09 23 02 22', 'Ambassadeur Burberry, Gucci');",
+    ],
+    "update": [
+        "UPDATE contacts SET Poste = 'CEO' WHERE LOWER(Nom) = 'pham' AND LOWER(Prénom) = 'hanni';",
+    ],
+    "select": [
+        "SELECT * FROM contacts WHERE LOWER(\"Secteur d'activité\") = 'finance';",
+        "SELECT * FROM contacts WHERE LOWER(\"Secteur d'activité\") LIKE '%finance%';",
+    ],
+    "aggregate": [
+        "SELECT COALESCE(\"Secteur d'activité\", 'Non spécifié') AS \"Secteur d'activité\", COUNT(*) AS Nombre_de_contacts FROM contacts GROUP BY 1 ORDER BY Nombre_de_contacts DESC;",
+    ],
+}
+
+def detect_operation(user_query):
+    """Type de requête attendu : insert, update, aggregate ou select"""
+    folded = _fold(user_query)
+    if INSERT_CUES.search(folded) and "contact" in folded:
+        return "insert"
+    if WRITE_CUES.search(folded):
+        return "update"
+    if COUNT_CUES.search(folded) or re.search(r"\b(repartition|distribution|top|par)\b", folded):
+        return "aggregate"
+    return "select"
+
+def select_columns(user_query, columns, operation, has_history):
+    """Colonnes de `contacts` à décrire dans le prompt : toutes pour les écritures,
+    sinon celles citées dans la question (plus les colonnes d'identification)"""
+    if operation in ("insert", "update") or has_history:
+        return columns
+    folded = _fold(user_query)
+    words = set(re.findall(r"[\w']+", folded))
+    mentioned = [c for c in columns if words & set(COLUMN_ALIASES.get(c, [_fold(c)]))]
+    # Une valeur connue citée sans le nom de sa colonne ("les contacts dans la finance")
+    known = _load_known_values()
+    if _find_known_value(folded, known["sectors"]):
+        mentioned.append("Secteur d'activité")
+    if _find_known_value(folded, known["companies"]):
+        mentioned.append("Société")
+    if not mentioned:
+        return columns
+    return [c for c in columns if c in mentioned or c in IDENTITY_COLUMNS]
+
+def build_prompt(user_query, history_context=""):
+    """Compile le prompt à partir du schéma réel et des règles utiles à la demande"""
+    schema = get_schema()
+    operation = detect_operation(user_query)
+    has_history = bool(history_context)
+    # Les entités citées dans les derniers échanges comptent aussi (« et leurs entreprises ? »)
+    folded = _fold(f"{history_context}\n{user_query}")
 
+    tables = [t for t in PROMPT_TABLES if t in schema]
+    if "companies" in tables and operation != "insert" and not re.search(r"\b(entreprises?|societes?|companies)\b", folded):
+        tables.remove("companies")
+
+    schema_lines = []
+    for i, table in enumerate(tables, 1):
+        columns = [c["name"] for c in schema[table]]
+        if table == "contacts":
+            shown = select_columns(user_query, columns, operation, has_history)
+            label = f"{len(columns)} colonnes" if shown == columns else f"{len(shown)} colonnes utiles sur {len(columns)}"
+        else:
+            shown, label = columns, f"{len(columns)} colonne{'s' if len(columns) > 1 else ''}"
+        schema_lines.append(f"{i}. `{table}` ({label}) :\n   - {', '.join(shown)}")
+    schema_text = "\n\n".join(schema_lines)
+
+    behaviors = RULES_HISTORY if has_history else ""
+    if has_history:
+        # Avec un historique, la nature de la demande peut changer : on garde toutes les consignes
+        behaviors += "".join(RULES_BY_OPERATION.values())
+    else:
+        behaviors += RULES_BY_OPERATION[operation]
+
+    sections = [RULES_OUTPUT]
+    operations = set(RULES_BY_OPERATION) if has_history else {operation}
+    if "insert" in operations and "contacts" in schema:
+        contact_columns = [c["name"] for c in schema["contacts"]]
+        quoted = ", ".join(f'"{c}"' if " " in c else c for c in contact_columns)
+        sections.append(RULES_INSERT.format(n=len(contact_columns), columns=quoted))
+    stats_tables = {c: t for c, t in STATS_GROUP_TABLES.items() if t in schema}
+    if "aggregate" in operations and "stats_totaux" in schema and stats_tables:
+        lines = "\n".join(f'- {t} ("{c}", Nombre_de_contacts)' for c, t in stats_tables.items())
+        sections.append(RULES_AGGREGATES.format(tables=lines, unspecified=STATS_UNSPECIFIED))
+    if operations & {"select", "aggregate", "update"}:
+        sections.append(RULES_CASE_INSENSITIVE)
+    if "select" in operations and "contacts_fts" in schema:
+        sections.append(RULES_FULLTEXT)
+    if operations & {"insert", "update"} or re.search(r"\b(ambassad\w*|egerie\w*|commentaires?|marques?)\b", folded):
+        sections.append(RULES_COMMENTS)
+
+    examples = [e for op in RULES_BY_OPERATION if op in operations for e in EXAMPLES_BY_OPERATION[op]]
+    examples_text = "\n".join(f"- {e}" for e in examples)
+
+    return f"""
+Tu es un assistant SQL pour une base SQLite contenant {len(tables)} table{'s' if len(tables) > 1 else ''} :
+
+{schema_text}
+
+{history_context}COMPORTEMENTS ATTENDUS :
+{behaviors}
+{chr(10).join(sections)}
 📝 EXEMPLES CORRECTS :
-- INSERT INTO companies (Société) VALUES ('NewJeans');
-- INSERT INTO contacts (Nom, Prénom, Email, Société, Domaine, "Secteur d'activité", Poste, Linkedin, Téléphone, Commentaire) VALUES ('Pham', 'Hanni', 'hanni.pham@hybe.com', 'NewJeans', NULL, 'Musique', 'Chanteuse', 'https://in.linkedin.com/in/hanni-pham', '07 09 23 02 22', 'Ambassadeur Burberry, Gucci');
-- SELECT * FROM contacts WHERE LOWER("Secteur d'activité") = 'finance';
-- SELECT * FROM contacts WHERE LOWER("Secteur d'activité") LIKE '%finance%';
+{examples_text}
 
 Requête utilisateur :
 \"\"\"{user_query}\"\"\"
 """
+
+def get_sql_from_gpt(user_query, conversation_history=None):
+    # Fast path : intention reconnue localement, pas d'appel réseau
+    intent = match_intent(user_query)
+    if intent and intent["confidence"] >= INTENT_CONFIDENCE_THRESHOLD:
+        return render_sql(intent["sql"], intent["params"])
+
+    # Préparer l'historique de conversation
+    history_context = build_history_context(conversation_history)
+
+    # Cache persistant : temperature=0, la même question donne la même SQL
+    schema_fingerprint = get_schema_fingerprint()
+    cache_key = None
+    if schema_fingerprint:
+        cache_key = make_cache_key(user_query, history_context, schema_fingerprint, f"{GPT_SQL_MODEL}:{PROMPT_VERSION}")
+        cached_sql = get_cached_sql(cache_key)
+        if cached_sql is not None:
+            return cached_sql
+
+    prompt = build_prompt(user_query, history_context)
     response = client.chat.completions.create(
-        model="gpt-4",
+        model=GPT_SQL_MODEL,
         messages=[{"role": "user", "content": prompt}],
         temperature=0
     )
@@ -96,5 +546,9 @@ Requête utilisateur :
             sql_lines.append(line)
     
     cleaned_sql = ' '.join(sql_lines)
-    
+
+    # On ne met en cache que les lectures : rejouer un INSERT n'est pas anodin
+    if cache_key and is_read_only_sql(cleaned_sql):
+        set_cached_sql(cache_key, cleaned_sql)
+
     return cleaned_sql
@@ -0,0 +1,72 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from core.embedding_cache import get_embedding_function
+from core.lexical_index import index_chunks
+
+# Moteur d'ingestion : embeddings calculés par lots sur un pool de threads, écritures Chroma
+# sérialisées dans le thread appelant, nombre de lots en vol borné (backpressure)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))   # chunks par appel d'embedding
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "8"))  # lots embeddés ou en cours, pas encore écrits
+
+def _embed_batch(embedding_function, batch):
+    ids, documents, metadatas = batch
+    embeddings = embedding_function(documents) if embedding_function is not None else None
+    return ids, documents, metadatas, embeddings
+
+def ingest_chunks(collection, ids, documents, metadatas, batch_size=INGEST_BATCH_SIZE,
+                  workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING, progress_callback=None):
+    """Embedde et écrit des chunks dans la collection, lot par lot.
+
+    Chaque lot est écrit dès qu'il est prêt : une ingestion interrompue garde les lots déjà
+    écrits et, les ids dérivant du contenu, une nouvelle ingestion ne traite que les manquants.
+    progress_callback(done, total, chunks_per_sec) est appelé après chaque lot écrit.
+    Retourne les statistiques : {chunks, batches, seconds, chunks_per_sec}.
+    """
+    total = len(ids)
+    batches = [
+        (ids[i:i + batch_size], documents[i:i + batch_size], metadatas[i:i + batch_size])
+        for i in range(0, total, batch_size)
+    ]
+    embedding_function = get_embedding_function(collection)
+    start = time.perf_counter()
+    done = 0
+
+    def write(result):
+        nonlocal done
+        batch_ids, batch_documents, batch_metadatas, embeddings = result
+        if embeddings is not None:
+            collection.add(ids=batch_ids, documents=batch_documents, metadatas=batch_metadatas, embeddings=embeddings)
+        else:
+            collection.add(ids=batch_ids, documents=batch_documents, metadatas=batch_metadatas)
+        index_chunks(batch_ids, batch_documents, batch_metadatas)  # index BM25 tenu à jour avec la collection
+        done += len(batch_ids)
+        if progress_callback:
+            elapsed = time.perf_counter() - start
+            progress_callback(done, total, done / elapsed if elapsed else 0.0)
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingestion") as pool:
+        try:
+            for batch in batches:
+                # Backpressure : pas plus de max_pending lots en mémoire avant écriture
+                while len(pending) >= max(1, max_pending):
+                    write(pending.popleft().result())
+                pending.append(pool.submit(_embed_batch, embedding_function, batch))
+            while pending:
+                write(pending.popleft().result())
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    seconds = time.perf_counter() - start
+    return {
+        "chunks": total,
+        "batches": len(batches),
+        "seconds": seconds,
+        "chunks_per_sec": total / seconds if seconds else 0.0,
+    }
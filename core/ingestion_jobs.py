@@ -0,0 +1,291 @@
+import io
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from core.extraction import iter_document_text, file_sha256, estimate_segments
+
+# File d'ingestion persistante : les fichiers uploadés sont copiés sur disque et indexés par un
+# thread de fond, la page Streamlit reste utilisable pendant l'indexation. Les jobs survivent
+# à un redémarrage (un job « running » sans signe de vie est remis en file).
+INGEST_JOBS_PATH = os.getenv("INGEST_JOBS_PATH", "chroma_db/jobs.db")
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "chroma_db/uploads")
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "1.0"))
+INGEST_IDLE_SECONDS = float(os.getenv("INGEST_IDLE_SECONDS", "30"))    # le worker s'arrête après ce délai sans job
+INGEST_STALE_SECONDS = float(os.getenv("INGEST_STALE_SECONDS", "120"))  # job « running » abandonné
+INGEST_JOB_RETENTION = float(os.getenv("INGEST_JOB_RETENTION", str(7 * 24 * 3600)))  # jobs terminés conservés (s)
+PROGRESS_INTERVAL = 0.5  # secondes entre deux écritures de progression
+HEARTBEAT_INTERVAL = INGEST_STALE_SECONDS / 4  # battement de cœur même sans progression (longue extraction)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_worker_lock = threading.Lock()
+_worker = {"thread": None}
+
+class StoredUpload(io.FileIO):
+    """Fichier de la file relu comme un fichier uploadé Streamlit (attribut `type`)"""
+
+    def __init__(self, path, mime_type):
+        super().__init__(path, "rb")
+        self.type = mime_type
+
+def _connect():
+    directory = os.path.dirname(INGEST_JOBS_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(INGEST_JOBS_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            path TEXT NOT NULL,
+            mime_type TEXT,
+            file_hash TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            segments_done INTEGER NOT NULL DEFAULT 0,
+            segments_total INTEGER,
+            chunks_done INTEGER NOT NULL DEFAULT 0,
+            chunks_per_sec REAL,
+            error TEXT,
+            created_at TEXT,
+            started_at REAL,
+            finished_at REAL,
+            heartbeat REAL
+        )"""
+    )
+    return conn
+
+def _update(job_id, **fields):
+    conn = _connect()
+    try:
+        with conn:
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+    finally:
+        conn.close()
+
+# ==== SOUMISSION ====
+def submit_upload(uploaded_file):
+    """Met un fichier uploadé en file d'indexation ; retourne l'id du job.
+
+    Lève ExtractionError tout de suite si le type ou les bibliothèques ne permettent pas de le lire.
+    Un même fichier déjà en attente ou en cours n'est pas soumis deux fois.
+    """
+    iter_document_text(uploaded_file)  # validation immédiate, le générateur n'est pas consommé
+    file_hash = file_sha256(uploaded_file)
+    clear_finished_jobs(older_than=INGEST_JOB_RETENTION)
+    conn = _connect()
+    try:
+        existing = conn.execute(
+            "SELECT id FROM jobs WHERE filename = ? AND file_hash = ? AND status IN (?, ?)",
+            (uploaded_file.name, file_hash, *ACTIVE_STATUSES),
+        ).fetchone()
+        if existing:
+            return existing["id"]
+
+        # Copie sur disque par blocs : le job ne dépend plus de la session Streamlit
+        os.makedirs(INGEST_SPOOL_DIR, exist_ok=True)
+        path = os.path.join(INGEST_SPOOL_DIR, file_hash + os.path.splitext(uploaded_file.name)[1].lower())
+        if not os.path.exists(path):
+            uploaded_file.seek(0)
+            with open(path + ".part", "wb") as spool:
+                for block in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+                    spool.write(block)
+            os.replace(path + ".part", path)
+            uploaded_file.seek(0)
+
+        with conn:
+            job_id = conn.execute(
+                "INSERT INTO jobs (filename, path, mime_type, file_hash, segments_total, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (uploaded_file.name, path, uploaded_file.type, file_hash, estimate_segments(uploaded_file),
+                 datetime.now().isoformat()),
+            ).lastrowid
+    finally:
+        conn.close()
+    ensure_worker()
+    return job_id
+
+# ==== WORKER ====
+def _has_pending_jobs():
+    """Un job attend (ou a été abandonné par un processus arrêté)"""
+    conn = _connect()
+    try:
+        return conn.execute(
+            "SELECT 1 FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?) LIMIT 1",
+            (time.time() - INGEST_STALE_SECONDS,),
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+def _claim_job():
+    """Prend le plus ancien job en attente (atomique entre processus) ; None s'il n'y en a pas"""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat < ?",
+            (now - INGEST_STALE_SECONDS,),
+        )
+        job = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if job:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat = ?, segments_done = 0, "
+                "chunks_done = 0, error = NULL WHERE id = ?",
+                (now, now, job["id"]),
+            )
+        conn.commit()
+        return dict(job) if job else None
+    finally:
+        conn.close()
+
+def _heartbeat_loop(job_id, stop):
+    """Tient le job pour vivant tant qu'il tourne, même quand un segment met longtemps à être extrait"""
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            _update(job_id, heartbeat=time.time())
+        except sqlite3.Error as e:
+            print(f"⚠️ Battement de cœur du job {job_id} non enregistré : {e}")
+
+def _run_job(job, collection):
+    from core.ai_viz_logic import add_document_to_chroma
+    last_write = {"at": 0.0}
+    progress = {"segments_done": 0}
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat_loop, args=(job["id"], stop_heartbeat),
+                                 name=f"ingestion-heartbeat-{job['id']}", daemon=True)
+    heartbeat.start()
+
+    def report(**fields):
+        progress.update(fields)
+        now = time.time()
+        if now - last_write["at"] >= PROGRESS_INTERVAL:
+            last_write["at"] = now
+            _update(job["id"], heartbeat=now, **progress)
+
+    try:
+        with StoredUpload(job["path"], job["mime_type"]) as upload:
+            def counted_segments():
+                for count, segment in enumerate(iter_document_text(upload), start=1):
+                    yield segment
+                    report(segments_done=count)
+
+            chunks = add_document_to_chroma(
+                collection, job["filename"], counted_segments(), file_hash=job["file_hash"], raise_errors=True,
+                progress_callback=lambda done, total, speed: report(chunks_done=done, chunks_per_sec=speed),
+            )
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+    return chunks
+
+def _remove_spooled_file(path):
+    """Supprime la copie du fichier si aucun autre job ne l'utilise (conservée en cas d'erreur, pour retry_job)"""
+    conn = _connect()
+    try:
+        in_use = conn.execute(
+            "SELECT 1 FROM jobs WHERE path = ? AND status IN ('queued', 'running', 'error') LIMIT 1", (path,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not in_use and os.path.exists(path):
+        os.remove(path)
+
+def _worker_loop():
+    from core.ai_viz_logic import init_chroma_client
+    idle_since = time.time()
+    while True:
+        job = _claim_job()
+        if job is None:
+            if time.time() - idle_since > INGEST_IDLE_SECONDS:
+                with _worker_lock:
+                    # Dernière vérification sous le verrou : un job soumis entre-temps relancerait un worker
+                    if _has_pending_jobs():
+                        continue
+                    _worker["thread"] = None
+                    return
+            time.sleep(INGEST_POLL_SECONDS)
+            continue
+        try:
+            _, collection = init_chroma_client()  # handle partagé, vérifié et rouvert si besoin
+            if collection is None:
+                raise RuntimeError("ChromaDB non disponible")
+            chunks = _run_job(job, collection)
+            _update(job["id"], status="done", chunks_done=chunks, finished_at=time.time())
+            _remove_spooled_file(job["path"])
+            print(f"✅ Job {job['id']} : {job['filename']} indexé ({chunks} chunks)")
+        except Exception as e:
+            _update(job["id"], status="error", error=str(e), finished_at=time.time())
+            print(f"❌ Job {job['id']} : {job['filename']} : {e}")
+        idle_since = time.time()
+
+def ensure_worker():
+    """Démarre le worker du processus s'il ne tourne pas (appelé à la soumission et à l'affichage de la page)"""
+    with _worker_lock:
+        thread = _worker["thread"]
+        if thread is not None and thread.is_alive():
+            return
+        if not _has_pending_jobs():
+            return
+        thread = threading.Thread(target=_worker_loop, name="ingestion-worker", daemon=True)
+        _worker["thread"] = thread
+        thread.start()
+
+# ==== SUIVI ====
+def list_jobs(limit=10):
+    """Jobs récents, les actifs d'abord"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM jobs ORDER BY status NOT IN ('queued', 'running'), id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+def has_active_jobs():
+    conn = _connect()
+    try:
+        return conn.execute(
+            "SELECT 1 FROM jobs WHERE status IN (?, ?) LIMIT 1", ACTIVE_STATUSES
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+def retry_job(job_id):
+    """Remet un job en erreur dans la file (le fichier copié est conservé en cas d'erreur)"""
+    _update(job_id, status="queued", error=None, finished_at=None)
+    ensure_worker()
+
+def clear_finished_jobs(older_than=0):
+    """Supprime les jobs terminés depuis plus de `older_than` secondes (tous par défaut) ; retourne leur nombre"""
+    conn = _connect()
+    try:
+        with conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND finished_at <= ?", (time.time() - older_than,)
+            ).rowcount
+    finally:
+        conn.close()
+
+def describe_job(job):
+    """Ligne d'état d'un job : statut, chunks, vitesse, avancement et temps restant estimé"""
+    if job["status"] == "queued":
+        return f"🕒 {job['filename']} : en attente"
+    if job["status"] == "done":
+        return f"✅ {job['filename']} : {job['chunks_done']} chunks indexés"
+    if job["status"] == "error":
+        return f"❌ {job['filename']} : {job['error']}"
+    line = f"⏳ {job['filename']} : {job['chunks_done']} chunks"
+    if job["chunks_per_sec"]:
+        line += f", {job['chunks_per_sec']:.0f} chunks/s"
+    total, done = job["segments_total"], job["segments_done"]
+    if total and done:
+        elapsed = time.time() - job["started_at"]
+        remaining = elapsed * max(0, total - done) / done
+        line += f", {min(100, 100 * done // total)} % (reste ~{remaining:.0f} s)"
+    return line
@@ -0,0 +1,146 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+# Index lexical (BM25, FTS5) des chunks de la collection Chroma, tenu à jour à l'ingestion :
+# les noms exacts (marques, personnes) que l'embedding rapproche mal sont retrouvés par leurs mots.
+# Les ids sont ceux de Chroma : en cas d'écart, `python chroma_maintenance.py rebuild --lexical-only` le reconstruit.
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "chroma_db/lexical.db")
+LEXICAL_MAX_TERMS = 12
+
+STOPWORDS = {
+    "le", "la", "les", "l", "des", "de", "du", "d", "un", "une", "et", "ou", "en", "a", "au", "aux",
+    "qui", "que", "qu", "quoi", "quels", "quelles", "quel", "quelle", "sont", "est", "pour", "avec", "dans",
+    "sur", "par", "ce", "ces", "cette", "il", "elle", "ils", "elles", "on", "nous", "vous", "se", "sa", "son",
+    "ses", "leur", "leurs", "y", "ne", "pas", "plus", "comment", "combien", "montre", "affiche", "donne",
+    "moi", "fais", "fait", "graphique", "document", "documents", "the", "of", "and", "to", "in", "is",
+}
+
+_lock = threading.Lock()
+_conn = {"conn": None}
+
+def _connection():
+    if _conn["conn"] is None:
+        directory = os.path.dirname(LEXICAL_INDEX_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(LEXICAL_INDEX_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "chunk_id TEXT PRIMARY KEY, filename TEXT, chunk_index INTEGER, document TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+                "document, content='chunks', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN "
+                "INSERT INTO chunks_fts(rowid, document) VALUES (new.rowid, new.document); END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN "
+                "INSERT INTO chunks_fts(chunks_fts, rowid, document) VALUES ('delete', old.rowid, old.document); END"
+            )
+            # Génération incrémentée à chaque modification : sert de version de la collection aux caches
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('generation', 0)")
+        _conn["conn"] = conn
+    return _conn["conn"]
+
+def _bump_generation(conn):
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+
+def generation():
+    """Compteur de modifications de l'index (partagé entre processus)"""
+    with _lock:
+        return _connection().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+def _fold(text):
+    return unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+
+def build_match_query(text):
+    """Question → requête FTS5 : mots significatifs entre guillemets, reliés par OR (BM25 classe les chunks)"""
+    terms = []
+    for word in re.findall(r"\w+", _fold(text)):
+        if word in STOPWORDS or len(word) < 2 or word in terms:
+            continue
+        terms.append(word)
+    return " OR ".join(f'"{word}"' for word in terms[:LEXICAL_MAX_TERMS])
+
+def index_chunks(ids, documents, metadatas=None):
+    """Ajoute des chunks à l'index (un id déjà présent est remplacé)"""
+    metadatas = metadatas or [{}] * len(ids)
+    rows = [
+        (chunk_id, (metadata or {}).get("filename"), (metadata or {}).get("chunk_index"), document)
+        for chunk_id, document, metadata in zip(ids, documents, metadatas)
+    ]
+    with _lock:
+        conn = _connection()
+        with conn:
+            # DELETE + INSERT plutôt que REPLACE : les triggers tiennent chunks_fts à jour
+            conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(row[0],) for row in rows])
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+            _bump_generation(conn)
+
+def update_metadata(ids, metadatas):
+    """Met à jour fichier et position de chunks déjà indexés (texte inchangé, pas de réindexation plein texte)"""
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.executemany(
+                "UPDATE chunks SET filename = ?, chunk_index = ? WHERE chunk_id = ?",
+                [(metadata.get("filename"), metadata.get("chunk_index"), chunk_id)
+                 for chunk_id, metadata in zip(ids, metadatas)],
+            )
+            _bump_generation(conn)
+
+def remove_chunks(ids):
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            _bump_generation(conn)
+
+def clear_index():
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.execute("DELETE FROM chunks")
+            _bump_generation(conn)
+
+def search(query, k=20, filenames=None):
+    """Meilleurs chunks au sens BM25, du plus pertinent au moins pertinent, éventuellement limités
+    à certains fichiers : liste de (chunk_id, document, filename, chunk_index, score)"""
+    match = build_match_query(query)
+    if not match or filenames == []:
+        return []
+    sql = ("SELECT chunks.chunk_id, chunks.document, chunks.filename, chunks.chunk_index, bm25(chunks_fts) FROM chunks_fts "
+           "JOIN chunks ON chunks.rowid = chunks_fts.rowid WHERE chunks_fts MATCH ?")
+    params = [match]
+    if filenames is not None:
+        sql += f" AND chunks.filename IN ({', '.join('?' * len(filenames))})"
+        params += list(filenames)
+    with _lock:
+        rows = _connection().execute(sql + " ORDER BY bm25(chunks_fts) LIMIT ?", [*params, k]).fetchall()
+    return rows
+
+def indexed_count():
+    with _lock:
+        return _connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+def rebuild_from_collection(collection, page_size=1000):
+    """Réindexe toute la collection Chroma, page par page (index absent ou corpus antérieur à l'index)"""
+    clear_index()
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        index_chunks(page["ids"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+    return offset
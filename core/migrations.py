@@ -0,0 +1,169 @@
+import sqlite3
+
+from core.db import quote_identifier
+
+# Colonnes texte de contacts indexées en plein texte (table contacts_fts)
+FTS_COLUMNS = ["Nom", "Prénom", "Société", "Poste", "Commentaire", "Secteur d'activité"]
+FTS_COLUMNS_SQL = ", ".join(f'"{c}"' for c in FTS_COLUMNS)
+
+def _fts_values(prefix):
+    return ", ".join(f'{prefix}."{c}"' for c in FTS_COLUMNS)
+
+# Tables de synthèse tenues à jour par triggers : colonne de contacts → table de comptage
+STATS_GROUP_TABLES = {
+    "Secteur d'activité": "stats_contacts_par_secteur",
+    "Société": "stats_contacts_par_societe",
+    "Domaine": "stats_contacts_par_domaine",
+}
+STATS_UNSPECIFIED = "Non spécifié"  # libellé des valeurs NULL, comme dans les requêtes GROUP BY
+
+def _stats_key(prefix, column):
+    return f"COALESCE({prefix}.{quote_identifier(column)}, '{STATS_UNSPECIFIED}')"
+
+def _stats_increment(prefix, column, table):
+    col = quote_identifier(column)
+    return (f"INSERT INTO {table} ({col}, Nombre_de_contacts) VALUES ({_stats_key(prefix, column)}, 1) "
+            f"ON CONFLICT({col}) DO UPDATE SET Nombre_de_contacts = Nombre_de_contacts + 1;")
+
+def _stats_decrement(prefix, column, table):
+    col = quote_identifier(column)
+    return (f"UPDATE {table} SET Nombre_de_contacts = Nombre_de_contacts - 1 WHERE {col} = {_stats_key(prefix, column)};\n"
+            f"            DELETE FROM {table} WHERE {col} = {_stats_key(prefix, column)} AND Nombre_de_contacts <= 0;")
+
+def _stats_statements():
+    """Création, remplissage initial et triggers des tables de synthèse"""
+    statements = [
+        "CREATE TABLE IF NOT EXISTS stats_totaux (nom TEXT PRIMARY KEY, total INTEGER NOT NULL)",
+        "DELETE FROM stats_totaux",
+        "INSERT INTO stats_totaux (nom, total) SELECT 'contacts', COUNT(*) FROM contacts",
+        "INSERT INTO stats_totaux (nom, total) SELECT 'companies', COUNT(*) FROM companies",
+    ]
+    for column, table in STATS_GROUP_TABLES.items():
+        col = quote_identifier(column)
+        statements += [
+            f"CREATE TABLE IF NOT EXISTS {table} ({col} TEXT PRIMARY KEY, Nombre_de_contacts INTEGER NOT NULL)",
+            f"DELETE FROM {table}",
+            f"INSERT INTO {table} ({col}, Nombre_de_contacts) "
+            f"SELECT COALESCE({col}, '{STATS_UNSPECIFIED}'), COUNT(*) FROM contacts GROUP BY 1",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {col} ON contacts
+            WHEN old.{col} IS NOT new.{col} BEGIN
+            {_stats_decrement("old", column, table)}
+            {_stats_increment("new", column, table)}
+        END""",
+        ]
+    increments = "\n            ".join(_stats_increment("new", c, t) for c, t in STATS_GROUP_TABLES.items())
+    decrements = "\n            ".join(_stats_decrement("old", c, t) for c, t in STATS_GROUP_TABLES.items())
+    statements += [
+        f"""CREATE TRIGGER IF NOT EXISTS stats_contacts_ai AFTER INSERT ON contacts BEGIN
+            UPDATE stats_totaux SET total = total + 1 WHERE nom = 'contacts';
+            {increments}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_contacts_ad AFTER DELETE ON contacts BEGIN
+            UPDATE stats_totaux SET total = total - 1 WHERE nom = 'contacts';
+            {decrements}
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS stats_companies_ai AFTER INSERT ON companies BEGIN
+            UPDATE stats_totaux SET total = total + 1 WHERE nom = 'companies';
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS stats_companies_ad AFTER DELETE ON companies BEGIN
+            UPDATE stats_totaux SET total = total - 1 WHERE nom = 'companies';
+        END""",
+    ]
+    return statements
+
+# Migrations du schéma de bdd_clients.db, suivies par PRAGMA user_version.
+# Chaque entrée : (version, description, liste d'instructions SQL)
+MIGRATIONS = [
+    (1, "Index sur LOWER() des colonnes filtrées et unicité des emails", [
+        'CREATE INDEX IF NOT EXISTS idx_contacts_societe_lower ON contacts(LOWER("Société"))',
+        'CREATE INDEX IF NOT EXISTS idx_contacts_secteur_lower ON contacts(LOWER("Secteur d\'activité"))',
+        'CREATE INDEX IF NOT EXISTS idx_contacts_poste_lower ON contacts(LOWER("Poste"))',
+        'CREATE INDEX IF NOT EXISTS idx_contacts_domaine_lower ON contacts(LOWER("Domaine"))',
+        'CREATE INDEX IF NOT EXISTS idx_contacts_email_lower ON contacts(LOWER("Email"))',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_email_unique ON contacts("Email") WHERE "Email" IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS idx_companies_societe_lower ON companies(LOWER("Société"))',
+    ]),
+    (2, "Index plein texte FTS5 sur les colonnes texte de contacts", [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(
+            {FTS_COLUMNS_SQL},
+            content='contacts', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )""",
+        "INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')",
+        f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN
+            INSERT INTO contacts_fts(rowid, {FTS_COLUMNS_SQL}) VALUES (new.rowid, {_fts_values("new")});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN
+            INSERT INTO contacts_fts(contacts_fts, rowid, {FTS_COLUMNS_SQL}) VALUES ('delete', old.rowid, {_fts_values("old")});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN
+            INSERT INTO contacts_fts(contacts_fts, rowid, {FTS_COLUMNS_SQL}) VALUES ('delete', old.rowid, {_fts_values("old")});
+            INSERT INTO contacts_fts(rowid, {FTS_COLUMNS_SQL}) VALUES (new.rowid, {_fts_values("new")});
+        END""",
+    ]),
+    (3, "Suivi des imports CSV (empreinte des fichiers déjà chargés)", [
+        """CREATE TABLE IF NOT EXISTS csv_imports (
+            path TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            rows INTEGER,
+            imported_at TEXT
+        )""",
+    ]),
+    (4, "Tables de synthèse (totaux, contacts par secteur, société et domaine) tenues par triggers",
+        _stats_statements()),
+    (5, "Index partiel des contacts sans email (dédoublonnage Nom/Prénom/Société à l'import)", [
+        'CREATE INDEX IF NOT EXISTS idx_contacts_sans_email ON contacts("Nom", "Prénom", "Société") WHERE "Email" IS NULL',
+    ]),
+]
+
+def rebuild_fulltext_index(conn):
+    """Reconstruit contacts_fts depuis contacts (à lancer après un VACUUM, qui peut renuméroter les rowid)"""
+    with conn:
+        conn.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+
+def rebuild_stats(conn):
+    """Recalcule les tables de synthèse depuis contacts et companies (en cas de doute sur les compteurs)"""
+    with conn:
+        for statement in _stats_statements():
+            if not statement.lstrip().upper().startswith("CREATE"):
+                conn.execute(statement)
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def find_duplicate_emails(conn, limit=10):
+    """Emails présents plusieurs fois (bloquent la création de l'index unique)"""
+    return conn.execute(
+        'SELECT "Email", COUNT(*) FROM contacts WHERE "Email" IS NOT NULL '
+        'GROUP BY "Email" HAVING COUNT(*) > 1 LIMIT ?', (limit,)
+    ).fetchall()
+
+def apply_migrations(conn, verbose=False):
+    """Applique les migrations manquantes, chacune dans sa propre transaction.
+
+    Retourne la liste des versions appliquées. Une migration en échec est annulée
+    et l'erreur est propagée ; les migrations précédentes restent acquises.
+    """
+    applied = []
+    if conn.in_transaction:
+        conn.commit()
+    current = get_schema_version(conn)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            if "UNIQUE" in str(e).upper():
+                duplicates = ", ".join(email for email, _ in find_duplicate_emails(conn))
+                raise sqlite3.IntegrityError(f"Migration {version} impossible, emails en double : {duplicates}") from e
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"✅ Migration {version} appliquée : {description}")
+    return applied
@@ -0,0 +1,183 @@
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from core.db import read_connection, get_data_version, get_file_stamp
+
+# Cache des résultats de SELECT (SQL normalisée → résultat), invalidé à chaque écriture en base
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 64 Mo
+QUERY_CACHE_MAX_ENTRY_BYTES = int(os.getenv("QUERY_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+# Second niveau optionnel sur disque, partagé entre processus et redémarrages
+QUERY_CACHE_DISK = os.getenv("QUERY_CACHE_DISK", "0") == "1"
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "query_cache.sqlite3")
+QUERY_CACHE_DISK_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_DISK_MAX_ENTRIES", "200"))
+
+_lock = threading.Lock()
+_disk_lock = threading.Lock()
+_entries = OrderedDict()  # clé → (jeton data_version, valeur, taille)
+_state = {"bytes": 0}
+_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+_STRING_OR_SPACE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|\s+")
+
+def normalize_sql(sql):
+    """Espaces compactés hors littéraux et ';' final retiré (la casse des littéraux est conservée)"""
+    text = _STRING_OR_SPACE.sub(lambda m: m.group(1) or " ", sql.strip())
+    return text.rstrip("; ")
+
+def _key(kind, sql):
+    return f"{kind}\x1f{normalize_sql(sql)}"
+
+def _evict_locked():
+    while _state["bytes"] > QUERY_CACHE_MAX_BYTES and _entries:
+        _, (_, _, size) = _entries.popitem(last=False)
+        _state["bytes"] -= size
+        _stats["evictions"] += 1
+
+def get_cached(kind, sql, token):
+    """Valeur en cache pour cette requête si aucune écriture n'a eu lieu depuis, sinon None"""
+    key = _key(kind, sql)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            if entry[0] == token:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                return entry[1]
+            # Écriture en base depuis la mise en cache : l'entrée est périmée
+            del _entries[key]
+            _state["bytes"] -= entry[2]
+            _stats["stale"] += 1
+    if QUERY_CACHE_DISK:
+        value = _get_from_disk(key)
+        if value is not None:
+            with _lock:
+                _stats["disk_hits"] += 1
+            _store_in_memory(key, token, value[0], value[1])
+            return value[0]
+    with _lock:
+        _stats["misses"] += 1
+    return None
+
+def set_cached(kind, sql, token, value, size):
+    """Met en cache un résultat lu avec le jeton `token` (pris AVANT l'exécution de la requête)"""
+    if size > QUERY_CACHE_MAX_ENTRY_BYTES:
+        return
+    key = _key(kind, sql)
+    _store_in_memory(key, token, value, size)
+    if QUERY_CACHE_DISK:
+        _set_on_disk(key, value, size)
+
+def _store_in_memory(key, token, value, size):
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _state["bytes"] -= old[2]
+        _entries[key] = (token, value, size)
+        _state["bytes"] += size
+        _evict_locked()
+
+# ==== NIVEAU DISQUE ====
+# Table SQLite : l'état de la base (stamp) et la date du dernier accès sont des colonnes, comparées
+# et triées sans désérialiser les valeurs (jusqu'à QUERY_CACHE_MAX_ENTRY_BYTES chacune).
+def _disk_connection():
+    conn = sqlite3.connect(QUERY_CACHE_PATH, timeout=5)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS entries ("
+        "key TEXT PRIMARY KEY, stamp TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL, value BLOB NOT NULL)"
+    )
+    return conn
+
+def _get_from_disk(key):
+    """(valeur, taille) si l'entrée disque correspond à l'état actuel des fichiers de la base"""
+    try:
+        stamp = repr(get_file_stamp())
+        with _disk_lock:
+            conn = _disk_connection()
+            try:
+                with conn:
+                    row = conn.execute("SELECT stamp, value, size FROM entries WHERE key = ?", (key,)).fetchone()
+                    if row is None:
+                        return None
+                    if row[0] != stamp:
+                        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                        return None
+                    conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            finally:
+                conn.close()
+        return pickle.loads(row[1]), row[2]
+    except Exception as e:
+        print(f"⚠️ Cache disque des résultats indisponible : {e}")
+        return None
+
+def _set_on_disk(key, value, size):
+    try:
+        stamp = repr(get_file_stamp())
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with _disk_lock:
+            conn = _disk_connection()
+            try:
+                with conn:
+                    # Les entrées d'un autre état de la base ne resserviront jamais
+                    conn.execute("DELETE FROM entries WHERE stamp <> ?", (stamp,))
+                    conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                 (key, stamp, size, time.time(), blob))
+                    # Éviction LRU au-delà de QUERY_CACHE_DISK_MAX_ENTRIES
+                    conn.execute(
+                        "DELETE FROM entries WHERE key IN "
+                        "(SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                        (QUERY_CACHE_DISK_MAX_ENTRIES,),
+                    )
+            finally:
+                conn.close()
+    except Exception as e:
+        print(f"⚠️ Cache disque des résultats indisponible : {e}")
+
+# ==== LECTURES EN CACHE ====
+def dataframe_size(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def cached_read_sql(sql, conn=None):
+    """pd.read_sql_query avec cache : gratuit tant qu'aucune écriture n'a touché la base.
+
+    Retourne une copie, l'appelant peut modifier le DataFrame sans altérer le cache.
+    """
+    token = get_data_version()
+    df = get_cached("df", sql, token)
+    if df is None:
+        if conn is not None:
+            df = pd.read_sql_query(sql, conn)
+        else:
+            with read_connection() as sql_conn:
+                df = pd.read_sql_query(sql, sql_conn)
+        set_cached("df", sql, token, df, dataframe_size(df))
+    return df.copy()
+
+def clear_query_cache():
+    """Vide le cache mémoire (et disque s'il est activé)"""
+    with _lock:
+        _entries.clear()
+        _state["bytes"] = 0
+    if QUERY_CACHE_DISK:
+        with _disk_lock:
+            conn = _disk_connection()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM entries")
+            finally:
+                conn.close()
+
+def get_query_cache_stats():
+    """Compteurs du processus courant et occupation mémoire"""
+    with _lock:
+        total = _stats["hits"] + _stats["disk_hits"] + _stats["misses"]
+        hits = _stats["hits"] + _stats["disk_hits"]
+        return dict(_stats, entries=len(_entries), bytes=_state["bytes"],
+                    hit_rate=hits / total if total else 0.0)
@@ -0,0 +1,135 @@
+import os
+import re
+import sqlite3
+import sys
+
+import pandas as pd
+
+from core.db import read_connection, get_data_version
+from core.query_cache import get_cached, set_cached
+from core.sql_guard import statement_words, split_top_level_limit, TABLE_REF
+
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "200"))
+RESULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", str(20 * 1024 * 1024)))  # 20 Mo par résultat
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "100000"))  # lignes lues au plus par résultat
+
+MIN_ROWID = -(2 ** 63)
+MAX_ROWID = 2 ** 63 - 1
+# Requêtes dont l'ordre ou les lignes ne correspondent pas un à un aux rowid de la table lue
+KEYSET_BLOCKERS = {"join", "group", "distinct", "union", "intersect", "except", "order", "limit", "offset",
+                   "over", "with", "values", "rowid", "count", "sum", "avg", "min", "max", "total", "group_concat"}
+
+def _row_size(row):
+    """Taille mémoire approximative d'une ligne (tuple + valeurs)"""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+def _keyset_sql(sql):
+    """SELECT simple sur une seule table : pages lues par intervalle de rowid (recherche dans la
+    clé primaire, coût proportionnel à la page). None si la requête ne s'y prête pas."""
+    match = re.match(r"\s*select\b", sql, re.IGNORECASE)
+    if not match or statement_words(sql) & KEYSET_BLOCKERS or len(TABLE_REF.findall(sql)) != 1:
+        return None
+    return (f'SELECT * FROM (SELECT rowid AS "_pager_rowid", {sql[match.end():].strip()}) '
+            f'WHERE "_pager_rowid" >= ? ORDER BY "_pager_rowid" LIMIT ?')
+
+class ResultPager:
+    """Résultat d'un SELECT lu page par page, avec un plafond de lignes et un plafond mémoire.
+
+    Chaque page est lue sur une connexion empruntée au pool puis rendue : aucun curseur (ni
+    instantané de lecture WAL) ne reste ouvert entre deux pages. Un SELECT simple sur une table
+    est paginé par rowid (chaque page reprend après le dernier rowid lu) ; les autres requêtes
+    (tri, agrégat, jointure...) par LIMIT/OFFSET. Le LIMIT final de la requête devient le plafond
+    de lignes du pager (au plus max_rows). Si la base a changé depuis la première page, « charger
+    plus » relit les lignes déjà affichées pour que le résultat reste cohérent. Un résultat lu
+    jusqu'au bout est mis en cache tant qu'aucune écriture n'a eu lieu (core.query_cache).
+    """
+
+    def __init__(self, sql, page_size=RESULT_PAGE_SIZE, max_bytes=RESULT_MAX_BYTES, max_rows=RESULT_MAX_ROWS):
+        self.sql = sql
+        self.page_size = page_size
+        self.max_bytes = max_bytes
+        self.rows = []
+        self.bytes_used = 0
+        self.exhausted = False
+        self.truncated = False  # plafond de lignes ou de mémoire atteint avant la fin du résultat
+        self.from_cache = False
+
+        self._token = get_data_version()
+        cached = get_cached("pager", sql, self._token)
+        if cached is not None:
+            self.columns, rows, self.bytes_used = cached
+            self.rows = list(rows)
+            self.exhausted = True
+            self.from_cache = True
+            return
+
+        base, limit = split_top_level_limit(sql.strip().rstrip(";").strip())
+        self._limit = limit if limit is not None and limit < max_rows else None  # LIMIT propre à la requête
+        self.max_rows = max_rows if limit is None else min(limit, max_rows)
+        self._keyset_sql = _keyset_sql(base)
+        self._offset_sql = f"SELECT * FROM ({base}) LIMIT ? OFFSET ?"
+        self._next_rowid = MIN_ROWID
+        self.columns = []
+        self.fetch_next_page()
+
+    @property
+    def has_more(self):
+        return not self.exhausted and not self.truncated
+
+    def _read(self, limit):
+        """Lignes suivantes ; en pagination par rowid, chaque ligne commence par son rowid"""
+        with read_connection() as conn:
+            cursor = None
+            if self._keyset_sql is not None:
+                try:
+                    cursor = conn.execute(self._keyset_sql, (self._next_rowid, limit))
+                except sqlite3.OperationalError:
+                    self._keyset_sql = None  # vue, table WITHOUT ROWID... : pagination par décalage
+            if cursor is None:
+                cursor = conn.execute(self._offset_sql, (limit, len(self.rows)))
+            try:
+                columns = [description[0] for description in cursor.description or []]
+                self.columns = columns[1:] if self._keyset_sql is not None else columns
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    def fetch_next_page(self):
+        """Lit la page suivante ; retourne le nombre de lignes ajoutées"""
+        if not self.has_more:
+            return 0
+        token = get_data_version()
+        if token != self._token:
+            # Écriture depuis la dernière page : les lignes ont pu bouger, on repart du début
+            wanted = len(self.rows) + self.page_size
+            self._token, self.rows, self.bytes_used = token, [], 0
+            self._next_rowid = MIN_ROWID
+        else:
+            wanted = self.page_size
+        wanted = min(wanted, self.max_rows - len(self.rows))
+        page = self._read(wanted + 1)  # une ligne de plus : y a-t-il une suite ?
+        keyset = self._keyset_sql is not None
+        before = len(self.rows)
+        for row in page[:wanted]:
+            if keyset:
+                rowid, row = row[0], row[1:]
+            size = _row_size(row)
+            if self.bytes_used + size > self.max_bytes:
+                self.truncated = True
+                break
+            self.rows.append(row)
+            self.bytes_used += size
+            if keyset:
+                self._next_rowid = rowid + 1
+        complete = len(page) <= wanted or (self._limit is not None and len(self.rows) >= self._limit)
+        if complete and not self.truncated:
+            self.exhausted = True
+            set_cached("pager", self.sql, self._token,
+                       (self.columns, tuple(self.rows), self.bytes_used), self.bytes_used)
+        elif len(self.rows) >= self.max_rows or (keyset and self._next_rowid > MAX_ROWID):
+            self.truncated = True
+        return len(self.rows) - before
+
+    def to_dataframe(self):
+        """Lignes déjà chargées sous forme de DataFrame"""
+        return pd.DataFrame.from_records(self.rows, columns=self.columns)
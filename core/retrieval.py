@@ -0,0 +1,154 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from core import lexical_index
+from core.doc_filters import build_where
+from core.chroma_client import get_collection_count
+from core.embedding_cache import get_embedding_function, model_id
+
+# Recherche hybride : requête vectorielle Chroma et BM25 (core.lexical_index) lancées en parallèle,
+# classements fusionnés par Reciprocal Rank Fusion. Les noms exacts remontent grâce au BM25,
+# ce qui permet d'envoyer moins de chunks à GPT-4 (10 auparavant).
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "5"))                      # chunks retenus pour le contexte
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))   # candidats demandés à chaque moteur
+RRF_K = int(os.getenv("RRF_K", "60"))
+VECTOR_MAX_DISTANCE = float(os.getenv("VECTOR_MAX_DISTANCE", "2.0"))  # seuil de pertinence des résultats vectoriels
+# Caches en mémoire : question → embedding, puis (question, version de la collection) → chunks classés
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+_lexical_checked = threading.Event()
+
+_cache_lock = threading.Lock()
+_query_embeddings = OrderedDict()  # (modèle, question normalisée) → embedding
+_results = OrderedDict()           # (question normalisée, fichiers, version, k, candidats) → résultats
+_cache_stats = {"embedding_hits": 0, "embedding_misses": 0, "hits": 0, "misses": 0}
+
+# ==== CACHES ====
+def normalize_query(query):
+    """Casse, espaces et ponctuation finale ignorés : « Ventes HYBE ? » et « ventes hybe » partagent leurs caches"""
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip(" ?!.")
+
+def _lru_get(cache, key, stat):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        _cache_stats[stat + ("hits" if value is not None else "misses")] += 1
+        return value
+
+def _lru_put(cache, key, value):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > RETRIEVAL_CACHE_SIZE:
+            cache.popitem(last=False)
+
+def collection_version(collection):
+    """Version de la collection : génération de l'index BM25 (tenu à jour à chaque ingestion et
+    suppression) et nombre de chunks (ajouts ou suppressions faits hors de l'ingestion, vus à la
+    vérification périodique du client partagé)"""
+    return lexical_index.generation(), get_collection_count(collection)
+
+def clear_retrieval_cache():
+    with _cache_lock:
+        _query_embeddings.clear()
+        _results.clear()
+
+def get_retrieval_cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats, embeddings=len(_query_embeddings), results=len(_results))
+
+def _query_embedding(query, embedding_function):
+    key = (getattr(embedding_function, "model", None) or model_id(embedding_function), query)
+    embedding = _lru_get(_query_embeddings, key, "embedding_")
+    if embedding is None:
+        embedding = [float(x) for x in embedding_function([query])[0]]
+        _lru_put(_query_embeddings, key, embedding)
+    return embedding
+
+# ==== RECHERCHE ====
+def _vector_hits(query, collection, n_results, filenames=None):
+    # Embedding de la question via les caches mémoire et disque (sinon calculé par Chroma)
+    embedding_function = get_embedding_function(collection)
+    if embedding_function:
+        query_args = {"query_embeddings": [_query_embedding(query, embedding_function)]}
+    else:
+        query_args = {"query_texts": [query]}
+    if filenames is not None:
+        query_args["where"] = build_where(filenames)  # filtre appliqué par Chroma avant la recherche ANN
+    results = collection.query(**query_args, n_results=n_results, include=['documents', 'metadatas', 'distances'])
+    if not results['ids'] or not results['ids'][0]:
+        return []
+    return [
+        {"id": chunk_id, "document": document, "metadata": metadata or {}, "distance": distance}
+        for chunk_id, document, metadata, distance in zip(
+            results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0])
+        if distance < VECTOR_MAX_DISTANCE
+    ]
+
+def _lexical_hits(query, n_results, filenames=None):
+    return [
+        {"id": chunk_id, "document": document, "metadata": {"filename": filename, "chunk_index": chunk_index},
+         "bm25": score}
+        for chunk_id, document, filename, chunk_index, score in lexical_index.search(query, n_results, filenames)
+    ]
+
+def ensure_lexical_index(collection):
+    """Construit l'index BM25 depuis la collection s'il est vide (corpus indexé avant son introduction) ; une fois par processus"""
+    if _lexical_checked.is_set():
+        return
+    try:
+        if lexical_index.indexed_count() == 0 and collection.count() > 0:
+            print("⏳ Construction de l'index BM25 depuis ChromaDB...")
+            count = lexical_index.rebuild_from_collection(collection)
+            print(f"✅ Index BM25 : {count} chunks")
+    except Exception as e:
+        print(f"⚠️ Index BM25 indisponible : {e}")
+    _lexical_checked.set()
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fusionne des listes d'ids classés : score(id) = Σ 1 / (k + rang) ; retourne [(id, score)] décroissant"""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def hybrid_search(query, collection, k=RETRIEVAL_K, candidates=RETRIEVAL_CANDIDATES, filenames=None):
+    """Les k chunks les plus pertinents : liste de dicts {id, document, metadata, score, distance, bm25}.
+    `filenames` limite la recherche à ces fichiers (voir core.doc_filters), None = toute la collection.
+
+    Une question déjà posée (à la casse et la ponctuation près) sur la même version de la
+    collection est servie depuis le cache, sans embedding ni recherche.
+    """
+    if filenames is not None and not filenames:
+        return []
+    ensure_lexical_index(collection)
+    query = normalize_query(query)
+    filenames = tuple(sorted(filenames)) if filenames is not None else None
+    # Version lue AVANT la recherche : une ingestion concurrente rend l'entrée périmée, jamais l'inverse
+    key = (query, filenames, collection_version(collection), k, candidates)
+    cached = _lru_get(_results, key, "")
+    if cached is not None:
+        return [dict(hit) for hit in cached]
+
+    vector_future = _pool.submit(_vector_hits, query, collection, candidates, filenames)
+    lexical_future = _pool.submit(_lexical_hits, query, candidates, filenames)
+    vector = vector_future.result()
+    try:
+        lexical = lexical_future.result()
+    except Exception as e:
+        print(f"⚠️ Recherche BM25 ignorée : {e}")
+        lexical = []
+
+    hits = {}
+    for hit in lexical + vector:  # les métadonnées complètes de Chroma remplacent celles de l'index BM25
+        hits.setdefault(hit["id"], {"distance": None, "bm25": None}).update(hit)
+    fused = reciprocal_rank_fusion([[hit["id"] for hit in vector], [hit["id"] for hit in lexical]])
+    results = [dict(hits[chunk_id], score=score) for chunk_id, score in fused[:k]]
+    _lru_put(_results, key, results)
+    return [dict(hit) for hit in results]
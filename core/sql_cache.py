@@ -0,0 +1,85 @@
+import hashlib
+import os
+import re
+import shelve
+import threading
+import time
+import unicodedata
+
+# Cache persistant des requêtes SQL générées par GPT (question → SQL)
+SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH", "sql_cache")
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "500"))
+SQL_CACHE_TTL = int(os.getenv("SQL_CACHE_TTL", str(7 * 24 * 3600)))  # 7 jours
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+
+def normalize_query(user_query):
+    """Normalise une question (espaces, ponctuation finale) pour la clé de cache.
+
+    La casse est conservée : les valeurs citées (noms, sociétés, emails à insérer) passent
+    telles quelles dans la SQL générée, « ajoute Pham » et « ajoute pham » n'ont pas la même réponse.
+    """
+    text = unicodedata.normalize("NFC", user_query).strip()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip(" ?!.")
+
+def make_cache_key(user_query, history_context, schema_fingerprint, model):
+    """Construit la clé : question normalisée + hash de l'historique + empreinte du schéma"""
+    history_hash = hashlib.sha256(history_context.encode("utf-8")).hexdigest()[:16]
+    raw_key = "\x1f".join([model, schema_fingerprint, history_hash, normalize_query(user_query)])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+def get_cached_sql(key):
+    """Retourne la SQL en cache pour cette clé, ou None (absente, expirée ou cache indisponible)"""
+    now = time.time()
+    with _lock:
+        try:
+            with shelve.open(SQL_CACHE_PATH) as db:
+                entry = db.get(key)
+                if entry is None:
+                    _stats["misses"] += 1
+                    return None
+                if now - entry["created"] > SQL_CACHE_TTL:
+                    del db[key]
+                    _stats["misses"] += 1
+                    _stats["evictions"] += 1
+                    return None
+                entry["last_access"] = now
+                db[key] = entry
+                _stats["hits"] += 1
+                return entry["sql"]
+        except Exception as e:
+            # Fichier verrouillé par un autre processus (dbm.gnu), corrompu... : simple absence
+            print(f"⚠️ Cache SQL indisponible : {e}")
+            _stats["misses"] += 1
+            _stats["errors"] += 1
+            return None
+
+def set_cached_sql(key, sql):
+    """Enregistre une SQL en cache et évince les entrées les moins récemment utilisées"""
+    now = time.time()
+    with _lock:
+        try:
+            with shelve.open(SQL_CACHE_PATH) as db:
+                db[key] = {"sql": sql, "created": now, "last_access": now}
+                if len(db) > SQL_CACHE_MAX_ENTRIES:
+                    by_access = sorted(db.keys(), key=lambda k: db[k]["last_access"])
+                    for old_key in by_access[:len(db) - SQL_CACHE_MAX_ENTRIES]:
+                        del db[old_key]
+                        _stats["evictions"] += 1
+        except Exception as e:
+            print(f"⚠️ Cache SQL indisponible, requête non mise en cache : {e}")
+            _stats["errors"] += 1
+
+def clear_sql_cache():
+    """Vide entièrement le cache"""
+    with _lock:
+        with shelve.open(SQL_CACHE_PATH) as db:
+            db.clear()
+
+def get_cache_stats():
+    """Compteurs hits/misses/évictions/erreurs du processus courant"""
+    with _lock:
+        total = _stats["hits"] + _stats["misses"]
+        return dict(_stats, hit_rate=_stats["hits"] / total if total else 0.0)
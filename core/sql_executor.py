@@ -0,0 +1,83 @@
+import sqlite3
+
+from core.db import read_connection, write_connection
+from core.sql_guard import guard_statement, is_read_statement, SQL_GUARD_MAX_ROWS
+
+class BatchError(Exception):
+    """Une requête du lot a échoué : tout le lot a été annulé (détail dans outcomes)"""
+
+    def __init__(self, message, outcomes):
+        super().__init__(message)
+        self.outcomes = outcomes
+
+def _outcome(index, statement):
+    return {
+        "index": index,
+        "statement": statement,
+        "kind": "read" if is_read_statement(statement) else "write",
+        "status": "pending",  # pending → ok / error / cancelled
+        "rowcount": None,
+        "error": None,
+    }
+
+def execute_batch(statements, max_rows=SQL_GUARD_MAX_ROWS):
+    """Exécute un lot de requêtes générées de façon atomique.
+
+    Toutes les requêtes sont validées par le garde-fou avant la moindre écriture, puis les
+    écritures passent dans une seule transaction (un seul commit), chacune sous son propre
+    SAVEPOINT pour identifier précisément celle qui échoue. Au premier échec, tout le lot est
+    annulé et BatchError est levée. Les lectures restent "pending" : l'appelant les lit après
+    le commit (ResultPager, cached_read_sql), elles voient donc les écritures du lot.
+
+    max_rows : LIMIT ajouté aux SELECT qui n'en ont pas (l'appelant qui pagine passe son propre plafond).
+    Retourne la liste des résultats par requête : {index, statement, kind, status, rowcount, error}.
+    """
+    statements = [s for s in statements if s and s.strip()]
+    outcomes = []
+    with read_connection() as conn:
+        for index, statement in enumerate(statements):
+            try:
+                # Garde-fou : plan de requête vérifié et LIMIT ajouté aux SELECT
+                statement = guard_statement(conn, statement, max_rows)
+            except Exception as e:
+                outcome = _outcome(index, statement)
+                outcome.update(status="error", error=str(e))
+                outcomes.append(outcome)
+                continue
+            outcomes.append(_outcome(index, statement))
+
+    failed = [o for o in outcomes if o["status"] == "error"]
+    if failed:
+        for outcome in outcomes:
+            if outcome["status"] == "pending":
+                outcome["status"] = "cancelled"
+        raise BatchError(f"Requête {failed[0]['index'] + 1} refusée : {failed[0]['error']}", outcomes)
+
+    writes = [o for o in outcomes if o["kind"] == "write"]
+    if not writes:
+        return outcomes
+
+    try:
+        with write_connection() as conn:
+            # Verrou d'écriture pris dès le début : pas de SQLITE_BUSY au milieu du lot
+            conn.execute("BEGIN IMMEDIATE")
+            for outcome in writes:
+                savepoint = f"requete_{outcome['index']}"
+                conn.execute(f"SAVEPOINT {savepoint}")
+                try:
+                    outcome["rowcount"] = conn.execute(outcome["statement"]).rowcount
+                except sqlite3.Error as e:
+                    conn.execute(f"ROLLBACK TO {savepoint}")
+                    outcome.update(status="error", error=str(e))
+                    raise
+                conn.execute(f"RELEASE {savepoint}")
+                outcome["status"] = "ok"
+    except sqlite3.Error as e:
+        # write_connection() a annulé la transaction : aucune écriture du lot n'est conservée
+        for outcome in outcomes:
+            if outcome["status"] in ("ok", "pending"):
+                outcome["status"] = "cancelled"
+        failed = next((o for o in outcomes if o["status"] == "error"), None)
+        label = f"Requête {failed['index'] + 1} en échec" if failed else "Transaction impossible"
+        raise BatchError(f"{label}, lot annulé : {e}", outcomes) from e
+    return outcomes
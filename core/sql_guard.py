@@ -0,0 +1,208 @@
+import os
+import re
+import sqlite3
+
+# Garde-fou exécuté avant chaque requête générée par le LLM
+SQL_GUARD_MAX_ROWS = int(os.getenv("SQL_GUARD_MAX_ROWS", "5000"))               # LIMIT injecté
+SQL_GUARD_MAX_SCAN_ROWS = int(os.getenv("SQL_GUARD_MAX_SCAN_ROWS", "2000000"))  # scan complet toléré
+SQL_GUARD_MAX_JOIN_ROWS = int(os.getenv("SQL_GUARD_MAX_JOIN_ROWS", "1000000"))  # produit cartésien toléré
+
+READ_KEYWORDS = ("select",)
+WRITE_KEYWORDS = ("insert", "update", "delete")
+# Mots qui empêchent un LIMIT d'arrêter un scan tôt (lignes lues mais pas toutes renvoyées)
+LIMIT_EARLY_STOP_BLOCKERS = {"where", "group", "having", "join", "distinct", "union", "intersect", "except",
+                             "count", "sum", "avg", "min", "max", "total", "group_concat"}
+
+TABLE_REF = re.compile(
+    r'\b(?:from|join)\s+("(?:[^"]|"")+"|\w+)(?:\s+(?:as\s+)?(?!(?:on|using|where|join|inner|left|cross|natural|group|order|limit)\b)(\w+))?',
+    re.IGNORECASE,
+)
+
+# LOWER(col) LIKE 'abc%' : l'index sur LOWER(col) n'est pas utilisable par LIKE, mais l'est par un intervalle.
+# Pas de réécriture avec une clause ESCAPE : le caractère d'échappement changerait le sens du motif.
+PREFIX_LIKE = re.compile(
+    r"""(LOWER\(\s*(?:"(?:[^"]|"")+"|\w+)\s*\))\s+LIKE\s+'([^'%_]+)%'(?!\s*ESCAPE\b)""",
+    re.IGNORECASE,
+)
+
+class SQLGuardError(Exception):
+    """Requête refusée par le garde-fou (plan trop coûteux, type de requête interdit...)"""
+
+def _tokens(sql):
+    """Découpe grossière en (profondeur de parenthèses, mot) en ignorant chaînes et commentaires"""
+    depth, i = 0, 0
+    while i < len(sql):
+        c = sql[i]
+        if c in "'\"`[":
+            end_char = "]" if c == "[" else c
+            i += 1
+            while i < len(sql):
+                if sql[i] == end_char:
+                    if end_char != "]" and i + 1 < len(sql) and sql[i + 1] == end_char:
+                        i += 2
+                        continue
+                    break
+                i += 1
+        elif sql.startswith("--", i):
+            newline = sql.find("\n", i)
+            i = len(sql) if newline == -1 else newline
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = len(sql) if end == -1 else end + 1
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == ";":
+            yield depth, ";", i
+        elif c.isalpha() or c == "_":
+            start = i
+            while i + 1 < len(sql) and (sql[i + 1].isalnum() or sql[i + 1] == "_"):
+                i += 1
+            yield depth, sql[start:i + 1].lower(), start
+        i += 1
+
+def statement_words(sql):
+    """Mots-clés et identifiants de la requête, en minuscules, hors chaînes et commentaires"""
+    return {word for _, word, _ in _tokens(sql) if word != ";"}
+
+def split_statements(sql):
+    """Sépare les requêtes sur les ';' qui ne sont pas dans une chaîne ou un commentaire"""
+    statements, start = [], 0
+    for depth, word, pos in _tokens(sql):
+        if word == ";":
+            statements.append(sql[start:pos])
+            start = pos + 1
+    statements.append(sql[start:])
+    return [s.strip() for s in statements if s.strip()]
+
+def statement_kind(statement):
+    """Verbe principal de la requête, en minuscules ("select", "insert"...).
+
+    Pour WITH, c'est le premier verbe au niveau principal après la liste des CTE :
+    WITH ... DELETE est une écriture. Chaîne vide si aucun verbe n'est trouvé.
+    """
+    tokens = _tokens(statement)
+    for _, word, _ in tokens:
+        if word != "with":
+            return word
+        break
+    else:
+        return ""
+    for depth, word, _ in tokens:
+        if depth == 0 and word in READ_KEYWORDS + WRITE_KEYWORDS + ("replace", "values"):
+            return word
+    return ""
+
+def is_read_statement(statement):
+    return statement_kind(statement) in READ_KEYWORDS
+
+def has_top_level_limit(statement):
+    return any(depth == 0 and word == "limit" for depth, word, _ in _tokens(statement))
+
+def split_top_level_limit(statement):
+    """Sépare un « LIMIT n » final du niveau principal : (requête sans LIMIT, n), ou (requête, None)"""
+    positions = [pos for depth, word, pos in _tokens(statement) if depth == 0 and word == "limit"]
+    if positions:
+        match = re.fullmatch(r"limit\s+(\d+)\s*;?\s*", statement[positions[-1]:], re.IGNORECASE)
+        if match:
+            return statement[:positions[-1]].rstrip(), int(match.group(1))
+    return statement, None
+
+def inject_limit(statement, max_rows=SQL_GUARD_MAX_ROWS):
+    """Ajoute un LIMIT aux SELECT qui n'en ont pas au niveau principal"""
+    if not is_read_statement(statement) or has_top_level_limit(statement):
+        return statement
+    # Retour à la ligne si la requête finit par un commentaire "--" qui avalerait le LIMIT
+    separator = "\n" if "--" in statement else " "
+    return f"{statement.rstrip().rstrip(';').rstrip()}{separator}LIMIT {int(max_rows)}"
+
+def rewrite_prefix_like(statement):
+    """Réécrit LOWER(col) LIKE 'abc%' en intervalle indexable LOWER(col) >= 'abc' AND LOWER(col) < 'abd'"""
+    def replace(match):
+        expr, prefix = match.group(1), match.group(2)
+        if prefix != prefix.lower() or prefix[-1] == "\U0010ffff":
+            return match.group(0)  # LIKE ignore la casse ASCII, l'intervalle non
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return f"({expr} >= '{prefix}' AND {expr} < '{upper}')"
+    return PREFIX_LIKE.sub(replace, statement)
+
+def _table_rows(conn, table):
+    """Estimation du nombre de lignes en O(log n) via le rowid maximal"""
+    try:
+        value = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0]
+        return value or 0
+    except sqlite3.Error:
+        return 0
+
+def _resolve_tables(conn, statement):
+    """Associe alias et noms de tables cités dans la requête à leur nombre de lignes estimé"""
+    rows = {}
+    for table, alias in TABLE_REF.findall(statement):
+        table = table.strip('"').replace('""', '"')
+        count = _table_rows(conn, table)
+        rows[table.lower()] = count
+        if alias:
+            rows[alias.lower()] = count
+    return rows
+
+def check_plan(conn, statement, max_scan_rows=SQL_GUARD_MAX_SCAN_ROWS, max_join_rows=SQL_GUARD_MAX_JOIN_ROWS):
+    """Analyse EXPLAIN QUERY PLAN et lève SQLGuardError si le plan dépasse le budget
+    (max_scan_rows=None : pas de budget de scan, seul le produit cartésien est vérifié)"""
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    except sqlite3.Error as e:
+        raise SQLGuardError(f"Requête invalide : {e}")
+
+    table_rows = _resolve_tables(conn, statement)
+    sorts = any("USE TEMP B-TREE" in row[3] for row in plan)
+    # Le LIMIT n'arrête le scan tôt que si chaque ligne lue est renvoyée : avec un filtre, un
+    # regroupement ou un agrégat, une requête qui ne trouve rien lit quand même toute la table
+    words = statement_words(statement)
+    bounded = has_top_level_limit(statement) and not sorts and not words & LIMIT_EARLY_STOP_BLOCKERS
+
+    scans_by_parent = {}
+    for _, parent, _, detail in plan:
+        match = re.match(r"SCAN (\w+)\b", detail)
+        if not match or detail.startswith(("SCAN CONSTANT", "SCAN (")) or "VIRTUAL TABLE" in detail:
+            continue
+        name = match.group(1).lower()
+        # Alias non résolu : on suppose la plus grosse table citée (estimation prudente)
+        rows = table_rows.get(name, max(table_rows.values(), default=0))
+        scans_by_parent.setdefault(parent, []).append((name, rows))
+
+        # Parcours d'un index couvrant : compact, sans lecture des lignes elles-mêmes
+        if max_scan_rows is not None and rows > max_scan_rows and not bounded and "COVERING INDEX" not in detail:
+            raise SQLGuardError(
+                f"Scan complet de '{name}' (~{rows} lignes) au-delà du budget de {max_scan_rows} lignes. "
+                "Ajoute un filtre plus précis ou une limite."
+            )
+
+    for scans in scans_by_parent.values():
+        if len(scans) < 2:
+            continue
+        product = 1
+        for _, rows in scans:
+            product *= max(rows, 1)
+        if product > max_join_rows:
+            names = " × ".join(name for name, _ in scans)
+            raise SQLGuardError(
+                f"Produit cartésien détecté ({names}, ~{product} combinaisons) au-delà du budget de {max_join_rows}."
+            )
+    return plan
+
+def guard_statement(conn, statement, max_rows=SQL_GUARD_MAX_ROWS, exempt_scan_budget=False):
+    """Valide une requête avant exécution : plan de requête + LIMIT automatique sur les SELECT.
+
+    exempt_scan_budget : la requête ne sera pas exécutée par SQLite (agrégat servi par le miroir
+    colonne, voir core.analytics) ; le budget de scan SQLite ne s'applique pas.
+    """
+    statement = statement.strip().rstrip(";").strip()
+    kind = statement_kind(statement)
+    if kind not in READ_KEYWORDS + WRITE_KEYWORDS:
+        raise SQLGuardError(f"Type de requête non autorisé : {kind.upper() or 'vide'}")
+    if kind in READ_KEYWORDS:
+        statement = inject_limit(statement, max_rows)
+    statement = rewrite_prefix_like(statement)
+    check_plan(conn, statement, max_scan_rows=None if exempt_scan_budget else SQL_GUARD_MAX_SCAN_ROWS)
+    return statement
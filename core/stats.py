@@ -0,0 +1,31 @@
+from core.db import quote_identifier
+from core.migrations import STATS_GROUP_TABLES, STATS_UNSPECIFIED
+from core.query_cache import cached_read_sql
+
+def get_totals():
+    """Nombre de contacts et d'entreprises, lus dans stats_totaux (COUNT(*) si la table n'existe pas)"""
+    try:
+        df = cached_read_sql("SELECT nom, total FROM stats_totaux")
+        totals = dict(zip(df["nom"], df["total"]))
+        if "contacts" in totals and "companies" in totals:
+            return int(totals["contacts"]), int(totals["companies"])
+    except Exception:
+        pass
+    contacts = cached_read_sql("SELECT COUNT(*) as count FROM contacts")["count"].iloc[0]
+    companies = cached_read_sql("SELECT COUNT(*) as count FROM companies")["count"].iloc[0]
+    return int(contacts), int(companies)
+
+def get_counts_by(column, limit=None):
+    """Répartition des contacts par secteur, société ou domaine (O(groupes) via les tables de synthèse)"""
+    table = STATS_GROUP_TABLES[column]
+    col = quote_identifier(column)
+    sql = f"SELECT {col}, Nombre_de_contacts FROM {table} ORDER BY Nombre_de_contacts DESC"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    try:
+        return cached_read_sql(sql)
+    except Exception:
+        return cached_read_sql(
+            f"SELECT COALESCE({col}, '{STATS_UNSPECIFIED}') AS {col}, COUNT(*) AS Nombre_de_contacts "
+            f"FROM contacts GROUP BY 1 ORDER BY Nombre_de_contacts DESC" + (f" LIMIT {int(limit)}" if limit else "")
+        )
@@ -0,0 +1,50 @@
+import streamlit as st
+
+from core.doc_manifest import list_document_summaries
+from core.ingestion_jobs import ensure_worker, list_jobs, has_active_jobs, describe_job, retry_job, clear_finished_jobs
+
+# Blocs d'interface communs au chat (app_chat.py) et à la page AI Viz (core/ai_viz.py)
+
+# ==== INDEXATION EN ARRIÈRE-PLAN ====
+def render_ingestion_jobs():
+    """État des indexations de documents en arrière-plan (file d'ingestion)"""
+    jobs = list_jobs()
+    for job in jobs:
+        st.caption(describe_job(job))
+        if job["status"] == "error" and st.button("🔁 Relancer", key=f"retry_job_{job['id']}"):
+            retry_job(job["id"])
+            st.rerun()
+    if any(job["status"] == "done" for job in jobs) and st.button("🧹 Effacer les jobs terminés", key="clear_finished_jobs"):
+        clear_finished_jobs()
+        st.rerun()
+
+def render_ingestion_section():
+    """Suivi des indexations, rafraîchi toutes les 2 s tant qu'un job est actif"""
+    ensure_worker()
+    if not list_jobs(limit=1):
+        return
+    st.markdown("### ⏳ Indexation")
+    refresh_every = 2 if has_active_jobs() else None
+    if hasattr(st, "fragment"):
+        st.fragment(run_every=refresh_every)(render_ingestion_jobs)()
+    else:
+        render_ingestion_jobs()
+
+# ==== FILTRES DOCUMENTAIRES ====
+def render_doc_filters(key_prefix="ai_viz"):
+    """Filtres de la recherche documentaire (sinon déduits de la question : « dans le rapport X », « PDF de 2024 »).
+
+    Retourne {"filenames": [...], "file_types": [...]} avec les seuls filtres choisis.
+    """
+    indexed_documents = list_document_summaries()
+    if not indexed_documents:
+        return {}
+    st.markdown("---")
+    st.markdown("### 🔎 Filtres documentaires")
+    filter_files = st.multiselect("Fichiers", sorted(indexed_documents), key=f"{key_prefix}_filter_files")
+    filter_types = st.multiselect(
+        "Types",
+        sorted({entry["file_type"] for entry in indexed_documents.values() if entry.get("file_type")}),
+        key=f"{key_prefix}_filter_types"
+    )
+    return {key: value for key, value in (("filenames", filter_files), ("file_types", filter_types)) if value}
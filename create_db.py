@@ -1,6 +1,14 @@
+import csv
+import hashlib
 import sqlite3
+import sys
+import time
 import pandas as pd
 import os
+from datetime import datetime
+
+from core.db import quote_identifier
+from core.migrations import apply_migrations, rebuild_stats, rebuild_fulltext_index
 
 # Chemins vers les fichiers CSV
 CONTACTS_CSV = "data/Mémoire BDD Clients - Contact.csv"
@@ -9,6 +17,9 @@ COMPANIES_CSV = "data/Mémoire BDD Clients - Company.csv"
 # Nom de la base SQLite
 DB_PATH = os.getenv("DB_PATH", "bdd_clients.db")
 
+# Nombre de lignes lues puis insérées à la fois en mode incrémental
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+
 def create_database():
     # Chargement des données
     contacts_df = pd.read_csv(CONTACTS_CSV)
@@ -19,8 +30,162 @@ def create_database():
     contacts_df.to_sql("contacts", conn, if_exists="replace", index=False)
     companies_df.to_sql("companies", conn, if_exists="replace", index=False)
 
+    # Les tables viennent d'être recréées (sans index) : on rejoue toutes les migrations
+    conn.execute("PRAGMA user_version = 0")
+    apply_migrations(conn, verbose=True)
+
+    # Un import incrémental juste après n'aura rien à faire
+    with conn:
+        _record_import(conn, CONTACTS_CSV, file_sha256(CONTACTS_CSV), len(contacts_df))
+        _record_import(conn, COMPANIES_CSV, file_sha256(COMPANIES_CSV), len(companies_df))
+
     print("✅ Base de données créée avec succès.")
     conn.close()
 
+def migrate_database(repair=False):
+    """Met à jour une base existante (index...) sans recharger les CSV ; avec repair, recalcule aussi
+    les tables de synthèse et l'index plein texte (après un VACUUM ou en cas de doute sur les compteurs)"""
+    conn = sqlite3.connect(DB_PATH)
+    applied = apply_migrations(conn, verbose=True)
+    if not applied:
+        print("✅ Base déjà à jour.")
+    if repair:
+        rebuild_stats(conn)
+        print("✅ Tables de synthèse recalculées")
+        rebuild_fulltext_index(conn)
+        print("✅ Index plein texte reconstruit")
+    conn.close()
+
+# ==== IMPORT INCRÉMENTAL ====
+def file_sha256(path):
+    """Empreinte SHA-256 d'un fichier, lue par blocs"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_csv_header(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f))
+
+def iter_csv_chunks(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """Lit un CSV par paquets de lignes (cellules vides → NULL, comme pandas)"""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)  # en-tête
+        chunk = []
+        for row in reader:
+            chunk.append([value if value != "" else None for value in row])
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def _ensure_table(conn, table, columns):
+    """Crée la table (colonnes TEXT, comme to_sql) si elle n'existe pas encore"""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(quote_identifier(c) + ' TEXT' for c in columns)})")
+
+def _record_import(conn, path, sha256, rows):
+    conn.execute(
+        "INSERT INTO csv_imports (path, sha256, rows, imported_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(path) DO UPDATE SET sha256 = excluded.sha256, rows = excluded.rows, imported_at = excluded.imported_at",
+        (os.path.abspath(path), sha256, rows, datetime.now().isoformat()),
+    )
+
+def _already_imported(conn, path, sha256):
+    row = conn.execute("SELECT sha256 FROM csv_imports WHERE path = ?", (os.path.abspath(path),)).fetchone()
+    return row is not None and row[0] == sha256
+
+def _contacts_statements(columns):
+    """Upsert par Email ; les lignes sans email ne sont insérées que si elles n'existent pas déjà"""
+    cols = ", ".join(quote_identifier(c) for c in columns)
+    placeholders = ", ".join("?" * len(columns))
+    others = [c for c in columns if c != "Email"]
+    updates = ", ".join(f"{quote_identifier(c)} = excluded.{quote_identifier(c)}" for c in others)
+    current = ", ".join(f"contacts.{quote_identifier(c)}" for c in others)
+    incoming = ", ".join(f"excluded.{quote_identifier(c)}" for c in others)
+    upsert = (
+        f"INSERT INTO contacts ({cols}) VALUES ({placeholders}) "
+        f'ON CONFLICT("Email") WHERE "Email" IS NOT NULL DO UPDATE SET {updates} '
+        f"WHERE ({current}) IS NOT ({incoming})"  # pas d'écriture (ni de trigger) si rien n'a changé
+    )
+    identity = [c for c in ("Nom", "Prénom", "Société") if c in columns]
+    insert_missing = (
+        f"INSERT INTO contacts ({cols}) SELECT {placeholders} WHERE NOT EXISTS ("
+        f'SELECT 1 FROM contacts WHERE "Email" IS NULL AND '
+        + " AND ".join(f"{quote_identifier(c)} IS ?" for c in identity) + ")"
+    )
+    identity_positions = [columns.index(c) for c in identity]
+    return upsert, insert_missing, identity_positions
+
+def _import_contacts(conn, path):
+    columns = read_csv_header(path)
+    email_position = columns.index("Email")
+    upsert, insert_missing, identity_positions = _contacts_statements(columns)
+    rows = 0
+    for chunk in iter_csv_chunks(path):
+        with_email = [row for row in chunk if row[email_position]]
+        without_email = [row + [row[i] for i in identity_positions] for row in chunk if not row[email_position]]
+        conn.executemany(upsert, with_email)
+        conn.executemany(insert_missing, without_email)
+        rows += len(chunk)
+    return rows
+
+def _import_companies(conn, path):
+    column = read_csv_header(path)[0]
+    statement = (
+        f"INSERT INTO companies ({quote_identifier(column)}) SELECT ? "
+        f"WHERE NOT EXISTS (SELECT 1 FROM companies WHERE LOWER({quote_identifier(column)}) = LOWER(?))"
+    )
+    rows = 0
+    for chunk in iter_csv_chunks(path):
+        conn.executemany(statement, [(row[0], row[0]) for row in chunk if row and row[0]])
+        rows += len(chunk)
+    return rows
+
+def import_incremental(force=False):
+    """Import en flux des CSV : upsert par paquets dans une seule transaction pour tous les fichiers,
+    index conservés, fichier ignoré si son empreinte n'a pas changé depuis le dernier import"""
+    conn = sqlite3.connect(DB_PATH)
+    _ensure_table(conn, "contacts", read_csv_header(CONTACTS_CSV))
+    _ensure_table(conn, "companies", read_csv_header(COMPANIES_CSV))
+    conn.commit()
+    apply_migrations(conn, verbose=True)  # l'index unique sur Email est nécessaire à l'upsert
+
+    pending = []
+    for path, importer in [(COMPANIES_CSV, _import_companies), (CONTACTS_CSV, _import_contacts)]:
+        sha256 = file_sha256(path)
+        if not force and _already_imported(conn, path, sha256):
+            print(f"⏭️ {os.path.basename(path)} inchangé, import ignoré")
+            continue
+        pending.append((path, importer, sha256))
+
+    if pending:
+        start = time.perf_counter()
+        with conn:  # une seule transaction pour tous les fichiers : tout ou rien
+            for path, importer, sha256 in pending:
+                rows = importer(conn, path)
+                _record_import(conn, path, sha256, rows)
+                print(f"📥 {os.path.basename(path)} : {rows} lignes traitées")
+        print(f"✅ Import validé en {time.perf_counter() - start:.2f}s")
+    conn.close()
+    refresh_analytics_mirror()
+
+def refresh_analytics_mirror():
+    """Réexporte le miroir Parquet après un import (sinon fait en arrière-plan à la première requête)"""
+    from core.analytics import ANALYTICS_AVAILABLE, ANALYTICS_ENABLED, refresh_mirror
+    if ANALYTICS_AVAILABLE and ANALYTICS_ENABLED:
+        refresh_mirror(verbose=True)
+
 if __name__ == "__main__":
-    create_database()
+    # python create_db.py --migrate [--repair] : migration d'une base existante (--repair : recalcul
+    #   des tables de synthèse et de l'index plein texte)
+    # python create_db.py --incremental [--force] : import en flux sans recréer les tables
+    if len(sys.argv) > 1 and sys.argv[1] == "--migrate":
+        migrate_database(repair="--repair" in sys.argv)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--incremental":
+        import_incremental(force="--force" in sys.argv)
+    else:
+        create_database()
@@ -24,7 +24,8 @@ def main():
         "PyPDF2": "Lecture des fichiers PDF",
         "python-docx": "Lecture des fichiers Word",
         "streamlit": "Interface web",
-        "seaborn": "Visualisations avancées"
+        "seaborn": "Visualisations avancées",
+        "duckdb": "Miroir analytique colonne (agrégats rapides)"
     }
     
     success_count = 0